@@ -0,0 +1,341 @@
+#This is part of the source code for the Pipeline Interface and Management System (PIMS). PIMS was created by Joseph Gardner, Dept. of Genetics, University of Cambridge, UK, and is licensed under the Creative Commons Attribution-ShareAlike 4.0 International (CC BY-SA 4.0) license. See pims_v0.1.py or https://github.com/jg600/PIMS for full licensing information.
+
+#Command line interface to PIMS, for use without a display (e.g. on compute nodes). Like pims_core.py, this does not import Tkinter. Usage:
+#	python pims.py compile CONFIG --purposes PURPOSE1,PURPOSE2,... --name SCRIPT_NAME [--note NOTE] [--sweep] [--fan-out] [--record]
+#	python pims.py batch CONFIG SAMPLE_SHEET --purposes PURPOSE1,PURPOSE2,... [--prefix PREFIX]
+#	python pims.py run SCRIPT [SCRIPT ...] [--jobs N] [--incremental] [--cache] [--schedule [--cores N] [--memory SIZE]]
+#	python pims.py profile [DIR ...] [--by tool|purpose|command] [--sort wall|cpu|rss|io]
+#	python pims.py check CONFIG --purposes PURPOSE1,PURPOSE2,... [--sheet SAMPLE_SHEET] (or --check with compile, batch, cluster or run)
+#	python pims.py history [list] [--tool TOOL] [--param [TOOL.]NAME[=VALUE]] [--since DATE] [--until DATE] [--status done|failed|...] (or history index [DIR ...])
+#	python pims.py catalog import|export [--force] [--remove-catalog]
+#	python pims.py make CONFIG --purposes PURPOSE1,PURPOSE2,... --name MAKEFILE_NAME [--sheet SAMPLE_SHEET] [--run [--jobs N]] [--record]
+#	python pims.py cluster CONFIG --purposes PURPOSE1,PURPOSE2,... --name JOB_NAME --scheduler slurm|sge [--sheet SAMPLE_SHEET] [--step-jobs] [--submit] [--record]
+#CONFIG is either the name of a configuration saved in ~/pipeline/config or a path to a .config file. See pims_core.read_sample_sheet for the sample sheet format.
+
+import argparse
+import os
+import sys
+import time
+import pims_core
+import pims_run
+import pims_cache
+import pims_cluster
+import pims_make
+import pims_check
+import pims_history
+import pims_trace
+
+#Splits a comma separated purpose order, as given on the command line
+def split_purposes(purposes_str):
+	return [p for p in purposes_str.split(',') if p != '']
+
+#Returns the pipelines that compile, batch or cluster would write, as (script_name, note_str, steps), for checking. With --sweep or --fan-out, each combination of values and tools is a pipeline of its own.
+def planned_pipelines(args, config_path, registry):
+	purposes = split_purposes(args.purposes)
+	if getattr(args, 'sheet', None) != None:
+		pipelines = pims_core.batch_pipelines(config_path, purposes, args.sheet, registry, args.prefix, args.note)
+	else:
+		pipelines = [(args.name, args.note, pims_core.config_steps(pims_core.read_config(config_path), purposes, registry))]
+	if args.sweep or args.fan_out:
+		return pims_core.variant_pipelines(pipelines, args.sweep, args.fan_out)
+	return pipelines
+
+#With --check, looks for missing commands and input files before anything is written (see pims_check.py), printing every problem found and stopping if there are any
+def check_first(args, config_path):
+	if not args.check:
+		return None
+	problems = pims_check.check_pipelines(planned_pipelines(args, config_path, pims_core.tool_registry()), args.output_dir, args.stream)
+	for problem in problems:
+		sys.stderr.write('%s\n' % problem)
+	if len(problems) > 0:
+		raise pims_core.pims_error('%d problems found; nothing was written.' % len(problems))
+	return None
+
+#compile, batch, cluster and make only record the scripts they write in the run history with --record, so that they stay cheap to call many times over; runs started by pims.py run are recorded either way
+def recording_history(args):
+	if not args.record:
+		return None
+	return pims_history.default_history()
+
+def do_compile(args):
+	config_path = pims_core.resolve_config_path(args.config)
+	check_first(args, config_path)
+	script_path = pims_core.compile_config(config_path, split_purposes(args.purposes), args.name, args.note, scripts_path=args.output_dir, overwrite=args.force, stream=args.stream, history=recording_history(args), sweep=args.sweep, fan_out=args.fan_out)
+	sys.stdout.write(script_path+'\n')
+	return 0
+
+def do_batch(args):
+	config_path = pims_core.resolve_config_path(args.config)
+	check_first(args, config_path)
+	script_paths = pims_core.compile_batch(config_path, split_purposes(args.purposes), args.sheet, scripts_path=args.output_dir, overwrite=args.force, name_prefix=args.prefix, default_note=args.note, stream=args.stream, history=recording_history(args), sweep=args.sweep, fan_out=args.fan_out)
+	sys.stdout.write('%d scripts written\n' % len(script_paths))
+	return 0
+
+#Prints one line per finished pipeline: name, exit code, start time, run time in seconds, number of steps skipped as up to date, number of steps restored from the output cache, run directory
+def print_run_results(results):
+	for result in results:
+		sys.stdout.write('%s\t%d\t%s\t%.1f\t%d\t%d\t%s\n' % (result['name'], result['exit_code'], time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(result['start'])), result['end']-result['start'], result['skipped_steps'], result['cached_steps'], result['run_dir']))
+		if result['error'] != None:
+			sys.stderr.write('pims: %s: %s\n' % (result['name'], result['error']))
+	return None
+
+def do_run(args):
+	if (args.run_dir != None) and (len(args.scripts) != 1):
+		raise pims_core.pims_error('--run-dir can only be used with a single script.')
+	#The cache is used if asked for, or if PIMS_CACHE is set (to its size limit, e.g. 500G), so that it can be left on permanently
+	cache = None
+	if args.cache or args.cache_size or os.getenv('PIMS_CACHE'):
+		cache = pims_cache.output_cache(max_size=args.cache_size or os.getenv('PIMS_CACHE') or pims_cache.default_max_size)
+	#With a resource pool every pipeline is started at once, and its steps wait for the cores and memory they declare instead, so the machine is shared by step rather than by pipeline
+	resources = None
+	jobs = args.jobs
+	if args.schedule or (args.cores != None) or (args.memory != None):
+		resources = pims_run.resource_pool(args.cores, pims_core.parse_size(args.memory) if args.memory != None else None)
+		if jobs == None:
+			jobs = len(args.scripts)
+	if args.check:
+		problems = pims_check.check_scripts([pims_core.resolve_script_path(script) for script in args.scripts])
+		for problem in problems:
+			sys.stderr.write('%s\n' % problem)
+		if len(problems) > 0:
+			raise pims_core.pims_error('%d problems found; nothing was run.' % len(problems))
+	registry = pims_core.tool_registry()
+	history = pims_history.default_history()
+	runs = [pims_run.pipeline_run(pims_core.resolve_script_path(script), args.work_dir, args.incremental or (args.run_dir != None), args.run_dir, args.hash_inputs, cache, resources, registry, history) for script in args.scripts]
+	results = pims_run.run_pipelines(runs, jobs, args.keep_script)
+	print_run_results(results)
+	if len([result for result in results if result['exit_code'] != 0]) > 0:
+		return 1
+	return 0
+
+def do_check(args):
+	config_path = pims_core.resolve_config_path(args.config)
+	pipelines = planned_pipelines(args, config_path, pims_core.tool_registry())
+	problems = pims_check.check_pipelines(pipelines, args.output_dir, args.stream)
+	for problem in problems:
+		sys.stdout.write('%s\n' % problem)
+	if len(problems) > 0:
+		return 1
+	sys.stdout.write('%d pipelines checked, no problems found\n' % len(pipelines))
+	return 0
+
+def do_profile(args):
+	dir_list = args.dirs if len(args.dirs) > 0 else [pims_core.get_pipeline_path()+'/scripts']
+	totals_list = pims_run.summarise_profiles(pims_run.read_profiles(dir_list), pims_core.tool_registry(), args.by, args.sort)
+	sys.stdout.write('%s\tsteps\tfailed\twall_s\tcpu_s\tmax_rss_mb\tio_mb\n' % args.by)
+	for totals in totals_list:
+		sys.stdout.write('%s\t%d\t%d\t%.1f\t%.1f\t%.1f\t%.1f\n' % (totals['group'], totals['steps'], totals['failed'], totals['wall'], totals['cpu'], totals['max_rss_kb']/1024.0, totals['io_bytes']/1048576.0))
+	return 0
+
+#Turns a date given on the command line (YYYY-MM-DD, YYYY-MM-DD HH:MM, or a number of days ago, e.g. 7d) into a time
+def parse_date(date_str):
+	if date_str == None:
+		return None
+	if date_str.endswith('d') and date_str[:-1].isdigit():
+		return time.time()-86400*int(date_str[:-1])
+	for date_format in ['%Y-%m-%d', '%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S']:
+		try:
+			return time.mktime(time.strptime(date_str, date_format))
+		except ValueError:
+			pass
+	raise pims_core.pims_error('%s is not a date. Use YYYY-MM-DD, "YYYY-MM-DD HH:MM" or a number of days ago, e.g. 7d.' % date_str)
+
+#Splits a --param condition, [TOOL.]NAME[=VALUE], into (tool, name, value), with None for the parts not given
+def parse_param(param_str):
+	name, value = param_str.split('=', 1) if '=' in param_str else (param_str, None)
+	tool = None
+	if ('.' in name) and pims_core.name_pattern.match(name.split('.', 1)[0]):
+		tool, name = name.split('.', 1)
+	return (tool, pims_core.short_option_name(name), value)
+
+#Prints one line per run, newest first: time (when it started, or when its script was written), status, exit code, script name, tools, run directory
+def do_history(args):
+	history = pims_history.default_history()
+	if history == None:
+		raise pims_core.pims_error('There is no run history: it is switched off (PIMS_HISTORY=off), or there is no ~/pipeline directory.')
+	if args.action == 'index':
+		run_count = history.index_run_dirs(args.dirs if len(args.dirs) > 0 else None)
+		sys.stdout.write('%d runs added to %s\n' % (run_count, history.db_path))
+		return 0
+	if len(args.dirs) > 0:
+		raise pims_core.pims_error('Directories are only given to history index.')
+	runs = history.find_runs(args.tool, [parse_param(param) for param in args.param], parse_date(args.since), parse_date(args.until), args.script, args.status, args.limit)
+	for run in runs:
+		run_time = run['started'] if run['started'] != None else run['created']
+		sys.stdout.write('%s\t%s\t%s\t%s\t%s\t%s\n' % (time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(run_time)), run['status'], '' if run['exit_code'] == None else run['exit_code'], run['script_name'], ','.join(run['tools']), run['run_dir']))
+	return 0
+
+def do_catalog(args):
+	if args.action == 'import':
+		tool_count = pims_core.import_tool_files(args.tools_dir, overwrite=args.force)
+		sys.stdout.write('%d tools imported into the catalog\n' % tool_count)
+	else:
+		tool_count = pims_core.export_catalog(args.tools_dir, remove_catalog=args.remove_catalog)
+		sys.stdout.write('%d tools exported to .tool files\n' % tool_count)
+	return 0
+
+def do_cluster(args):
+	config_path = pims_core.resolve_config_path(args.config)
+	check_first(args, config_path)
+	job_paths = pims_cluster.compile_cluster(config_path, split_purposes(args.purposes), args.scheduler, args.name, args.sheet, args.note, scripts_path=args.output_dir, overwrite=args.force, stream=args.stream, step_jobs=args.step_jobs, max_running=args.max_running, extra_options=args.scheduler_option, name_prefix=args.prefix, history=recording_history(args), sweep=args.sweep, fan_out=args.fan_out)
+	if not args.submit:
+		for job_path in job_paths:
+			sys.stdout.write(job_path+'\n')
+		return 0
+	for job_path, job_id in zip(job_paths, pims_cluster.submit_jobs(job_paths, args.scheduler, chain=args.step_jobs)):
+		sys.stdout.write('%s\t%s\n' % (job_id, job_path))
+	return 0
+
+def do_make(args):
+	config_path = pims_core.resolve_config_path(args.config)
+	check_first(args, config_path)
+	make_path = pims_make.compile_make(config_path, split_purposes(args.purposes), args.name, args.sheet, args.note, scripts_path=args.output_dir, overwrite=args.force, stream=args.stream, name_prefix=args.prefix, history=recording_history(args))
+	if not args.run:
+		sys.stdout.write(make_path+'\n')
+		return 0
+	return pims_make.run_make(make_path, args.jobs)
+
+def make_parser():
+	parser = argparse.ArgumentParser(prog='pims', description='Pipeline Interface and Management System (PIMS), command line interface')
+	parser.add_argument('--trace', default=None, help='Record where the time goes and write it to this file, in Chrome trace format (or set PIMS_TRACE)')
+	subparsers = parser.add_subparsers(dest='command')
+
+	compile_parser = subparsers.add_parser('compile', help='Turn a saved configuration into a pipeline script')
+	compile_parser.add_argument('config', help='Configuration name (in ~/pipeline/config) or path to a .config file')
+	compile_parser.add_argument('-p', '--purposes', required=True, help='Comma separated purposes, in running order')
+	compile_parser.add_argument('-n', '--name', required=True, help='Name of the script to write')
+	compile_parser.add_argument('--note', default='', help='Note written to the NOTE file of each run')
+	compile_parser.add_argument('-o', '--output-dir', default=None, help='Directory to write the script to (default ~/pipeline/scripts)')
+	compile_parser.add_argument('-f', '--force', action='store_true', help='Overwrite an existing script with the same name')
+	compile_parser.add_argument('-s', '--stream', action='store_true', help='Join consecutive tools that declare STDIN/STDOUT with pipes instead of intermediate files')
+	compile_parser.add_argument('--sweep', action='store_true', help='Run every combination of the lists ({5,10,20}) and ranges ({10..30..5}) in option and argument values, running steps shared by several combinations once')
+	compile_parser.add_argument('--fan-out', action='store_true', help='Run every active tool of a purpose that has several as a branch of its own, each in its own subdirectory with its own copy of the later steps, running earlier steps once')
+	compile_parser.add_argument('--check', action='store_true', help='Check that every command and declared input file can be found first, and write nothing if not')
+	compile_parser.add_argument('--record', action='store_true', help='Record the script in the run history (runs are recorded when they start either way)')
+	compile_parser.set_defaults(func=do_compile)
+
+	batch_parser = subparsers.add_parser('batch', help='Write one script per row of a sample sheet, using a saved configuration as the template')
+	batch_parser.add_argument('config', help='Template configuration name (in ~/pipeline/config) or path to a .config file')
+	batch_parser.add_argument('sheet', help='Sample sheet (CSV, or tab separated for .tsv/.tab/.txt)')
+	batch_parser.add_argument('-p', '--purposes', required=True, help='Comma separated purposes, in running order')
+	batch_parser.add_argument('--prefix', default='', help='Prefix added to each script name')
+	batch_parser.add_argument('--note', default='', help='Note for rows without a "note" column')
+	batch_parser.add_argument('-o', '--output-dir', default=None, help='Directory to write the scripts to (default ~/pipeline/scripts)')
+	batch_parser.add_argument('-f', '--force', action='store_true', help='Overwrite existing scripts with the same names')
+	batch_parser.add_argument('-s', '--stream', action='store_true', help='Join consecutive tools that declare STDIN/STDOUT with pipes instead of intermediate files')
+	batch_parser.add_argument('--sweep', action='store_true', help='Run every combination of the lists ({5,10,20}) and ranges ({10..30..5}) in option and argument values, running steps shared by several combinations once')
+	batch_parser.add_argument('--fan-out', action='store_true', help='Run every active tool of a purpose that has several as a branch of its own, each in its own subdirectory with its own copy of the later steps, running earlier steps once')
+	batch_parser.add_argument('--check', action='store_true', help='Check that every command and declared input file can be found first, and write nothing if not')
+	batch_parser.add_argument('--record', action='store_true', help='Record the scripts in the run history (runs are recorded when they start either way)')
+	batch_parser.set_defaults(func=do_batch)
+
+	run_parser = subparsers.add_parser('run', help='Run generated scripts, several at a time')
+	run_parser.add_argument('scripts', nargs='+', help='Script names (in ~/pipeline/scripts) or paths to .script files')
+	run_parser.add_argument('-j', '--jobs', type=int, default=None, help='Number of pipelines to run at once (default: number of cores)')
+	run_parser.add_argument('-w', '--work-dir', default=None, help='Directory to create the run directories in (default: the directory holding each script)')
+	run_parser.add_argument('-k', '--keep-script', action='store_true', help='Do not delete scripts that ran successfully')
+	run_parser.add_argument('-i', '--incremental', action='store_true', help='Re-run in the existing run directory, skipping steps whose command and inputs have not changed')
+	run_parser.add_argument('--run-dir', default=None, help='Existing run directory to re-run incrementally (single script only)')
+	run_parser.add_argument('--hash-inputs', action='store_true', help='Compare input files by content hash rather than size and modification time')
+	run_parser.add_argument('-c', '--cache', action='store_true', help='Reuse outputs of identical steps from earlier runs (kept in ~/pipeline/outputs/cache)')
+	run_parser.add_argument('--cache-size', default=None, help='Size limit of the output cache, e.g. 500G (default %s); implies --cache' % pims_cache.default_max_size)
+	run_parser.add_argument('--schedule', action='store_true', help='Start steps as the cores and memory their tools declare (THREADS and MEMORY in the .tool files) become free, rather than running a fixed number of pipelines at once')
+	run_parser.add_argument('--cores', type=int, default=None, help='Cores to share out between steps (default: all); implies --schedule')
+	run_parser.add_argument('--memory', default=None, help='Memory to share out between steps, e.g. 64G (default: all); implies --schedule')
+	run_parser.add_argument('--check', action='store_true', help='Check that every command in the scripts can be found first, and run nothing if not')
+	run_parser.set_defaults(func=do_run)
+
+	profile_parser = subparsers.add_parser('profile', help='Rank steps by the resources they used, across runs')
+	profile_parser.add_argument('dirs', nargs='*', help='Run directories, or directories holding them (default ~/pipeline/scripts)')
+	profile_parser.add_argument('--by', choices=['tool', 'purpose', 'command'], default='tool', help='What to total the steps by')
+	profile_parser.add_argument('--sort', choices=['wall', 'cpu', 'rss', 'io'], default='wall', help='Cost to rank by')
+	profile_parser.set_defaults(func=do_profile)
+
+	cluster_parser = subparsers.add_parser('cluster', help='Turn a configuration, or a batch of them, into a SLURM or SGE array job with one task per pipeline')
+	cluster_parser.add_argument('config', help='Configuration name (in ~/pipeline/config) or path to a .config file')
+	cluster_parser.add_argument('-p', '--purposes', required=True, help='Comma separated purposes, in running order')
+	cluster_parser.add_argument('-n', '--name', required=True, help='Name of the job (and of the script, without --sheet)')
+	cluster_parser.add_argument('--scheduler', choices=sorted(pims_cluster.schedulers.keys()), default='slurm', help='Scheduler to write the job for')
+	cluster_parser.add_argument('--sheet', default=None, help='Sample sheet: one task per row, as for batch')
+	cluster_parser.add_argument('--prefix', default='', help='Prefix added to each script name from the sample sheet')
+	cluster_parser.add_argument('--note', default='', help='Note written to the NOTE file of each run')
+	cluster_parser.add_argument('--step-jobs', action='store_true', help='One array job per step, each task waiting for the same task of the step before')
+	cluster_parser.add_argument('--max-running', type=int, default=None, help='Most tasks of each job to run at once')
+	cluster_parser.add_argument('-O', '--scheduler-option', action='append', default=[], help="Extra header option, given as -O=OPTION since it starts with a hyphen, e.g. -O=--partition=long or -O='-l h_vmem=8G' (repeatable)")
+	cluster_parser.add_argument('--submit', action='store_true', help='Submit the jobs with sbatch/qsub and print their ids')
+	cluster_parser.add_argument('-o', '--output-dir', default=None, help='Directory to write the scripts and jobs to, and to run in (default ~/pipeline/scripts)')
+	cluster_parser.add_argument('-f', '--force', action='store_true', help='Overwrite existing scripts and jobs with the same names')
+	cluster_parser.add_argument('-s', '--stream', action='store_true', help='Join consecutive tools that declare STDIN/STDOUT with pipes instead of intermediate files')
+	cluster_parser.add_argument('--sweep', action='store_true', help='Run every combination of the lists ({5,10,20}) and ranges ({10..30..5}) in option and argument values, running steps shared by several combinations once')
+	cluster_parser.add_argument('--fan-out', action='store_true', help='Run every active tool of a purpose that has several as a branch of its own, each in its own subdirectory with its own copy of the later steps, running earlier steps once')
+	cluster_parser.add_argument('--check', action='store_true', help='Check that every command and declared input file can be found first, and write nothing if not')
+	cluster_parser.add_argument('--record', action='store_true', help='Record the scripts in the run history')
+	cluster_parser.set_defaults(func=do_cluster)
+
+	make_cmd_parser = subparsers.add_parser('make', help='Turn a configuration, or a batch of them, into a Makefile with one rule per step, for make -j and rebuilding only what changed')
+	make_cmd_parser.add_argument('config', help='Configuration name (in ~/pipeline/config) or path to a .config file')
+	make_cmd_parser.add_argument('-p', '--purposes', required=True, help='Comma separated purposes, in running order')
+	make_cmd_parser.add_argument('-n', '--name', required=True, help='Name of the Makefile, written as NAME.mk (and of the script, without --sheet)')
+	make_cmd_parser.add_argument('--sheet', default=None, help='Sample sheet: one pipeline per row, as for batch')
+	make_cmd_parser.add_argument('--prefix', default='', help='Prefix added to each script name from the sample sheet')
+	make_cmd_parser.add_argument('--note', default='', help='Note written to the NOTE file of each run')
+	make_cmd_parser.add_argument('-o', '--output-dir', default=None, help='Directory to write the scripts and Makefile to, and to run in (default ~/pipeline/scripts)')
+	make_cmd_parser.add_argument('-f', '--force', action='store_true', help='Overwrite existing scripts and Makefile with the same names')
+	make_cmd_parser.add_argument('-s', '--stream', action='store_true', help='Join consecutive tools that declare STDIN/STDOUT with pipes instead of intermediate files')
+	make_cmd_parser.add_argument('--check', action='store_true', help='Check that every command and declared input file can be found first, and write nothing if not')
+	make_cmd_parser.add_argument('--run', action='store_true', help='Run the Makefile with make once it is written')
+	make_cmd_parser.add_argument('-j', '--jobs', type=int, default=None, help='With --run, number of steps to run at once (make -j)')
+	make_cmd_parser.add_argument('--record', action='store_true', help='Record the scripts in the run history')
+	make_cmd_parser.set_defaults(func=do_make, sweep=False, fan_out=False)
+
+	check_parser = subparsers.add_parser('check', help='Check that the commands and declared input files of a configuration, or a batch of them, can be found, reporting every problem')
+	check_parser.add_argument('config', help='Configuration name (in ~/pipeline/config) or path to a .config file')
+	check_parser.add_argument('-p', '--purposes', required=True, help='Comma separated purposes, in running order')
+	check_parser.add_argument('-n', '--name', default='pipeline', help='Script name used in the report, without --sheet')
+	check_parser.add_argument('--sheet', default=None, help='Sample sheet: check one pipeline per row, as for batch')
+	check_parser.add_argument('--prefix', default='', help='Prefix added to each script name from the sample sheet')
+	check_parser.add_argument('--note', default='', help=argparse.SUPPRESS)
+	check_parser.add_argument('-o', '--output-dir', default=None, help='Directory the scripts would be written to and run in, which relative input paths are taken from (default ~/pipeline/scripts)')
+	check_parser.add_argument('-s', '--stream', action='store_true', help='Check as for a streamed script, where files replaced by pipes are not needed')
+	check_parser.add_argument('--sweep', action='store_true', help='Check every combination of the values swept, as for compile --sweep')
+	check_parser.add_argument('--fan-out', action='store_true', help='Check every combination of the tools of purposes with several, as for compile --fan-out')
+	check_parser.set_defaults(func=do_check)
+
+	history_parser = subparsers.add_parser('history', help='List past scripts and runs from the run history, or add run directories made without it')
+	history_parser.add_argument('action', nargs='?', choices=['list', 'index'], default='list', help='list: show the runs matching every condition given, newest first; index: add the run directories in DIRS (default ~/pipeline/scripts) that are not in the history yet')
+	history_parser.add_argument('dirs', nargs='*', help='Directories holding run directories, for index')
+	history_parser.add_argument('-t', '--tool', default=None, help='Only runs that used this tool')
+	history_parser.add_argument('-P', '--param', action='append', default=[], help='Only runs where a flag, option or argument was set, as [TOOL.]NAME[=VALUE], e.g. -P bwa.-t=8, or -P=-t=8 when it starts with a hyphen (repeatable)')
+	history_parser.add_argument('--since', default=None, help='Only runs from this date on (YYYY-MM-DD, or e.g. 30d for the last 30 days)')
+	history_parser.add_argument('--until', default=None, help='Only runs before this date')
+	history_parser.add_argument('--script', default=None, help='Only runs of scripts with this name')
+	history_parser.add_argument('--status', choices=['generated', 'running', 'done', 'failed', 'cancelled', 'unknown'], default=None, help='Only runs in this state (generated: written but not run by PIMS; unknown: indexed without a profile)')
+	history_parser.add_argument('-n', '--limit', type=int, default=100, help='Most runs to list (default 100)')
+	history_parser.set_defaults(func=do_history)
+
+	catalog_parser = subparsers.add_parser('catalog', help='Move the tools between .tool files and a single catalog file')
+	catalog_parser.add_argument('action', choices=['import', 'export'], help='import: build the catalog from the .tool files (it is used from then on); export: write the catalog out as .tool files')
+	catalog_parser.add_argument('--tools-dir', default=None, help='Tools directory (default ~/pipeline/tools)')
+	catalog_parser.add_argument('-f', '--force', action='store_true', help='Replace an existing catalog when importing')
+	catalog_parser.add_argument('--remove-catalog', action='store_true', help='Delete the catalog after exporting, so the .tool files are used again')
+	catalog_parser.set_defaults(func=do_catalog)
+	return parser
+
+def main(argv=None):
+	parser = make_parser()
+	args = parser.parse_args(argv)
+	if getattr(args, 'func', None) == None:
+		parser.print_help()
+		return 2
+	if args.trace != None:
+		pims_trace.start(args.trace)
+	else:
+		pims_trace.start_from_env()
+	try:
+		return args.func(args)
+	except pims_core.pims_error as e:
+		sys.stderr.write('pims: %s\n' % e)
+		return 1
+
+if __name__ == '__main__':
+	sys.exit(main())
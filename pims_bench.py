@@ -0,0 +1,230 @@
+#This is part of the source code for the Pipeline Interface and Management System (PIMS). PIMS was created by Joseph Gardner, Dept. of Genetics, University of Cambridge, UK, and is licensed under the Creative Commons Attribution-ShareAlike 4.0 International (CC BY-SA 4.0) license. See pims_v0.1.py or https://github.com/jg600/PIMS for full licensing information.
+
+#Benchmarks for PIMS at different catalog sizes, so that changes in speed can be tracked between versions. For each size a synthetic ~/pipeline (tools spread over purposes, each with flags, options and arguments, plus saved configurations) is made in a temporary HOME, and the main operations are timed in a fresh Python process using that HOME: loading the tools (make_purposes_list), building the pipeline window (runpipeline_window), applying and saving a configuration (load_config/save_config, through apply_config and write_config), writing the script (write_script, through generate_script), and the same work done headless through pims_core. The GUI needs a display; if there is none, Xvfb is started if it can be found, and otherwise only the headless operations are timed. Results are written as JSON. Usage:
+#	python pims_bench.py [--sizes 10:5,100:20,1000:50,10000:200] [--repeat 3] [--output results.json]
+#Each size is TOOLS:PURPOSES. The GUI is written for Python 2, so use --python to give a Python 2 interpreter with Tkinter if this is run with another.
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess as sub
+import sys
+import tempfile
+import time
+import pims_core
+import pims_watch
+
+default_sizes = '10:5,100:20,1000:50,10000:200'
+
+#Makes a synthetic ~/pipeline under home: tool_count tools spread evenly over purpose_count purposes, each with the given numbers of flags, options and arguments, and config_count saved configurations covering every tool. Tools are named so that sorting by name keeps each purpose's tools together, as a real catalog roughly would. Returns the list of purposes, in order.
+def make_tree(home, tool_count, purpose_count, flag_count=5, option_count=5, argument_count=5, config_count=10):
+	pipeline_path = os.path.join(home, 'pipeline')
+	pims_core.make_pipeline_dirs(pipeline_path)
+	purposes = ['purpose%03d' % p for p in range(purpose_count)]
+	tools = []
+	for t in range(tool_count):
+		purpose = purposes[t*purpose_count//tool_count]
+		tool_name = '%s_tool%05d' % (purpose, t)
+		tool_dict = {'NAME':tool_name, 'PURPOSE':purpose, 'COMMAND':'tool%05d run' % t}
+		tool_dict['FLAGS'] = ','.join(['-f%d' % f if f%2 == 0 else '--flag-%d' % f for f in range(flag_count)])
+		tool_dict['OPTIONS'] = ','.join(['-o%d <>' % o if o%2 == 0 else '--opt-%d=<>' % o for o in range(option_count)])
+		tool_dict['ARGUMENTS'] = ','.join(['arg%d' % a for a in range(argument_count)])
+		tool_file = open(os.path.join(pipeline_path, 'tools', '%s.tool' % tool_name), 'w')
+		tool_file.write(pims_core.format_tool_file(tool_dict))
+		tool_file.close()
+		tools.append((tool_name, tool_dict))
+	#Configurations switch one tool per purpose on (a different one in each), and give values to half of the flags, options and arguments of every tool
+	for c in range(config_count):
+		config_file = open(os.path.join(pipeline_path, 'config', 'config%03d.config' % c), 'w')
+		seen_purposes = dict()
+		for tool_name, tool_dict in tools:
+			rank = seen_purposes.get(tool_dict['PURPOSE'], 0)
+			seen_purposes[tool_dict['PURPOSE']] = rank+1
+			values = {'FLAGS':dict(), 'OPTIONS':dict(), 'ARGUMENTS':dict()}
+			for field in ['FLAGS', 'OPTIONS', 'ARGUMENTS']:
+				for i, name in enumerate([n for n in tool_dict[field].split(',') if n != '']):
+					if (i+c)%2 == 0:
+						values[field][name] = '1' if field == 'FLAGS' else 'value%d_%d' % (c, i)
+			state = 'active' if rank == c%max(1, tool_count//purpose_count) else 'inactive'
+			config_file.write(pims_core.format_config_line(tool_name, state, tool_dict, values))
+		config_file.close()
+	return purposes
+
+#Returns the path of program if it is on the PATH, otherwise None
+def find_executable(program):
+	for path_dir in os.getenv('PATH', '').split(os.pathsep):
+		candidate = os.path.join(path_dir, program)
+		if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+			return candidate
+	return None
+
+#Starts Xvfb on a free display number. Returns (process, display), or (None, None) if Xvfb is not installed or does not start.
+def start_xvfb():
+	xvfb_path = find_executable('Xvfb')
+	if xvfb_path == None:
+		return None, None
+	display_num = 99
+	while os.path.exists('/tmp/.X11-unix/X%d' % display_num) or os.path.exists('/tmp/.X%d-lock' % display_num):
+		display_num += 1
+	devnull = open(os.devnull, 'w')
+	proc = sub.Popen([xvfb_path, ':%d' % display_num, '-nolisten', 'tcp', '-screen', '0', '1920x1080x24'], stdout=devnull, stderr=devnull)
+	devnull.close()
+	#Wait for the server to be ready to take connections
+	for i in range(100):
+		if os.path.exists('/tmp/.X11-unix/X%d' % display_num):
+			return proc, ':%d' % display_num
+		if proc.poll() != None:
+			return None, None
+		time.sleep(0.05)
+	proc.terminate()
+	return None, None
+
+#Returns the fastest, median and every time of a list of runs
+def summarise_times(times):
+	ordered = sorted(times)
+	return {'min':ordered[0], 'median':ordered[len(ordered)//2], 'runs':times}
+
+#Times func() repeat times. setup() is called (untimed) before each run, and its return value is passed to func.
+def time_runs(func, repeat, setup=None):
+	times = []
+	for i in range(repeat):
+		arg = setup() if setup != None else None
+		start = time.time()
+		func(arg)
+		times.append(time.time()-start)
+	return summarise_times(times)
+
+#Runs in the child process, with HOME set to the synthetic tree: times the headless operations and, with gui set, the GUI ones. Returns a dictionary of timings.
+def measure(purposes, repeat, gui):
+	pipeline_path = pims_core.get_pipeline_path()
+	tools_path = pipeline_path+'/tools/'
+	config_path = pipeline_path+'/config/config000.config'
+	out_path = tempfile.mkdtemp(prefix='pims_bench_scripts_')
+	timings = dict()
+	counter = [0]
+	def next_name():
+		counter[0] += 1
+		return 'bench%d' % counter[0]
+	timings['registry_cold_load'] = time_runs(lambda registry: registry.refresh(), repeat, lambda: pims_core.tool_registry(tools_path))
+	warm_registry = pims_core.tool_registry(tools_path)
+	warm_registry.refresh()
+	timings['registry_refresh_unchanged'] = time_runs(lambda arg: warm_registry.refresh(), repeat)
+	#What the GUI does instead of refreshing, once a second: ask the directory watchers what has changed
+	watcher = pims_watch.pipeline_watcher(pipeline_path)
+	timings['watch_poll_unchanged'] = time_runs(lambda arg: watcher.poll(), repeat)
+	watcher.close()
+	timings['compile_config'] = time_runs(lambda arg: pims_core.compile_config(config_path, purposes, next_name(), 'bench', scripts_path=out_path, registry=warm_registry), repeat)
+	if gui:
+		#The GUI module creates its Tk root and the pipeline directories when it is loaded, but only opens its first window when run as a program
+		gui_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pims_v0.1.py')
+		if sys.version_info[0] < 3:
+			import imp
+			pims_gui = imp.load_source('pims_gui', gui_path)
+		else:
+			import importlib.machinery
+			pims_gui = importlib.machinery.SourceFileLoader('pims_gui', gui_path).load_module()
+		def cold_index():
+			pims_gui.tool_index = pims_core.tool_registry(tools_path)
+		timings['make_purposes_list'] = time_runs(lambda arg: pims_gui.make_purposes_list(), repeat, cold_index)
+		windows = []
+		def build_window(arg):
+			windows.append(pims_gui.runpipeline_window(purposes))
+			pims_gui.root.update_idletasks()
+		def close_windows():
+			while len(windows) > 0:
+				windows.pop().top.destroy()
+			pims_gui.root.update_idletasks()
+		timings['runpipeline_window'] = time_runs(build_window, repeat, close_windows)
+		close_windows()
+		def new_window():
+			close_windows()
+			this_window = pims_gui.runpipeline_window(purposes)
+			windows.append(this_window)
+			pims_gui.root.update_idletasks()
+			return this_window
+		def load_config(this_window):
+			this_window.apply_config(config_path)
+			pims_gui.root.update_idletasks()
+		timings['load_config'] = time_runs(load_config, repeat, new_window)
+		timings['save_config'] = time_runs(lambda this_window: this_window.write_config(os.path.join(out_path, '%s.config' % next_name())), repeat, lambda: windows[-1])
+		timings['write_script'] = time_runs(lambda this_window: this_window.generate_script(next_name(), 'bench'), repeat, lambda: windows[-1])
+		close_windows()
+	shutil.rmtree(out_path, ignore_errors=True)
+	return timings
+
+#Makes the tree for one size and measures it in a child process. Returns the result for that size.
+def bench_size(tool_count, purpose_count, args, display):
+	home = tempfile.mkdtemp(prefix='pims_bench_')
+	try:
+		purposes = make_tree(home, tool_count, purpose_count, args.flags, args.options, args.arguments, args.configs)
+		env = dict(os.environ)
+		env['HOME'] = home
+		if display != None:
+			env['DISPLAY'] = display
+		child_args = [args.python or sys.executable, os.path.abspath(__file__), '--child', ','.join(purposes), '--repeat', str(args.repeat)]
+		if display == None:
+			child_args.append('--no-gui')
+		proc = sub.Popen(child_args, env=env, stdout=sub.PIPE, stderr=sub.PIPE, cwd=home)
+		out, err = proc.communicate()
+	finally:
+		shutil.rmtree(home, ignore_errors=True)
+	result = {'tools':tool_count, 'purposes':purpose_count, 'flags':args.flags, 'options':args.options, 'arguments':args.arguments, 'configs':args.configs}
+	if proc.returncode != 0:
+		result['error'] = err.decode('utf-8', 'replace').strip().split('\n')[-1]
+		return result
+	#The GUI prints a banner when it is loaded, so the timings are on the last line
+	result['timings'] = json.loads(out.decode('utf-8').strip().split('\n')[-1])
+	return result
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog='pims_bench', description='Time PIMS operations on synthetic tool catalogs of different sizes')
+	parser.add_argument('--sizes', default=default_sizes, help='Comma separated TOOLS:PURPOSES pairs (default %s)' % default_sizes)
+	parser.add_argument('--flags', type=int, default=5, help='Flags per tool')
+	parser.add_argument('--options', type=int, default=5, help='Options per tool')
+	parser.add_argument('--arguments', type=int, default=5, help='Arguments per tool')
+	parser.add_argument('--configs', type=int, default=10, help='Saved configurations per catalog')
+	parser.add_argument('--repeat', type=int, default=3, help='Times to run each operation')
+	parser.add_argument('--no-gui', action='store_true', help='Only time the headless operations')
+	parser.add_argument('--python', default=None, help='Python to run the measurements with (needs Tkinter for the GUI timings)')
+	parser.add_argument('-o', '--output', default=None, help='File to write the JSON results to (default: standard output)')
+	parser.add_argument('--child', default=None, help=argparse.SUPPRESS)
+	args = parser.parse_args(argv)
+	if args.child != None:
+		sys.stdout.write('\n'+json.dumps(measure(args.child.split(','), args.repeat, not args.no_gui))+'\n')
+		return 0
+	sizes = []
+	for size_str in args.sizes.split(','):
+		tool_count, purpose_count = size_str.split(':')
+		sizes.append((int(tool_count), int(purpose_count)))
+	report = {'created':time.strftime('%Y-%m-%d %H:%M:%S'), 'platform':platform.platform(), 'python':args.python or sys.executable, 'repeat':args.repeat, 'gui':False, 'results':[]}
+	xvfb_proc = None
+	display = None
+	if not args.no_gui:
+		display = os.getenv('DISPLAY')
+		if display == None:
+			xvfb_proc, display = start_xvfb()
+		if display == None:
+			report['gui_skipped'] = 'No display, and Xvfb could not be started'
+			sys.stderr.write('pims_bench: no display and no Xvfb, so only the headless operations are timed\n')
+	report['gui'] = display != None
+	try:
+		for tool_count, purpose_count in sizes:
+			sys.stderr.write('pims_bench: %d tools, %d purposes\n' % (tool_count, purpose_count))
+			report['results'].append(bench_size(tool_count, purpose_count, args, display))
+	finally:
+		if xvfb_proc != None:
+			xvfb_proc.terminate()
+			xvfb_proc.wait()
+	report_str = json.dumps(report, indent=1, sort_keys=True)+'\n'
+	if args.output == None:
+		sys.stdout.write(report_str)
+	else:
+		output_file = open(args.output, 'w')
+		output_file.write(report_str)
+		output_file.close()
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
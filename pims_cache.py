@@ -0,0 +1,180 @@
+#This is part of the source code for the Pipeline Interface and Management System (PIMS). PIMS was created by Joseph Gardner, Dept. of Genetics, University of Cambridge, UK, and is licensed under the Creative Commons Attribution-ShareAlike 4.0 International (CC BY-SA 4.0) license. See pims_v0.1.py or https://github.com/jg600/PIMS for full licensing information.
+
+#A content-addressed store of step outputs, kept in ~/pipeline/outputs/cache and shared by all runs. Each entry is keyed by a hash of the step's resolved command line (the tool's COMMAND with its flags, options and arguments filled in) and the contents of the input files it names, and holds the files the step created in its run directory. When a later run reaches a step with the same key, the outputs are linked into its run directory instead of running the tool again. The store has a size limit, and the entries used least recently are removed when it is exceeded. Like pims_core.py, this does not import Tkinter.
+
+import hashlib
+import json
+import os
+import shutil
+import stat
+import subprocess as sub
+import tempfile
+import threading
+import time
+import pims_core
+import pims_run
+
+#Default size limit of the store
+default_max_size = '100G'
+#Most input file hashes kept in memory (see output_cache.content_hash), so that a long-running process does not keep one for every file it has ever seen
+max_hashes = 100000
+
+class output_cache:
+	def __init__(self, cache_path=None, max_size=default_max_size, reflink=True):
+		if cache_path == None:
+			cache_path = pims_core.get_pipeline_path()+'/outputs/cache'
+		self.cache_path = cache_path
+		self.max_bytes = pims_core.parse_size(max_size)
+		#Whether to try a copy-on-write copy (cp --reflink) before falling back to a hard link and then a plain copy
+		self.reflink = reflink
+		#Content hashes of input files, keyed by (path, size, mtime), so that a file used by several steps or pipelines is only read once
+		self.hash_memo = dict()
+		#The size of the store when it was last listed, plus what has been stored since, so that the store is only listed again when that goes over the limit (other processes sharing the store are only seen then)
+		self.known_size = 0
+		#One cache is shared by every pipeline of pims_run.run_pipelines, each storing from its own threads, so known_size, hash_memo and eviction are guarded
+		self.lock = threading.Lock()
+		if not os.path.isdir(self.cache_path):
+			os.makedirs(self.cache_path)
+		#Apply the size limit straight away, in case it has been lowered since the store was last used
+		self.evict()
+
+	def content_hash(self, path):
+		path_stat = os.stat(path)
+		memo_key = (os.path.abspath(path), path_stat.st_size, path_stat.st_mtime)
+		with self.lock:
+			file_hash = self.hash_memo.get(memo_key)
+		if file_hash == None:
+			file_hash = pims_run.file_stamp(path, True)
+			with self.lock:
+				if len(self.hash_memo) >= max_hashes:
+					self.hash_memo.clear()
+				self.hash_memo[memo_key] = file_hash
+		return file_hash
+
+	#The key of a step: a hash of the command line and of the name and contents of every input file it refers to. Files in exclude (the step's own outputs from an earlier run) are not counted as inputs.
+	def step_key(self, step_line, run_dir, exclude=()):
+		sha = hashlib.sha1(step_line.encode('utf-8'))
+		for input_path in pims_run.step_inputs(step_line, run_dir, exclude):
+			sha.update(('\0%s\0%s' % (input_path, self.content_hash(os.path.join(run_dir, input_path)))).encode('utf-8'))
+		return sha.hexdigest()
+
+	def entry_path(self, key):
+		return os.path.join(self.cache_path, key)
+
+	#Puts one cached file into a run directory: a copy-on-write copy where the file system supports it, otherwise a hard link (unless link is False, for a file that may be changed in the run directory), otherwise a plain copy. The copies can be written to; a hard link shares the read-only cached file.
+	def place_file(self, cached_path, dest_path, link=True):
+		dest_dir = os.path.dirname(dest_path)
+		if not os.path.isdir(dest_dir):
+			os.makedirs(dest_dir)
+		if os.path.lexists(dest_path):
+			os.remove(dest_path)
+		if self.reflink:
+			devnull = open(os.devnull, 'w')
+			reflink_code = sub.call(['cp', '--reflink=always', cached_path, dest_path], stdout=devnull, stderr=sub.STDOUT)
+			devnull.close()
+			if reflink_code == 0:
+				os.chmod(dest_path, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
+				return None
+			#The file system does not support it, so don't try again. cp may have left an empty file behind, which would stop the link.
+			self.reflink = False
+			if os.path.lexists(dest_path):
+				os.remove(dest_path)
+		if link:
+			try:
+				os.link(cached_path, dest_path)
+				return None
+			except OSError:
+				pass
+		shutil.copy2(cached_path, dest_path)
+		os.chmod(dest_path, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
+		return None
+
+	#Links the outputs stored under key into the run directory, copying those in copy_paths (see place_file). Returns the outputs as {relative path: stamp} (see pims_run.file_stamp), or None if there is no such entry.
+	def restore(self, key, run_dir, copy_paths=()):
+		entry_path = self.entry_path(key)
+		try:
+			entry_file = open(os.path.join(entry_path, 'ENTRY'), 'r')
+			entry = json.load(entry_file)
+			entry_file.close()
+		except (IOError, ValueError):
+			return None
+		outputs = dict()
+		try:
+			for rel_path in entry['outputs']:
+				self.place_file(os.path.join(entry_path, 'files', rel_path), os.path.join(run_dir, rel_path), rel_path not in copy_paths)
+				outputs[rel_path] = pims_run.file_stamp(os.path.join(run_dir, rel_path))
+		except (OSError, IOError):
+			#The entry was evicted while it was being used; run the step instead
+			return None
+		#The modification time of ENTRY records when the entry was last used, for eviction
+		try:
+			os.utime(os.path.join(entry_path, 'ENTRY'), None)
+		except OSError:
+			pass
+		return outputs
+
+	#Copies a step's outputs (relative paths in the run directory) into the store under key, then removes the least recently used entries if the store has grown past its size limit (as far as this process knows, see known_size). The files are copied rather than linked, so that nothing done later in the run directory can change them, and are made read-only, so that a run directory holding a hard link to one cannot change it by accident. Entries are built in a temporary directory and renamed into place, so pipelines running at the same time never see half an entry.
+	def store(self, key, run_dir, outputs):
+		if (len(outputs) == 0) or os.path.isdir(self.entry_path(key)):
+			return None
+		temp_path = tempfile.mkdtemp(prefix='.tmp_', dir=self.cache_path)
+		size = 0
+		try:
+			for rel_path in outputs:
+				cached_path = os.path.join(temp_path, 'files', rel_path)
+				if not os.path.isdir(os.path.dirname(cached_path)):
+					os.makedirs(os.path.dirname(cached_path))
+				shutil.copy2(os.path.join(run_dir, rel_path), cached_path)
+				os.chmod(cached_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+				size += os.path.getsize(cached_path)
+			entry_file = open(os.path.join(temp_path, 'ENTRY'), 'w')
+			json.dump({'outputs':sorted(outputs), 'size':size, 'created':time.time()}, entry_file)
+			entry_file.close()
+			#mkdtemp makes the directory private, but the store is meant to be shared
+			os.chmod(temp_path, stat.S_IRWXU | stat.S_IRGRP | stat.S_IXGRP | stat.S_IROTH | stat.S_IXOTH)
+			os.rename(temp_path, self.entry_path(key))
+		except (OSError, IOError):
+			remove_entry(temp_path)
+			return None
+		with self.lock:
+			self.known_size += size
+			over_limit = self.known_size > self.max_bytes
+		if over_limit:
+			self.evict()
+		return None
+
+	#Returns [last used time, size, key] for every entry in the store
+	def entries(self):
+		entries = []
+		for key in os.listdir(self.cache_path):
+			if key.startswith('.'):
+				continue
+			entry_file_path = os.path.join(self.entry_path(key), 'ENTRY')
+			try:
+				entry_file = open(entry_file_path, 'r')
+				entry = json.load(entry_file)
+				entry_file.close()
+				entries.append([os.path.getmtime(entry_file_path), entry['size'], key])
+			except (IOError, OSError, ValueError):
+				continue
+		return entries
+
+	#Removes the least recently used entries until the store fits in its size limit. Returns the number of entries removed. Only one thread evicts at a time, and one that was waiting lists the store again, so two steps finishing together do not both remove entries for the same excess.
+	def evict(self):
+		with self.lock:
+			entries = sorted(self.entries())
+			total = sum([entry[1] for entry in entries])
+			removed = 0
+			for last_used, size, key in entries:
+				if total <= self.max_bytes:
+					break
+				remove_entry(self.entry_path(key))
+				total -= size
+				removed += 1
+			self.known_size = total
+		return removed
+
+#Deletes an entry directory. Errors are ignored, as another PIMS process may be removing the same entry.
+def remove_entry(path):
+	shutil.rmtree(path, ignore_errors=True)
+	return None
@@ -0,0 +1,236 @@
+#This is part of the source code for the Pipeline Interface and Management System (PIMS). PIMS was created by Joseph Gardner, Dept. of Genetics, University of Cambridge, UK, and is licensed under the Creative Commons Attribution-ShareAlike 4.0 International (CC BY-SA 4.0) license. See pims_v0.1.py or https://github.com/jg600/PIMS for full licensing information.
+
+#Checks pipelines before they run, so that a mistyped command or a missing input file is found straight away rather than when bash reaches that step, possibly hours into a run. Every active tool's command (and any command it splits or merges its files with) must be found on the PATH (or be a shell builtin, or an executable path), and the values of the options and arguments that a tool declares as inputs (the INPUTS field of its .tool file) must be files or directories that can be read. For a tool that declares no INPUTS, the paths in its values that look like references to existing files (see reference_paths) are looked for instead. Each command and path is looked up only once however many pipelines use it, and the lookups are done concurrently, since on network filesystems they are mostly waiting. Every problem is reported, not just the first. Like pims_core.py, this does not import Tkinter.
+
+import os
+import re
+import shlex
+from multiprocessing.pool import ThreadPool
+import pims_core
+
+#Commands that bash runs itself, which are never found on the PATH
+shell_builtins = set(['.', ':', '[', 'alias', 'bg', 'bind', 'break', 'builtin', 'caller', 'cd', 'command', 'compgen', 'complete', 'continue', 'declare', 'dirs', 'disown', 'echo', 'enable', 'eval', 'exec', 'exit', 'export', 'false', 'fc', 'fg', 'getopts', 'hash', 'help', 'history', 'jobs', 'kill', 'let', 'local', 'logout', 'popd', 'printf', 'pushd', 'pwd', 'read', 'readonly', 'return', 'set', 'shift', 'shopt', 'source', 'suspend', 'test', 'time', 'times', 'trap', 'true', 'type', 'typeset', 'ulimit', 'umask', 'unalias', 'unset', 'wait'])
+
+#Values holding these are expanded by bash when the step runs, so cannot be checked beforehand
+shell_expansion_chars = set('$`*?[{')
+quote_chars = set('\'"\\')
+
+#Number of lookups run at once
+lookup_threads = 16
+
+#A word of a value that redirects output (e.g. "> out.txt", "2>>log" or "2>&1"), which names a file being written, and one that redirects input ("< in.txt")
+output_redirection_pattern = re.compile(r'^\d*(?:&>>?|>>?)')
+input_redirection_pattern = re.compile(r'^\d*<')
+
+#Returns the program a command line starts with (skipping VAR=value settings), or None if there is none
+def command_program(command):
+	try:
+		words = shlex.split(command)
+	except ValueError:
+		words = command.split()
+	for word in words:
+		if ('=' in word) and (not word.startswith('=')) and pims_core.name_pattern.match(word.split('=', 1)[0]):
+			continue
+		return word
+	return None
+
+#Returns the names of the flags, options and arguments of a tool that name input files, as listed in its INPUTS field (or, with declaration='OUTPUTS', output files). Options may be given in full ("-i <>") or by their name ("-i").
+def tool_inputs(tool_dict, declaration='INPUTS'):
+	return [name.strip() for name in tool_dict.get(declaration, '').split(',') if name.strip() != '']
+
+#Returns [(name, value)] for the values of a tool that name input files (or, with declaration='OUTPUTS', output files)
+def input_values(tool_dict, values, declaration='INPUTS'):
+	declared = tool_inputs(tool_dict, declaration)
+	found = []
+	for field in ['OPTIONS', 'ARGUMENTS']:
+		for name in tool_dict[field].split(','):
+			if (name == '') or ((name not in declared) and ((field != 'OPTIONS') or (pims_core.short_option_name(name) not in declared))):
+				continue
+			value = str(values[field].get(name, ''))
+			if value != '':
+				found.append((name, value))
+	return found
+
+#Returns [(name, value)] for the values of a tool that declares no INPUTS that may name input files: those of every option and argument except the ones it declares as OUTPUTS
+def undeclared_values(tool_dict, values):
+	outputs = [name for name, value in input_values(tool_dict, values, 'OUTPUTS')]
+	found = []
+	for field in ['OPTIONS', 'ARGUMENTS']:
+		for name in tool_dict[field].split(','):
+			if (name == '') or (name in outputs):
+				continue
+			value = str(values[field].get(name, ''))
+			if value != '':
+				found.append((name, value))
+	return found
+
+#Returns the paths (as split by value_paths) of a value of a tool that declares no INPUTS that look like references to existing files: absolute paths, paths in a home directory and relative paths with a directory part (e.g. ../data/reads.fq). Plain file names are usually files the pipeline makes in its run directory, and files that an output redirection writes to are outputs, so neither is looked for.
+def reference_paths(paths):
+	found = []
+	skip_next = False
+	for path in paths:
+		if skip_next:
+			skip_next = False
+			continue
+		if output_redirection_pattern.match(path):
+			skip_next = output_redirection_pattern.sub('', path) == ''
+			continue
+		path = input_redirection_pattern.sub('', path)
+		if (path.startswith('~') or ('/' in path)) and not path.startswith('/dev/'):
+			found.append(path)
+	return found
+
+#Returns the commands a tool that splits its input into chunks runs to split and merge them (see pims_core.scatter_command), leaving out the ways of splitting and merging that need no command of their own
+def scatter_commands(tool_dict):
+	if tool_dict.get('SPLIT', '') == '':
+		return []
+	commands = []
+	split_by = tool_dict.get('SPLIT_BY', '').strip()
+	if (split_by not in ['', 'lines']) and not split_by.startswith('lines:'):
+		commands.append(split_by)
+	merge_by = tool_dict.get('MERGE_BY', '').strip()
+	if merge_by not in ['', 'cat']:
+		commands.append(merge_by)
+	return commands
+
+#Splits a value into the paths it names (a value can hold several, separated by spaces). Returns None if it holds anything bash would expand.
+def value_paths(value):
+	if len(shell_expansion_chars.intersection(value)) > 0:
+		return None
+	#Most values hold no quoting, and splitting them on spaces is far quicker than shlex
+	if len(quote_chars.intersection(value)) == 0:
+		return value.split()
+	try:
+		return shlex.split(value)
+	except ValueError:
+		return None
+
+#Looks up where a program is. Returns None if it was found, or what is wrong with it.
+def find_program(program, run_dir):
+	if program in shell_builtins:
+		return None
+	if '/' in program:
+		path = os.path.join(run_dir, os.path.expanduser(program))
+		if not os.path.isfile(path):
+			return 'command %s was not found' % program
+		if not os.access(path, os.X_OK):
+			return 'command %s is not executable' % program
+		return None
+	for path_dir in os.getenv('PATH', '').split(os.pathsep):
+		path = os.path.join(path_dir or '.', program)
+		if os.path.isfile(path) and os.access(path, os.X_OK):
+			return None
+	return 'command %s was not found on the PATH' % program
+
+#Looks up an input path. Returns None if it can be read, or what is wrong with it.
+def find_input(path):
+	if not os.path.exists(path):
+		return 'does not exist'
+	if not os.access(path, os.R_OK):
+		return 'cannot be read'
+	return None
+
+#Runs func on every item at once (up to lookup_threads at a time), returning {item: result}
+def lookup_all(func, items):
+	items = list(items)
+	if len(items) < 2:
+		return dict((item, func(*item)) for item in items)
+	pool = ThreadPool(min(lookup_threads, len(items)))
+	try:
+		results = pool.map(lambda item: func(*item), items)
+	finally:
+		pool.close()
+		pool.join()
+	return dict(zip(items, results))
+
+#Checks a list of pipelines, laid out as (script_name, note_str, steps) as made by pims_core.batch_pipelines, whose run directories will be made in scripts_path. Relative input paths are taken from the run directory, as the script will see them, so a file there must be written by an earlier step: values that an earlier tool of the same pipeline also uses are taken to be such files and are not looked for. With stream set, the files that streaming replaces with a pipe (see pims_core.stream_values) are not looked for either. Returns a list of problems, each a line of text naming the scripts, purpose and tool it affects; the list is empty if everything was found.
+def check_pipelines(pipelines, scripts_path=None, stream=False):
+	if scripts_path == None:
+		scripts_path = pims_core.get_pipeline_path()+'/scripts/'
+	run_dir = os.path.join(os.path.abspath(scripts_path), 'run_dir')
+	#What needs looking up, as (script_name, purpose, tool name, kind, key, description), where key is what is looked up
+	wanted = []
+	#Every pipeline of a batch runs the same tools, so each command is only split once
+	programs_by_command = dict()
+	for script_name, note_str, steps in pipelines:
+		earlier_values = set()
+		for purpose_num, purpose_steps in enumerate(steps):
+			stream_in = stream and (purpose_num > 0) and pims_core.streams_into(steps[purpose_num-1], purpose_steps)
+			for tool_name, tool_dict, values in purpose_steps:
+				if tool_dict['COMMAND'] not in programs_by_command:
+					programs_by_command[tool_dict['COMMAND']] = command_program(tool_dict['COMMAND'])
+				program = programs_by_command[tool_dict['COMMAND']]
+				if program == None:
+					wanted.append((script_name, tool_dict['PURPOSE'], tool_name, 'problem', None, 'has no command'))
+				else:
+					wanted.append((script_name, tool_dict['PURPOSE'], tool_name, 'program', (program, run_dir), None))
+				for command in scatter_commands(tool_dict):
+					if command_program(command) != None:
+						wanted.append((script_name, tool_dict['PURPOSE'], tool_name, 'program', (command_program(command), run_dir), None))
+				streamed = pims_core.stream_values(tool_dict, values, 'STDIN') if stream_in else values
+				declared = len(tool_inputs(tool_dict)) > 0
+				for name, value in (input_values(tool_dict, values) if declared else undeclared_values(tool_dict, values)):
+					if str(streamed['OPTIONS'].get(name, streamed['ARGUMENTS'].get(name, ''))) != value:
+						continue
+					paths = value_paths(value)
+					if paths == None:
+						continue
+					if not declared:
+						paths = reference_paths(paths)
+					for path in paths:
+						if path in earlier_values:
+							continue
+						full_path = os.path.normpath(os.path.join(run_dir, os.path.expanduser(path)))
+						description = '%s %s' % (name, path)
+						if not os.path.isabs(os.path.expanduser(path)):
+							description += ' (relative to the run directory)'
+						wanted.append((script_name, tool_dict['PURPOSE'], tool_name, 'input', (full_path,), description))
+			for tool_name, tool_dict, values in purpose_steps:
+				for field in ['OPTIONS', 'ARGUMENTS']:
+					for value in values[field].values():
+						earlier_values.update(value_paths(str(value)) or [])
+	programs = lookup_all(find_program, set([item[4] for item in wanted if item[3] == 'program']))
+	inputs = lookup_all(find_input, set([item[4] for item in wanted if item[3] == 'input']))
+	#The same problem in many pipelines of a batch (e.g. a command that is not installed) is reported once, listing the scripts it affects
+	problem_scripts = dict()
+	problem_order = []
+	for script_name, purpose, tool_name, kind, key, description in wanted:
+		if kind == 'problem':
+			problem = description
+		elif kind == 'program':
+			problem = programs[key]
+		else:
+			problem = inputs[key]
+			if problem != None:
+				problem = 'input %s %s' % (description, problem)
+		if problem == None:
+			continue
+		problem_key = (purpose, tool_name, problem)
+		if problem_key not in problem_scripts:
+			problem_scripts[problem_key] = []
+			problem_order.append(problem_key)
+		problem_scripts[problem_key].append(script_name)
+	problems = []
+	for purpose, tool_name, problem in problem_order:
+		problems.append('%s: %s (%s): %s' % (script_list(problem_scripts[(purpose, tool_name, problem)]), purpose, tool_name, problem))
+	return problems
+
+#Returns the names of the scripts a problem affects, shortened when there are many
+def script_list(script_names, shown=3):
+	if len(script_names) <= shown+1:
+		return ', '.join(script_names)
+	return '%s and %d more' % (', '.join(script_names[:shown]), len(script_names)-shown)
+
+#Checks the commands of generated scripts before they are run. Only the programs are checked here, on purpose: a script no longer says which values are input files, and guessing from the words of its lines would report the files and chunk directories that earlier steps make. Returns a list of problems, as check_pipelines does.
+def check_scripts(script_paths):
+	wanted = []
+	for script_path in script_paths:
+		script_name, note_str, run_dir, step_lines = pims_core.parse_script(script_path)
+		run_path = os.path.join(os.path.dirname(os.path.abspath(script_path)), run_dir)
+		for step_num, step_line in enumerate(step_lines):
+			for part in pims_core.step_commands(step_line):
+				program = command_program(part)
+				if program != None:
+					wanted.append((script_name, step_num, (program, run_path)))
+	programs = lookup_all(find_program, set([key for script_name, step_num, key in wanted]))
+	return ['%s: step %d: %s' % (script_name, step_num+1, programs[key]) for script_name, step_num, key in wanted if programs[key] != None]
@@ -0,0 +1,132 @@
+#This is part of the source code for the Pipeline Interface and Management System (PIMS). PIMS was created by Joseph Gardner, Dept. of Genetics, University of Cambridge, UK, and is licensed under the Creative Commons Attribution-ShareAlike 4.0 International (CC BY-SA 4.0) license. See pims_v0.1.py or https://github.com/jg600/PIMS for full licensing information.
+
+#Turns a configured pipeline, or a batch of them (one per row of a sample sheet, see pims_core.batch_pipelines), into an array job for a cluster scheduler (SLURM or SGE), with one array task per pipeline. The usual pipeline scripts are written as well, and each task runs in its own timestamped run directory with the script copy and NOTE file, exactly as the script would. By default each task runs its whole pipeline; with step_jobs there is one array job per step instead, each task of which waits only for the same task of the step before it, so that steps can ask the scheduler for different resources and a failed sample does not hold up the others. Like pims_core.py, this does not import Tkinter.
+
+import os
+import subprocess as sub
+import time
+import pims_core
+
+#What differs between schedulers: the prefix of the header lines, the variable holding the array task number, the submit command and its options for printing just the job id and for making each task wait for the same task of another array job
+schedulers = {
+	'slurm':{'prefix':'#SBATCH', 'task_var':'SLURM_ARRAY_TASK_ID', 'extension':'slurm', 'submit':['sbatch', '--parsable'], 'depend':lambda job_id: ['--dependency=aftercorr:%s' % job_id]},
+	'sge':{'prefix':'#$', 'task_var':'SGE_TASK_ID', 'extension':'sge', 'submit':['qsub', '-terse'], 'depend':lambda job_id: ['-hold_jid_ad', job_id]},
+}
+
+def get_scheduler(scheduler):
+	if scheduler not in schedulers:
+		raise pims_core.pims_error('%s is not a supported scheduler. Use one of: %s.' % (scheduler, ', '.join(sorted(schedulers.keys()))))
+	return schedulers[scheduler]
+
+#Returns the scheduler header lines for an array job of task_count tasks. Each task's output goes to its own file in log_dir. max_running limits how many tasks run at once, and extra_options (e.g. "--partition=long" or "-l h_vmem=8G") are added as they are.
+def job_header(scheduler, job_name, task_count, log_dir, max_running=None, extra_options=()):
+	prefix = get_scheduler(scheduler)['prefix']
+	if scheduler == 'slurm':
+		lines = ['--job-name=%s' % job_name, '--array=1-%d%s' % (task_count, '%%%d' % max_running if max_running != None else ''), '--output=%s/%s_%%A_%%a.log' % (log_dir, job_name)]
+	else:
+		lines = ['-N %s' % job_name, '-t 1-%d' % task_count, '-j y', '-o %s/' % log_dir, '-S /bin/bash']
+		if max_running != None:
+			lines.append('-tc %d' % max_running)
+	return ['%s %s\n' % (prefix, line) for line in lines+list(extra_options)]
+
+#Returns the text of an array job script. task_bodies holds the shell lines run by each task, in task order; the task is picked by the scheduler's task number, after moving to work_dir (where the scripts and run directories are).
+def array_job_text(scheduler, job_name, task_bodies, work_dir, log_dir, max_running=None, extra_options=()):
+	task_var = get_scheduler(scheduler)['task_var']
+	job_list = ['#!/bin/bash\n']
+	job_list.extend(job_header(scheduler, job_name, len(task_bodies), log_dir, max_running, extra_options))
+	job_list.append('cd %s || exit 1\n' % work_dir)
+	job_list.append('case "$%s" in\n' % task_var)
+	for task_num, body in enumerate(task_bodies):
+		job_list.append('%d)\n' % (task_num+1))
+		for line in body:
+			job_list.append('\t%s\n' % line)
+		job_list.append('\t;;\n')
+	job_list.append('*)\n\techo "No task $%s in %s" >&2\n\texit 1\n\t;;\nesac\n' % (task_var, job_name))
+	return ''.join(job_list)
+
+#Returns the shell lines each task runs for step step_num (counting from 0) of its pipeline, in step_jobs mode. The first step makes the run directory, copies the script into it and writes the NOTE file, as the script does; each step exits with the step's exit code, so that the same task of the next step only runs if it succeeded; and after the last step the original script is deleted if it succeeded, as the script does. Pipelines with fewer steps than others do nothing for the steps they do not have.
+def step_task_body(script_name, note_str, run_dir, step_lines, step_num, step_count):
+	if step_num == 0:
+		body = ['mkdir %s || exit 1' % run_dir, 'cp %s.script %s/%s.script' % (script_name, run_dir, script_name), 'cd %s' % run_dir, 'echo "%s" > NOTE' % note_str]
+	else:
+		body = ['cd %s || exit 1' % run_dir]
+	body.append(step_lines[step_num] if step_num < len(step_lines) else ':')
+	body.append('step_status=$?')
+	if step_num == step_count-1:
+		body.append('[ $step_status -eq 0 ] && cd .. && rm %s.script' % script_name)
+	body.append('exit $step_status')
+	return body
+
+#Returns [(job name, job script text)] for a list of pipelines (script_name, note_str, steps), in the order they must be submitted. With step_jobs there is one job per step, named <job name>_step<N>; otherwise a single job whose tasks each run their pipeline's script.
+def cluster_jobs(pipelines, scheduler, job_name, work_dir, log_dir, timestamp, step_jobs=False, stream=False, max_running=None, extra_options=(), sweep=False, fan_out=False):
+	if not step_jobs:
+		task_bodies = [['bash %s.script' % script_name] for script_name, note_str, steps in pipelines]
+		return [(job_name, array_job_text(scheduler, job_name, task_bodies, work_dir, log_dir, max_running, extra_options))]
+	pipeline_steps = [[line for line in pims_core.script_lines(steps, stream, sweep, fan_out) if line != ''] for script_name, note_str, steps in pipelines]
+	step_count = max([len(step_lines) for step_lines in pipeline_steps]+[1])
+	jobs = []
+	for step_num in range(step_count):
+		task_bodies = []
+		for (script_name, note_str, steps), step_lines in zip(pipelines, pipeline_steps):
+			task_bodies.append(step_task_body(script_name, note_str, pims_core.run_dir_name(script_name, timestamp), step_lines, step_num, step_count))
+		step_job_name = '%s_step%d' % (job_name, step_num+1)
+		jobs.append((step_job_name, array_job_text(scheduler, step_job_name, task_bodies, work_dir, log_dir, max_running, extra_options)))
+	return jobs
+
+#Compiles a config (or, with sheet_path, one pipeline per sample sheet row) into cluster jobs. The pipeline scripts are written to scripts_path (~/pipeline/scripts by default) as pims.py compile/batch would write them, along with the job scripts (<job name>.slurm or .sge, or one per step) and a <job name>_logs directory for the task output. Nothing is written unless every name is free (or overwrite is set). With a pims_history.run_history, the pipelines are recorded in it. Returns the paths of the job scripts, in submission order.
+def compile_cluster(config_path, purposes, scheduler, job_name, sheet_path=None, note_str='', scripts_path=None, registry=None, timestamp=None, overwrite=False, stream=False, step_jobs=False, max_running=None, extra_options=(), name_prefix='', history=None, sweep=False, fan_out=False):
+	scheduler_info = get_scheduler(scheduler)
+	if not pims_core.name_pattern.match(job_name):
+		raise pims_core.pims_error('%s is not a valid file name. File names should contain only alphanumeric characters, underscores and hyphens.' % job_name)
+	if registry == None:
+		registry = pims_core.tool_registry()
+	if scripts_path == None:
+		scripts_path = pims_core.get_pipeline_path()+'/scripts/'
+	scripts_path = os.path.abspath(scripts_path)
+	if timestamp == None:
+		timestamp = time.time()
+	if sheet_path != None:
+		pipelines = pims_core.batch_pipelines(config_path, purposes, sheet_path, registry, name_prefix, note_str)
+	else:
+		pipelines = [(job_name, note_str, pims_core.config_steps(pims_core.read_config(config_path), purposes, registry))]
+	log_dir = os.path.join(scripts_path, '%s_logs' % job_name)
+	jobs = cluster_jobs(pipelines, scheduler, job_name, scripts_path, log_dir, timestamp, step_jobs, stream, max_running, extra_options, sweep, fan_out)
+	job_paths = [os.path.join(scripts_path, '%s.%s' % (this_job_name, scheduler_info['extension'])) for this_job_name, job_text in jobs]
+	if not overwrite:
+		for script_name, this_note, steps in pipelines:
+			if os.path.exists(os.path.join(scripts_path, '%s.script' % script_name)):
+				raise pims_core.pims_error('A file with the name %s already exists. Please choose another name.' % script_name)
+		for job_path in job_paths:
+			if os.path.exists(job_path):
+				raise pims_core.pims_error('A file with the name %s already exists. Please choose another name.' % os.path.basename(job_path))
+	for script_name, this_note, steps in pipelines:
+		pims_core.write_script_file(script_name, pims_core.render_script(script_name, this_note, steps, pims_core.run_dir_name(script_name, timestamp), stream, sweep, fan_out), scripts_path, overwrite=True)
+	if not os.path.isdir(log_dir):
+		os.makedirs(log_dir)
+	for job_path, (this_job_name, job_text) in zip(job_paths, jobs):
+		job_file = open(job_path, 'w')
+		job_file.write(job_text)
+		job_file.close()
+	if history != None:
+		history.record_scripts(pipelines, scripts_path, timestamp, stream, sweep, fan_out)
+	return job_paths
+
+#Submits job scripts in order with sbatch or qsub, as found on the PATH (so a stand-in can be used for testing). With chain set, each job's tasks wait for the same tasks of the job before (for step jobs). Returns the job ids.
+def submit_jobs(job_paths, scheduler, chain=False):
+	scheduler_info = get_scheduler(scheduler)
+	job_ids = []
+	for job_path in job_paths:
+		submit_args = list(scheduler_info['submit'])
+		if chain and (len(job_ids) > 0):
+			submit_args.extend(scheduler_info['depend'](job_ids[-1]))
+		submit_args.append(job_path)
+		try:
+			proc = sub.Popen(submit_args, stdout=sub.PIPE, stderr=sub.PIPE, cwd=os.path.dirname(job_path))
+		except OSError:
+			raise pims_core.pims_error('Could not run %s. Is %s installed and on the PATH?' % (submit_args[0], scheduler))
+		out, err = proc.communicate()
+		if proc.returncode != 0:
+			raise pims_core.pims_error('%s failed for %s: %s' % (submit_args[0], os.path.basename(job_path), err.decode('utf-8', 'replace').strip()))
+		#sbatch --parsable prints "jobid" or "jobid;cluster", and qsub -terse prints "jobid" or, for array jobs, "jobid.1-N:1"
+		job_ids.append(out.decode('utf-8').strip().split(';')[0].split('.')[0])
+	return job_ids
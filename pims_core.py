@@ -0,0 +1,1088 @@
+#This is part of the source code for the Pipeline Interface and Management System (PIMS). PIMS was created by Joseph Gardner, Dept. of Genetics, University of Cambridge, UK, and is licensed under the Creative Commons Attribution-ShareAlike 4.0 International (CC BY-SA 4.0) license. See pims_v0.1.py or https://github.com/jg600/PIMS for full licensing information.
+
+#This module holds the parts of PIMS that do not need a display. It must not import Tkinter or do anything when it is imported (no directories are created and no files are read), so that it can be used from the command line and from other programs as well as from the GUI.
+
+import csv
+import json
+import os
+import re
+import sys
+import time
+import pims_trace
+
+#The fields found in a .tool file, in the order they are written. The optional fields are only written when they have a value, so tool files that do not use them are unchanged.
+#STDIN and STDOUT declare that a tool can read its input from standard input, or write its output to standard output, so that it can be joined to the tool before or after it by a pipe (see purpose_lines). Each is either "yes" (nothing needs to change), the name of the flag, option or argument that names the input/output file and is left out when streaming, or NAME=VALUE to give that flag/option/argument a different value when streaming (e.g. "in=-", or "-o=/dev/stdout" for the option "-o <>").
+#THREADS and MEMORY declare what one run of the tool needs (a number of threads, and an amount of memory such as 8G, see parse_size), so that steps can be packed onto a machine without overloading it (see pims_run.resource_pool). THREAD_OPTION names the option that sets the tool's thread count (e.g. "-t <>", or just "-t"); when it is left empty in a configuration, it is filled in from the shell variable PIMS_THREADS, which the scheduler sets to the number of threads given to the step, falling back to THREADS when the script is run by hand.
+#INPUTS lists the options and arguments whose values are input files (e.g. "-i <>,reads"), so that they can be checked before the pipeline runs (see pims_check.py), and OUTPUTS those whose values are the files the tool writes (e.g. "-o <>,out"), so that a Makefile can tell which steps to run again (see pims_make.py).
+#SPLIT and MERGE list the options and arguments naming the input files that can be split into chunks and processed separately, and the output files whose chunks are then merged (e.g. "-1 <>,-2 <>" and "out"); SPLIT_BY says how to split them ("lines", "lines:N" to keep records of N lines together, e.g. "lines:4" for FASTQ, or a command of the tool's own) and MERGE_BY how to merge them ("cat", or a command such as "samtools merge -f"). See scatter_command.
+optional_tool_fields = ['STDIN', 'STDOUT', 'THREADS', 'MEMORY', 'THREAD_OPTION', 'INPUTS', 'OUTPUTS', 'SPLIT', 'SPLIT_BY', 'MERGE', 'MERGE_BY']
+tool_fields = ['NAME', 'PURPOSE', 'COMMAND', 'FLAGS', 'OPTIONS', 'ARGUMENTS'] + optional_tool_fields
+
+#Returns the path of the PIMS directory structure. This is looked up each time rather than stored, so that changing HOME (e.g. for testing) is respected.
+def get_pipeline_path():
+	return os.getenv("HOME")+'/pipeline'
+
+#Turns a size such as 500M, 100G or 2T (or a plain number of bytes) into a number of bytes
+def parse_size(size_str):
+	size_match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([kKmMgGtT]?)[bB]?\s*$', str(size_str))
+	if size_match == None:
+		raise pims_error('%s is not a valid size. Use a number of bytes, optionally followed by K, M, G or T.' % size_str)
+	multiplier = {'':1, 'k':1<<10, 'm':1<<20, 'g':1<<30, 't':1<<40}[size_match.group(2).lower()]
+	return int(float(size_match.group(1))*multiplier)
+
+#Creates the directory structure needed, if it isn't in place already.
+def make_pipeline_dirs(pipeline_path=None):
+	if pipeline_path == None:
+		pipeline_path = get_pipeline_path()
+	for folder in ['/tools/', '/config/', '/scripts/', '/outputs/']:
+		if (not os.path.isdir(pipeline_path+folder)):
+			os.makedirs(pipeline_path+folder)
+	return None
+
+#Reads a .tool file and returns its fields as a dictionary, with the field names (NAME, PURPOSE, etc.) as keys. Any field missing from the file is given an empty value, so that the dictionary can always be used by the tool_frame class and by script generation. Only the first colon on each line is treated as a separator, so commands can contain colons.
+@pims_trace.traced('parse_tool_file', lambda tool_path: {'path':tool_path})
+def parse_tool_file(tool_path):
+	tool_dict = {field:'' for field in tool_fields}
+	tool_file = open(tool_path, 'r')
+	for line in tool_file:
+		line_list = line.rstrip('\r\n').split(':', 1)
+		if len(line_list) == 2:
+			tool_dict[line_list[0]] = line_list[1]
+	tool_file.close()
+	return tool_dict
+
+#Returns the text of a .tool file for a tool dictionary, with the fields in the order of tool_fields. The optional fields are left out when they are empty.
+def format_tool_file(tool_dict):
+	lines = []
+	for field in tool_fields:
+		if (field in optional_tool_fields) and (tool_dict.get(field, '') == ''):
+			continue
+		lines.append('%s:%s\n' % (field, tool_dict.get(field, '')))
+	return ''.join(lines)
+
+#Writes a file by writing a temporary file next to it and renaming it into place, so that a crash part way through leaves either the old file or the new one, never a missing or half written one.
+def write_atomic(path, text):
+	temp_path = '%s.tmp%d' % (path, os.getpid())
+	try:
+		this_file = open(temp_path, 'w')
+		this_file.write(text)
+		this_file.flush()
+		os.fsync(this_file.fileno())
+		this_file.close()
+		os.rename(temp_path, path)
+	except (IOError, OSError) as e:
+		if os.path.exists(temp_path):
+			os.remove(temp_path)
+		raise pims_error('Could not write %s: %s' % (path, e))
+	return None
+
+#json gives unicode strings in Python 2, where the rest of PIMS uses byte strings
+def native_str(value):
+	if (sys.version_info[0] < 3) and (not isinstance(value, str)):
+		return value.encode('utf-8')
+	return value
+
+#The tool catalog is an alternative to one .tool file per tool: a single file in the tools directory holding every tool, one JSON object per line, with the tool name under "tool" and the .tool file fields under their own names. If it exists it is used instead of the .tool files, so that loading the tools costs one stat and one read however many tools there are (which matters on network file systems). See import_tool_files and export_catalog for moving between the two.
+catalog_name = 'catalog.jsonl'
+
+#Reads a tool catalog and returns {tool name: tool_dict}
+@pims_trace.traced('read_catalog')
+def read_catalog(catalog_path):
+	tools = dict()
+	catalog_file = open(catalog_path, 'r')
+	for line_num, line in enumerate(catalog_file):
+		if line.strip() == '':
+			continue
+		try:
+			entry = json.loads(line)
+		except ValueError:
+			catalog_file.close()
+			raise pims_error('Line %d of the tool catalog %s is not valid.' % (line_num+1, catalog_path))
+		tool_dict = dict((field, native_str(entry.get(field, ''))) for field in tool_fields)
+		tools[native_str(entry['tool'])] = tool_dict
+	catalog_file.close()
+	return tools
+
+#Writes a whole tool catalog at once (see write_atomic), with the tools in name order
+def write_catalog(catalog_path, tools):
+	lines = []
+	for tool_name in sorted(tools.keys()):
+		entry = dict((field, tools[tool_name].get(field, '')) for field in tool_fields)
+		entry['tool'] = tool_name
+		lines.append(json.dumps(entry, sort_keys=True)+'\n')
+	write_atomic(catalog_path, ''.join(lines))
+	return None
+
+#A parsed copy of all the tool files in ~/pipeline/tools, keyed by tool name (the file name without .tool, as used everywhere else in PIMS) and indexed by purpose. Calling refresh() lists the tools directory and only re-reads files whose modification time or size has changed since they were last read, so after the first load it costs one directory listing and a stat per tool. Everything else just looks things up in memory.
+#If the tools directory holds a tool catalog (see catalog_name), the registry reads that instead, re-reading it whenever its modification time or size changes, and tools are saved and deleted by rewriting it.
+class tool_registry:
+	def __init__(self, tools_path=None):
+		if tools_path == None:
+			tools_path = get_pipeline_path()+'/tools/'
+		self.tools_path = tools_path
+		self.catalog_path = os.path.join(tools_path, catalog_name)
+		#Maps file name to [mtime, size, tool_dict]. Tools from a catalog are held under the name their .tool file would have, with the catalog's mtime and size.
+		self.file_dict = dict()
+		#Maps tool name to tool_dict
+		self.tool_dict = dict()
+		#Maps purpose to a sorted list of tool names
+		self.purpose_dict = dict()
+		#Purposes in the order they are first found, with tool files taken in alphabetical order
+		self.purposes_list = []
+		self.loaded = False
+		#Whether the tools were last loaded from a catalog rather than from .tool files
+		self.from_catalog = False
+
+	def uses_catalog(self):
+		return os.path.isfile(self.catalog_path)
+
+	#Brings the registry up to date with the tools directory. Returns True if anything was added, changed or removed.
+	@pims_trace.traced('tool_registry.refresh')
+	def refresh(self):
+		if self.uses_catalog():
+			return self.refresh_catalog()
+		changed = not self.loaded
+		seen = set()
+		try:
+			with pims_trace.span('list tools directory'):
+				filenames = os.listdir(self.tools_path)
+		except OSError:
+			filenames = []
+		for filename in filenames:
+			#In case another file has ended up in there
+			if not re.search(r'\.tool$', filename):
+				continue
+			tool_path = os.path.join(self.tools_path, filename)
+			try:
+				tool_stat = os.stat(tool_path)
+			except OSError:
+				continue
+			seen.add(filename)
+			cached = self.file_dict.get(filename)
+			if (cached != None) and (cached[0] == tool_stat.st_mtime) and (cached[1] == tool_stat.st_size):
+				continue
+			try:
+				tool_dict = parse_tool_file(tool_path)
+			except IOError:
+				continue
+			self.file_dict[filename] = [tool_stat.st_mtime, tool_stat.st_size, tool_dict]
+			changed = True
+		for filename in list(self.file_dict.keys()):
+			if filename not in seen:
+				del self.file_dict[filename]
+				changed = True
+		if changed:
+			self.rebuild_index()
+		self.loaded = True
+		self.from_catalog = False
+		return changed
+
+	#As refresh, for a tool catalog. The catalog is only read if it has changed since it was last read.
+	def refresh_catalog(self):
+		try:
+			catalog_stat = os.stat(self.catalog_path)
+		except OSError:
+			return self.refresh()
+		stamp = [catalog_stat.st_mtime, catalog_stat.st_size]
+		if self.loaded and (len(self.file_dict) > 0) and all([cached[:2] == stamp for cached in self.file_dict.values()]):
+			return False
+		self.file_dict = dict(('%s.tool' % tool_name, stamp+[tool_dict]) for tool_name, tool_dict in read_catalog(self.catalog_path).items())
+		self.rebuild_index()
+		self.loaded = True
+		self.from_catalog = True
+		return True
+
+	#Brings the registry up to date with just the named files of the tools directory (e.g. those a pims_watch.dir_watcher reports as changed), without listing the directory. Files that no longer exist are dropped. Changes to the tool catalog are picked up too. Returns True if anything was added, changed or removed.
+	def refresh_files(self, filenames):
+		if (not self.loaded) or (self.uses_catalog() != self.from_catalog):
+			return self.refresh()
+		if self.from_catalog:
+			if catalog_name in filenames:
+				return self.refresh_catalog()
+			return False
+		changed = False
+		for filename in filenames:
+			if not re.search(r'\.tool$', filename):
+				continue
+			tool_path = os.path.join(self.tools_path, filename)
+			try:
+				tool_stat = os.stat(tool_path)
+				cached = self.file_dict.get(filename)
+				if (cached != None) and (cached[0] == tool_stat.st_mtime) and (cached[1] == tool_stat.st_size):
+					continue
+				self.file_dict[filename] = [tool_stat.st_mtime, tool_stat.st_size, parse_tool_file(tool_path)]
+			except (OSError, IOError):
+				if filename not in self.file_dict:
+					continue
+				del self.file_dict[filename]
+			changed = True
+		if changed:
+			self.rebuild_index()
+		return changed
+
+	#Rebuilds the name and purpose lookups from the cached file contents
+	def rebuild_index(self):
+		self.tool_dict = dict()
+		self.purpose_dict = dict()
+		self.purposes_list = []
+		for filename in sorted(self.file_dict.keys()):
+			tool_name = filename.split('.')[0]
+			tool_dict = self.file_dict[filename][2]
+			self.tool_dict[tool_name] = tool_dict
+			purpose = tool_dict['PURPOSE']
+			if purpose not in self.purpose_dict:
+				self.purpose_dict[purpose] = []
+				self.purposes_list.append(purpose)
+			self.purpose_dict[purpose].append(tool_name)
+		return None
+
+	#Loads the registry the first time it is used. Later calls do nothing, so that lookups never touch the disk; call refresh() to pick up changes.
+	def ensure_loaded(self):
+		if not self.loaded:
+			self.refresh()
+		return None
+
+	#Looks up a tool by name. Before the registry has been fully loaded only the one tool file is read (and cached), so that headless script generation does not have to read the whole catalog to find a handful of tools.
+	def get(self, tool_name):
+		if self.loaded:
+			return self.tool_dict.get(tool_name)
+		#A catalog is read in one go anyway
+		if self.uses_catalog():
+			self.refresh()
+			return self.tool_dict.get(tool_name)
+		filename = '%s.tool' % tool_name
+		tool_path = os.path.join(self.tools_path, filename)
+		try:
+			tool_stat = os.stat(tool_path)
+		except OSError:
+			return None
+		cached = self.file_dict.get(filename)
+		if (cached != None) and (cached[0] == tool_stat.st_mtime) and (cached[1] == tool_stat.st_size):
+			return cached[2]
+		try:
+			tool_dict = parse_tool_file(tool_path)
+		except IOError:
+			return None
+		self.file_dict[filename] = [tool_stat.st_mtime, tool_stat.st_size, tool_dict]
+		return tool_dict
+
+	def purpose_of(self, tool_name):
+		tool_dict = self.get(tool_name)
+		if tool_dict == None:
+			return None
+		return tool_dict['PURPOSE']
+
+	def tools_for_purpose(self, purpose):
+		self.ensure_loaded()
+		return list(self.purpose_dict.get(purpose, []))
+
+	def tool_names(self):
+		self.ensure_loaded()
+		return sorted(self.tool_dict.keys())
+
+	#Saves a tool, replacing any tool of the same name. If old_name is given (a tool being edited, possibly renamed), that tool is removed, but only once the new one is safely written, so a crash never loses the tool. Each .tool file, or the catalog, is replaced in one step (see write_atomic).
+	def save_tool(self, tool_name, tool_dict, old_name=None):
+		if self.uses_catalog():
+			#Read the catalog again first, so that changes saved by another PIMS since it was last read are kept
+			self.refresh()
+			tools = dict((name, self.tool_dict[name]) for name in self.tool_dict)
+			if (old_name != None) and (old_name in tools):
+				del tools[old_name]
+			tools[tool_name] = dict((field, tool_dict.get(field, '')) for field in tool_fields)
+			write_catalog(self.catalog_path, tools)
+		else:
+			write_atomic(os.path.join(self.tools_path, '%s.tool' % tool_name), format_tool_file(tool_dict))
+			if (old_name != None) and (old_name != tool_name) and os.path.exists(os.path.join(self.tools_path, '%s.tool' % old_name)):
+				os.remove(os.path.join(self.tools_path, '%s.tool' % old_name))
+		self.refresh_files([catalog_name, '%s.tool' % tool_name] + (['%s.tool' % old_name] if old_name != None else []))
+		return None
+
+	def delete_tool(self, tool_name):
+		if self.uses_catalog():
+			self.refresh()
+			tools = dict((name, self.tool_dict[name]) for name in self.tool_dict if name != tool_name)
+			write_catalog(self.catalog_path, tools)
+		elif os.path.exists(os.path.join(self.tools_path, '%s.tool' % tool_name)):
+			os.remove(os.path.join(self.tools_path, '%s.tool' % tool_name))
+		self.refresh_files([catalog_name, '%s.tool' % tool_name])
+		return None
+
+	#Finds which tool a command line in a script was made from, by the longest COMMAND it starts with. Returns the tool name, or None.
+	def match_command(self, step_line):
+		self.ensure_loaded()
+		best_name = None
+		best_len = 0
+		for tool_name, tool_dict in self.tool_dict.items():
+			tool_cmd = tool_dict['COMMAND']
+			if (tool_cmd != '') and (len(tool_cmd) > best_len) and ((step_line == tool_cmd) or step_line.startswith(tool_cmd+' ')):
+				best_name = tool_name
+				best_len = len(tool_cmd)
+		return best_name
+
+
+#Raised by the headless functions below for the problems that the GUI reports with error_message
+class pims_error(Exception):
+	pass
+
+#Puts every .tool file in the tools directory into a new tool catalog, which is used from then on. The .tool files are left where they are, but are ignored while the catalog exists. Returns the number of tools in the catalog.
+def import_tool_files(tools_path=None, overwrite=False):
+	if tools_path == None:
+		tools_path = get_pipeline_path()+'/tools/'
+	catalog_path = os.path.join(tools_path, catalog_name)
+	if os.path.exists(catalog_path) and not overwrite:
+		raise pims_error('A tool catalog already exists in %s.' % tools_path)
+	tools = dict()
+	for filename in sorted(os.listdir(tools_path)):
+		if re.search(r'\.tool$', filename):
+			tools[filename.split('.')[0]] = parse_tool_file(os.path.join(tools_path, filename))
+	write_catalog(catalog_path, tools)
+	return len(tools)
+
+#Writes every tool in the catalog out as a .tool file, replacing any with the same name. If remove_catalog is set, the catalog is then deleted, so that the .tool files are used again. Returns the number of tools written.
+def export_catalog(tools_path=None, remove_catalog=False):
+	if tools_path == None:
+		tools_path = get_pipeline_path()+'/tools/'
+	catalog_path = os.path.join(tools_path, catalog_name)
+	if not os.path.isfile(catalog_path):
+		raise pims_error('There is no tool catalog in %s.' % tools_path)
+	tools = read_catalog(catalog_path)
+	for tool_name in sorted(tools.keys()):
+		write_atomic(os.path.join(tools_path, '%s.tool' % tool_name), format_tool_file(tools[tool_name]))
+	if remove_catalog:
+		os.remove(catalog_path)
+	return len(tools)
+
+#Patterns shared by script generation. The "<>" in an option marks where its value goes, and script/config names may only contain alphanumerics, underscores and hyphens.
+gtlt_pattern = re.compile('<{1}>{1}')
+name_pattern = re.compile(r'^[\w-]+$')
+
+#Config files hold one line per tool, in the format NAME:STATE:FLAGS:OPTIONS:ARGUMENTS (see runpipeline_window.save_config). This turns one line into a dictionary with the keys NAME and STATE, plus FLAGS, OPTIONS and ARGUMENTS, each of which is itself a dictionary mapping the flag/option/argument name to its value. Returns None for blank lines.
+def parse_config_line(line):
+	line_list = line.rstrip('\r\n').split(':')
+	if (len(line_list) < 2) or (line_list[0] == ''):
+		return None
+	while len(line_list) < 5:
+		line_list.append('')
+	config_entry = {'NAME':line_list[0], 'STATE':line_list[1]}
+	for field, field_str in zip(['FLAGS', 'OPTIONS', 'ARGUMENTS'], line_list[2:5]):
+		config_entry[field] = dict()
+		if field_str == '':
+			continue
+		for pair in field_str.split(';'):
+			if pair == '':
+				continue
+			key_val = pair.split('$', 1)
+			if len(key_val) == 1:
+				key_val.append('')
+			config_entry[field][key_val[0]] = key_val[1]
+	return config_entry
+
+#The reverse of parse_config_line: returns the config file line for a tool, given its state (active or inactive) and its values. Flags are written if they are switched on, and options and arguments if they have a value, in the order the tool file lists them.
+def format_config_line(tool_name, state, tool_dict, values):
+	fields_to_write = []
+	for field in ['FLAGS', 'OPTIONS', 'ARGUMENTS']:
+		list_to_write = []
+		for name in tool_dict[field].split(','):
+			value = values[field].get(name, '')
+			if name == '':
+				continue
+			if field == 'FLAGS':
+				if str(value) != '1':
+					continue
+				value = 1
+			elif str(value) == '':
+				continue
+			list_to_write.append('%s$%s' % (name, value))
+		fields_to_write.append(';'.join(list_to_write))
+	return '%s:%s:%s\n' % (tool_name, state, ':'.join(fields_to_write))
+
+#Reads a whole config file into a list of config entries (see parse_config_line), in the order they appear in the file
+@pims_trace.traced('read_config', lambda config_path: {'path':config_path})
+def read_config(config_path):
+	config_entries = []
+	config_file = open(config_path, 'r')
+	for line in config_file:
+		config_entry = parse_config_line(line)
+		if config_entry != None:
+			config_entries.append(config_entry)
+	config_file.close()
+	return config_entries
+
+#Finds a config file given either a path or the name of a config saved in ~/pipeline/config
+def resolve_config_path(config, pipeline_path=None):
+	if os.path.isfile(config):
+		return config
+	if pipeline_path == None:
+		pipeline_path = get_pipeline_path()
+	config_path = pipeline_path+'/config/%s.config' % config
+	if os.path.isfile(config_path):
+		return config_path
+	raise pims_error('The configuration %s does not exist.' % config)
+
+#Tools compiled by command_template, keyed by the fields of the tool that its command is made from, so that each tool is compiled once however many steps and scripts use it, and again if it is edited
+command_templates = dict()
+template_fields = ['COMMAND', 'FLAGS', 'OPTIONS', 'ARGUMENTS', 'THREAD_OPTION', 'THREADS']
+max_command_templates = 100000
+
+#Compiles a tool into a command template: (the COMMAND, the flags, the options and the arguments, in the order they are written). Each option is (name, what is written before its value, with the "<>" removed, whether it is the THREAD_OPTION). The thread count written for an empty THREAD_OPTION is worked out here too, or left as None if THREADS is not valid, for tool_command to report.
+def command_template(tool_dict):
+	key = tuple([tool_dict.get(field, '') for field in template_fields])
+	template = command_templates.get(key)
+	if template != None:
+		return template
+	thread_option = tool_dict.get('THREAD_OPTION', '')
+	flags = [flag for flag in tool_dict['FLAGS'].split(',') if flag != '']
+	options = [(opt, gtlt_pattern.sub('', opt), (thread_option != '') and (short_option_name(opt) == short_option_name(thread_option))) for opt in tool_dict['OPTIONS'].split(',') if opt != '']
+	arguments = [arg for arg in tool_dict['ARGUMENTS'].split(',') if arg != '']
+	try:
+		thread_value = '${%s:-%d}' % (thread_variable, tool_resources(tool_dict)[0])
+	except pims_error:
+		thread_value = None
+	template = (tool_dict['COMMAND']+' ', flags, options, arguments, thread_value)
+	if len(command_templates) >= max_command_templates:
+		command_templates.clear()
+	command_templates[key] = template
+	return template
+
+#Returns the command line for one tool, exactly as runpipeline_window writes it into a script: the COMMAND, then each flag that is switched on, then each option that has a value (with the "<>" removed and the value put in its place), then the value of each argument, each followed by a space. values is a dictionary like the ones made by parse_config_line. The tool is compiled once (see command_template), so that writing a step is a single pass over its values.
+def tool_command(tool_dict, values):
+	command, flags, options, arguments, thread_value = command_template(tool_dict)
+	cmd_list = [command]
+	flag_values = values['FLAGS']
+	for flag in flags:
+		if str(flag_values.get(flag, 0)) == '1':
+			cmd_list.append(flag+' ')
+	option_values = values['OPTIONS']
+	for opt, opt_text, is_thread_option in options:
+		opt_val = option_values.get(opt, '')
+		if (opt_val == '') and is_thread_option:
+			opt_val = thread_value if thread_value != None else '${%s:-%d}' % (thread_variable, tool_resources(tool_dict)[0])
+		if opt_val != '':
+			cmd_list.append('%s%s ' % (opt_text, opt_val))
+	argument_values = values['ARGUMENTS']
+	for arg in arguments:
+		arg_val = argument_values.get(arg, '')
+		if arg_val != '':
+			cmd_list.append('%s ' % arg_val)
+	return ''.join(cmd_list)
+
+#The shell variable that a tool's THREAD_OPTION is filled in from
+thread_variable = 'PIMS_THREADS'
+
+#Returns (threads, memory in bytes) as declared by a tool, defaulting to one thread and no particular amount of memory. Raises a pims_error if either is not valid.
+def tool_resources(tool_dict):
+	threads = 1
+	memory = 0
+	if tool_dict.get('THREADS', '') != '':
+		if not re.match(r'^\d+$', tool_dict['THREADS'].strip()) or (int(tool_dict['THREADS']) < 1):
+			raise pims_error('%s is not a valid number of threads for %s.' % (tool_dict['THREADS'], tool_dict['NAME']))
+		threads = int(tool_dict['THREADS'])
+	if tool_dict.get('MEMORY', '') != '':
+		memory = parse_size(tool_dict['MEMORY'])
+	return threads, memory
+
+#Returns the separate commands of a step line (split at pipes, ; and && or ||), leaving out the shell settings (set -o pipefail) that purpose_lines adds, and the directory change of a sweep or fan-out branch (see branch_lines). The line that makes the branch directories runs no tools.
+def step_commands(step_line):
+	if is_fork_line(step_line):
+		return []
+	#A step that runs a tool on chunks of its input (see scatter_command) runs the tool itself, and otherwise only splits and merges files
+	scatter_match = scatter_tool_pattern.match(split_branch_line(step_line)[1])
+	if scatter_match != None:
+		return [scatter_match.group(1).strip()]
+	commands = []
+	for part in re.split(r'\|\||&&|[|;]', split_branch_line(step_line)[1]):
+		part = part.strip()
+		if (part != '') and not part.startswith('set '):
+			commands.append(part)
+	return commands
+
+#Returns (threads, memory in bytes, number of tools taking a thread count) for a step of a script, adding up what each tool in it declares. A step line can hold several tools (joined by pipes when streaming); each part is matched to a tool by its command (see tool_registry.match_command), and parts that match no tool count as one thread.
+def step_resources(step_line, registry):
+	threads = 0
+	memory = 0
+	threaded_tools = 0
+	for part in step_commands(step_line):
+		tool_name = registry.match_command(part)
+		if tool_name == None:
+			threads += 1
+			continue
+		tool_dict = registry.get(tool_name)
+		try:
+			tool_threads, tool_memory = tool_resources(tool_dict)
+		except pims_error:
+			tool_threads, tool_memory = 1, 0
+		threads += tool_threads
+		memory += tool_memory
+		if tool_dict.get('THREAD_OPTION', '') != '':
+			threaded_tools += 1
+	return max(1, threads), memory, threaded_tools
+
+#Returns a copy of values changed as a tool's STDIN or STDOUT declaration (stream_field) says, for when that side of the tool is joined to another tool by a pipe
+def stream_values(tool_dict, values, stream_field):
+	declaration = tool_dict.get(stream_field, '')
+	if declaration in ['', 'yes']:
+		return values
+	name, equals, stream_value = declaration.partition('=')
+	new_values = {'FLAGS':dict(values['FLAGS']), 'OPTIONS':dict(values['OPTIONS']), 'ARGUMENTS':dict(values['ARGUMENTS'])}
+	for field in ['FLAGS', 'OPTIONS', 'ARGUMENTS']:
+		for param in tool_dict[field].split(','):
+			if (param != '') and ((param == name) or ((field == 'OPTIONS') and (short_option_name(param) == name))):
+				if field == 'FLAGS':
+					new_values[field][param] = 1 if stream_value == '1' else 0
+				else:
+					new_values[field][param] = stream_value
+	return new_values
+
+#Whether the active tool of one purpose can be joined to the active tool of the next purpose by a pipe: each purpose must have exactly one active tool, the first must be able to write to standard output and the second to read standard input. Tools that split their input into chunks (see scatter_command) need files, so are never joined.
+def streams_into(purpose_steps, next_purpose_steps):
+	if (len(purpose_steps) != 1) or (len(next_purpose_steps) != 1):
+		return False
+	if (purpose_steps[0][1].get('SPLIT', '') != '') or (next_purpose_steps[0][1].get('SPLIT', '') != ''):
+		return False
+	return (purpose_steps[0][1].get('STDOUT', '') != '') and (next_purpose_steps[0][1].get('STDIN', '') != '')
+
+#Scatter-gather, for tools that work on each part of their input separately (e.g. an aligner, over reads). A tool that declares SPLIT and MERGE (see tool_fields) is run by scatter_command instead of once: its step splits the input files into chunks in a <tool name>.chunks directory, runs the tool on every chunk at once, merges the chunk outputs into the files the tool would have written and removes the chunks. There is one chunk per thread the step was given (PIMS_THREADS, see tool_command) or, when the script is run by hand, per core, unless PIMS_CHUNKS is set; the threads are shared out between the chunks.
+#The shell variable that overrides the number of chunks
+chunk_variable = 'PIMS_CHUNKS'
+#Chunks made by splitting on lines are numbered 0000, 0001, ... so that they sort in order
+chunk_suffix_length = 4
+
+#Returns (field, name) for the option or argument of a tool that a SPLIT, MERGE, STDIN, etc. declaration names, given either in full or (for options) without the "<>", or None if the tool has none by that name
+def find_param(tool_dict, name):
+	for field in ['OPTIONS', 'ARGUMENTS']:
+		for param in tool_dict[field].split(','):
+			if (param != '') and ((param == name) or ((field == 'OPTIONS') and (short_option_name(param) == name))):
+				return field, param
+	return None
+
+#Splits the value of an option or argument naming a file into what comes before the path (e.g. a redirection, "> ") and the path itself, which is its last word
+def split_value_path(value):
+	words = value.rstrip().rsplit(None, 1)
+	if len(words) == 0:
+		return '', ''
+	return value[:value.rstrip().rfind(words[-1])], words[-1]
+
+#Returns the number of lines per record that a SPLIT_BY declaration splits on, or None if it names a command of its own. Raises a pims_error if it is not valid.
+def split_record_lines(tool_dict):
+	split_by = tool_dict.get('SPLIT_BY', '').strip()
+	if split_by in ['', 'lines']:
+		return 1
+	if not split_by.startswith('lines:'):
+		return None
+	if not re.match(r'^\d+$', split_by[len('lines:'):]) or (int(split_by[len('lines:'):]) < 1):
+		raise pims_error('%s is not a valid way to split the input of %s.' % (split_by, tool_dict['NAME']))
+	return int(split_by[len('lines:'):])
+
+#Returns the step line that runs a tool declaring SPLIT and MERGE on chunks of its input, as described above, or its usual command line if none of the files it splits has been given. Split by lines, every input file is split at the same records (the number of lines is counted in the first), so that chunk i of paired files belongs together; gzipped files are split after decompressing. A splitting command is given the input file, a prefix and the number of chunks, and must write each chunk to a file whose name starts with the prefix. Outputs are merged by concatenating the chunk outputs in order ("cat") or with a merging command, given the output file and then the chunk outputs (e.g. "samtools merge -f"). The step fails, leaving the chunks for inspection, if any chunk fails; they are cleared before the input is split again, so that a later run with fewer chunks does not pick up old ones.
+def scatter_command(tool_dict, values):
+	chunk_dir = '%s.chunks' % tool_dict['NAME']
+	chunk_values = {'FLAGS':values['FLAGS'], 'OPTIONS':dict(values['OPTIONS']), 'ARGUMENTS':dict(values['ARGUMENTS'])}
+	split_paths = []
+	merge_paths = []
+	for declared, kind, paths in [('SPLIT', 'in', split_paths), ('MERGE', 'out', merge_paths)]:
+		for name in [name.strip() for name in tool_dict.get(declared, '').split(',') if name.strip() != '']:
+			param = find_param(tool_dict, name)
+			if param == None:
+				raise pims_error('%s has no option or argument %s to %s.' % (tool_dict['NAME'], name, declared.lower()))
+			prefix, path = split_value_path(str(values[param[0]].get(param[1], '')))
+			if path == '':
+				continue
+			chunk_values[param[0]][param[1]] = '%s%s/%s%d.$i' % (prefix, chunk_dir, kind, len(paths))
+			paths.append(path)
+	if len(split_paths) == 0:
+		return tool_command(tool_dict, values)
+	record_lines = split_record_lines(tool_dict)
+	parts = ['rm -rf %s' % chunk_dir, 'mkdir -p %s' % chunk_dir, 'p=${%s:-$(nproc)}' % thread_variable, 'n=${%s:-$p}' % chunk_variable, 't=$(( p/n > 0 ? p/n : 1 ))']
+	for k, path in enumerate(split_paths):
+		chunk_prefix = '%s/in%d.' % (chunk_dir, k)
+		if record_lines == None:
+			parts.append('%s %s %s $n' % (tool_dict['SPLIT_BY'].strip(), path, chunk_prefix))
+			continue
+		gzipped = path.endswith('.gz')
+		if k == 0:
+			#Lines per chunk: the records are shared out evenly, and at least one record goes in each chunk
+			parts.append('r=$(( ($(%s)/%d+n-1)/n ))' % ('gzip -dc %s | wc -l' % path if gzipped else 'wc -l < %s' % path, record_lines))
+			parts.append('r=$(( (r > 0 ? r : 1)*%d ))' % record_lines)
+		if gzipped:
+			parts.append('gzip -dc %s | split -d -a %d -l $r - %s' % (path, chunk_suffix_length, chunk_prefix))
+		else:
+			parts.append('split -d -a %d -l $r %s %s' % (chunk_suffix_length, path, chunk_prefix))
+		#An empty input gives no chunks, but the tool is still run once, on an empty chunk
+		parts.append('{ [ -e %s%s ] || : > %s%s; }' % (chunk_prefix, '0'*chunk_suffix_length, chunk_prefix, '0'*chunk_suffix_length))
+	parts.append('pids=')
+	parts.append('for c in %s/in0.*; do i=${c#%s/in0.}; (%s=$t; %s) & pids="$pids $!"; done' % (chunk_dir, chunk_dir, thread_variable, tool_command(tool_dict, chunk_values).rstrip(' ')))
+	parts.append('failed=0')
+	parts.append('for pid in $pids; do wait $pid || failed=1; done')
+	parts.append('[ $failed -eq 0 ]')
+	merge_by = tool_dict.get('MERGE_BY', '').strip()
+	for k, path in enumerate(merge_paths):
+		if merge_by in ['', 'cat']:
+			parts.append('cat %s/out%d.* > %s' % (chunk_dir, k, path))
+		else:
+			parts.append('%s %s %s/out%d.*' % (merge_by, path, chunk_dir, k))
+	parts.append('rm -rf %s' % chunk_dir)
+	return 'set -o pipefail; '+' && '.join(parts)
+
+#Picks out the tool's own command from a step line made by scatter_command
+scatter_tool_pattern = re.compile(r'^set -o pipefail; rm -rf \S+\.chunks && mkdir -p \S+\.chunks && .*; do i=\$\{c#\S+\}; \(%s=\$t; (.*)\) & pids="\$pids \$!"; done && ' % thread_variable)
+
+#Returns the command line a tool is run with in a step: its scatter_command if it splits its input, otherwise its tool_command
+def tool_line(tool_dict, values):
+	if tool_dict.get('SPLIT', '') != '':
+		return scatter_command(tool_dict, values)
+	return tool_command(tool_dict, values)
+
+#Returns the command lines of a pipeline, one per active tool, in running order, as written into a script. With stream set, runs of consecutive purposes whose tools can be joined (see streams_into) are written as a single shell pipeline instead, so that the stages run at the same time and the intermediate files are never written to disk. pipefail makes the pipeline fail if any stage fails, not just the last.
+def purpose_lines(steps, stream=False):
+	return [line for purpose_nums, line_steps, line in purpose_groups(steps, stream)]
+
+#As purpose_lines, but returns (purpose numbers, tools, line) for each line, with the positions in steps of the purposes it runs and the (tool_name, tool_dict, values) of the tools in it. A purpose with no active tool gives an empty line.
+def purpose_groups(steps, stream=False):
+	groups = []
+	i = 0
+	while i < len(steps):
+		group = [i]
+		if stream:
+			while (group[-1]+1 < len(steps)) and streams_into(steps[group[-1]], steps[group[-1]+1]):
+				group.append(group[-1]+1)
+		if len(group) == 1:
+			if len(steps[i]) == 0:
+				groups.append((group, [], ''))
+			#Several active tools of a purpose each get a line of their own, and run one after the other
+			for tool_step in steps[i]:
+				groups.append((group, [tool_step], tool_line(tool_step[1], tool_step[2])))
+		else:
+			cmd_list = []
+			for k, purpose_num in enumerate(group):
+				tool_name, tool_dict, values = steps[purpose_num][0]
+				if k > 0:
+					values = stream_values(tool_dict, values, 'STDIN')
+				if k < len(group)-1:
+					values = stream_values(tool_dict, values, 'STDOUT')
+				cmd_list.append(tool_command(tool_dict, values).rstrip(' '))
+			groups.append((group, [steps[purpose_num][0] for purpose_num in group], 'set -o pipefail; '+' | '.join(cmd_list)))
+		i = group[-1]+1
+	return groups
+
+#Parameter sweeps. With sweep set, the value of an option or argument can hold lists ({5,10,20}) and ranges ({10..30}, or {10..30..5} in steps of 5, with decimals if need be), written as in bash and anywhere in the value (e.g. reads_{1..3}.fq). The script then runs every combination of the values. It is laid out as a tree: steps that are the same for every combination run once in the run directory, and where the combinations part, each branch gets its own subdirectory (named after the values it was given, e.g. trim.q=5), holding links to the files made before it and a PARAMS file listing its values, in which its own steps run. Each step therefore runs once for all the combinations that share it and everything before it, and the work grows with the number of different steps rather than the number of combinations. The script is still made of one line per step, so it can be run by hand, by pims_run (incrementally, with the output cache, etc.) or on a cluster like any other. Run by hand, the branches run one after the other; pims_run runs them at the same time (see step_parents).
+sweep_group_pattern = re.compile(r'(?<!\$)\{([^{}]*)\}')
+sweep_range_pattern = re.compile(r'^(-?\d+(?:\.\d+)?)\.\.(-?\d+(?:\.\d+)?)(?:\.\.(\d+(?:\.\d+)?))?$')
+#Most combinations a single script may run
+max_sweep_variants = 10000
+
+#Returns the values of a range such as 10..30..5, as strings with as many decimal places as the start, end or step has
+def sweep_range(start_str, end_str, step_str):
+	decimals = max([len(num_str.partition('.')[2]) for num_str in [start_str, end_str, step_str or '1']])
+	start, end, step = float(start_str), float(end_str), float(step_str or '1')
+	if step == 0:
+		raise pims_error('The sweep range %s..%s..%s has a step of 0.' % (start_str, end_str, step_str))
+	count = int(abs(end-start)/step+1e-9)+1
+	direction = 1 if end >= start else -1
+	return ['%.*f' % (decimals, start+direction*step*i) for i in range(count)]
+
+#Returns every value that a value with sweep lists and ranges stands for, in order (just the value itself if it has none)
+def sweep_values(value):
+	for group_match in sweep_group_pattern.finditer(value):
+		range_match = sweep_range_pattern.match(group_match.group(1))
+		if range_match != None:
+			items = sweep_range(*range_match.groups())
+		elif ',' in group_match.group(1):
+			items = group_match.group(1).split(',')
+		else:
+			continue
+		prefix = value[:group_match.start()]
+		return [prefix+item+rest for item in items for rest in sweep_values(value[group_match.end():])]
+	return [value]
+
+#Returns every combination of the values swept in a pipeline, as [(choices, steps)], where steps is laid out as config_steps returns them but with single values, and choices lists the values picked as (purpose number, tool name, option or argument name, value). Raises a pims_error if there are more than max_sweep_variants combinations.
+def sweep_variants(steps):
+	swept = []
+	for purpose_num, purpose_steps in enumerate(steps):
+		for tool_num, (tool_name, tool_dict, values) in enumerate(purpose_steps):
+			for field in ['OPTIONS', 'ARGUMENTS']:
+				for name in tool_dict[field].split(','):
+					value = str(values[field].get(name, ''))
+					value_list = sweep_values(value)
+					if (name != '') and (value_list != [value]):
+						swept.append((purpose_num, tool_num, field, name, value_list))
+	variant_count = 1
+	for purpose_num, tool_num, field, name, value_list in swept:
+		variant_count *= len(value_list)
+	if variant_count > max_sweep_variants:
+		raise pims_error('The sweep has %d combinations of values, more than the %d one script can run.' % (variant_count, max_sweep_variants))
+	variants = [([], steps)]
+	for purpose_num, tool_num, field, name, value_list in swept:
+		new_variants = []
+		for choices, variant_steps in variants:
+			tool_name, tool_dict, values = variant_steps[purpose_num][tool_num]
+			for value in value_list:
+				new_values = dict(values)
+				new_values[field] = dict(values[field])
+				new_values[field][name] = value
+				new_steps = list(variant_steps)
+				new_steps[purpose_num] = list(variant_steps[purpose_num])
+				new_steps[purpose_num][tool_num] = (tool_name, tool_dict, new_values)
+				new_variants.append((choices+[(purpose_num, tool_name, name, value)], new_steps))
+		variants = new_variants
+	return variants
+
+#Fan-out. With fan_out set, a purpose can have several active tools, and rather than running them one after the other in the run directory, the pipeline parts into a branch for each of them, each with its own copy of every step after it. The branches are laid out as for a sweep: steps before the fan-out run once, and each branch runs in its own subdirectory, named after its tool (e.g. bwa), so that two aligners can be compared without running everything before them twice. A fan-out in several purposes gives a branch for every combination of their tools, and can be combined with a sweep.
+#Returns every combination of the tools of the purposes with more than one active tool, as [(choices, steps)] laid out as sweep_variants returns them, each with one tool in those purposes. A tool picked is given in choices as (purpose number, purpose, None, tool name). Raises a pims_error if there are more than max_sweep_variants combinations.
+def fan_out_variants(steps):
+	variant_count = 1
+	for purpose_steps in steps:
+		variant_count *= max(1, len(purpose_steps))
+	if variant_count > max_sweep_variants:
+		raise pims_error('The fan-out has %d combinations of tools, more than the %d one script can run.' % (variant_count, max_sweep_variants))
+	variants = [([], steps)]
+	for purpose_num, purpose_steps in enumerate(steps):
+		if len(purpose_steps) < 2:
+			continue
+		new_variants = []
+		for choices, variant_steps in variants:
+			for tool_name, tool_dict, values in purpose_steps:
+				new_steps = list(variant_steps)
+				new_steps[purpose_num] = [(tool_name, tool_dict, values)]
+				new_variants.append((choices+[(purpose_num, tool_dict['PURPOSE'], None, tool_name)], new_steps))
+		variants = new_variants
+	return variants
+
+#Returns the variants of a pipeline that a script with sweep and/or fan_out set runs: every combination of tools, each with every combination of the values swept in it
+def pipeline_variants(steps, sweep=False, fan_out=False):
+	variants = fan_out_variants(steps) if fan_out else [([], steps)]
+	if sweep:
+		variants = [(choices+sweep_choices, sweep_steps) for choices, variant_steps in variants for sweep_choices, sweep_steps in sweep_variants(variant_steps)]
+	if len(variants) > max_sweep_variants:
+		raise pims_error('The pipeline has %d combinations of tools and values, more than the %d one script can run.' % (len(variants), max_sweep_variants))
+	return variants
+
+#Returns the name of a branch or combination: each value picked, as tool.option=value (e.g. trim.q=5), and each tool picked by a fan-out (unless a value of it was picked, which already names it), joined by +. Only characters that need no quoting in the shell are kept.
+def sweep_label(choices):
+	parts = []
+	value_tools = set([choice[1] for choice in choices if choice[2] != None])
+	for purpose_num, tool_name, name, value in choices:
+		if (name == None) and (value in value_tools):
+			continue
+		elif name == None:
+			parts.append(re.sub(r'[^\w.-]+', '-', value).strip('-'))
+		else:
+			parts.append('%s.%s=%s' % (tool_name, re.sub(r'[^\w.-]+', '-', short_option_name(name)).strip('-'), re.sub(r'[^\w.-]+', '-', value).strip('-')))
+	return '+'.join(parts)
+
+#The line of a branch's PARAMS file for a choice: tool, option and value, or the purpose and the tool picked for it
+def params_line(choice):
+	purpose_num, tool_name, name, value = choice
+	if name == None:
+		return '%s %s' % (tool_name, value)
+	return '%s %s %s' % (tool_name, short_option_name(name), value)
+
+#Quotes text for the shell
+def shell_quote(text):
+	return "'%s'" % text.replace("'", "'\\''")
+
+#A step of a sweep branch is run in the branch's directory, in a subshell so that a script run by hand stays in the run directory
+branch_line_pattern = re.compile(r'^\(cd (\S+) \|\| exit 1; (.*)\)$')
+#The line that makes the branch directories where a sweep or fan-out parts (see fork_line)
+fork_line_pattern = re.compile(r'^mkdir -p .* && for f in \*; do ')
+
+def branch_line(dir_path, line):
+	if dir_path == '':
+		return line
+	return '(cd %s || exit 1; %s)' % (dir_path, line)
+
+#Returns (branch directory, command line) for a step line of a script; the directory is '' for steps that run in the run directory itself
+def split_branch_line(step_line):
+	branch_match = branch_line_pattern.match(step_line)
+	if branch_match == None:
+		return '', step_line
+	return branch_match.group(1), branch_match.group(2)
+
+def is_fork_line(step_line):
+	return fork_line_pattern.match(split_branch_line(step_line)[1]) != None
+
+#Returns the line that makes the branch directories (labels) in the current directory, links the files and directories already there into each (apart from those PIMS keeps for itself), and writes each branch's PARAMS file. Files that are already there are left alone, so that it can be run again.
+def fork_line(labels, params_lines):
+	label_words = ' '.join(labels)
+	line = 'mkdir -p %s && for f in *; do case "$f" in %s|NOTE|PARAMS|PIMS.*|*.script) continue;; esac; [ -e "$f" ] || continue; for d in %s; do [ -e "$d/$f" ] || ln -s "../$f" "$d/$f"; done; done' % (label_words, '|'.join(labels), label_words)
+	for label, branch_params in zip(labels, params_lines):
+		line += '; printf %s %s > %s/PARAMS' % (shell_quote('%s\\n'), ' '.join([shell_quote(param_line) for param_line in branch_params]), label)
+	return line
+
+#Returns the step lines of a sweep and/or fan-out (see pipeline_variants), laid out as a tree as described above. With no values swept and no purpose fanning out, these are just the purpose_lines.
+def branch_lines(steps, stream=False, sweep=False, fan_out=False):
+	variants = pipeline_variants(steps, sweep, fan_out)
+	if len(variants) == 1:
+		return [line for line in purpose_lines(variants[0][1], stream) if line != '']
+	#A tree of the lines, each node being one line that some of the combinations share along with every line before it
+	root = {'children':[], 'by_line':dict()}
+	for choices, variant_steps in variants:
+		node = root
+		for purpose_nums, line_steps, line in purpose_groups(variant_steps, stream):
+			if line == '':
+				continue
+			if line not in node['by_line']:
+				child = {'line':line, 'purposes':purpose_nums, 'choices':choices, 'children':[], 'by_line':dict()}
+				node['by_line'][line] = child
+				node['children'].append(child)
+			node = node['by_line'][line]
+	lines = []
+	add_sweep_branches(root['children'], '', lines)
+	return lines
+
+#Adds the lines for the nodes below a point of the tree, in the directory dir_path: lines shared by every node are run there, and at the first line that differs each node gets a branch directory, named after the tools and values that differ. Different tools sweep different values, so the choices are matched up by what was picked (purpose, tool and option) rather than by position.
+def add_sweep_branches(children, dir_path, lines):
+	while len(children) == 1:
+		lines.append(branch_line(dir_path, children[0]['line']))
+		children = children[0]['children']
+	if len(children) == 0:
+		return None
+	purposes = children[0]['purposes']
+	child_choices = [dict((choice[:3], choice[3]) for choice in child['choices']) for child in children]
+	differing = set()
+	for child in children:
+		for choice in child['choices']:
+			if (choice[0] in purposes) and (len(set([this_choices.get(choice[:3]) for this_choices in child_choices])) > 1):
+				differing.add(choice[:3])
+	labels = []
+	params_lines = []
+	for child in children:
+		label = sweep_label([choice for choice in child['choices'] if choice[:3] in differing]) or 'branch'
+		while label in labels:
+			label += '_'
+		labels.append(label)
+		#Every tool and value picked up to this point, for the PARAMS file
+		params_lines.append([params_line(choice) for choice in sorted(child['choices'], key=lambda choice: choice[0]) if choice[0] <= max(purposes)])
+	lines.append(branch_line(dir_path, fork_line(labels, params_lines)))
+	for child, label in zip(children, labels):
+		child_path = label if dir_path == '' else dir_path+'/'+label
+		lines.append(branch_line(child_path, child['line']))
+		add_sweep_branches(child['children'], child_path, lines)
+	return None
+
+#Returns the step lines of a script: the purpose_lines, or with sweep or fan_out set the branch_lines
+def script_lines(steps, stream=False, sweep=False, fan_out=False):
+	if sweep or fan_out:
+		return branch_lines(steps, stream, sweep, fan_out)
+	return purpose_lines(steps, stream)
+
+#Returns, for each step line of a script, the number of the line it has to wait for (or -1 if none): the last line before it that runs in its own branch directory or in one above it. Lines of different branches do not wait for each other, so they can be run at the same time; in a script with no branches each line waits for the one before it.
+def step_parents(step_lines):
+	parents = []
+	last_in_dir = dict()
+	for step_num, step_line in enumerate(step_lines):
+		branch_dir = split_branch_line(step_line)[0]
+		dir_parts = branch_dir.split('/') if branch_dir != '' else []
+		parents.append(max([last_in_dir.get('/'.join(dir_parts[:i]), -1) for i in range(len(dir_parts)+1)]))
+		last_in_dir[branch_dir] = step_num
+	return parents
+
+#For checking the pipelines of a sweep or fan-out (see pims_check.py): returns the pipelines (script_name, note_str, steps) with each one that has branches replaced by one per combination, named <script name>[<tools and values>]
+def variant_pipelines(pipelines, sweep=False, fan_out=False):
+	expanded = []
+	for script_name, note_str, steps in pipelines:
+		variants = pipeline_variants(steps, sweep, fan_out)
+		if len(variants) == 1:
+			expanded.append((script_name, note_str, variants[0][1]))
+			continue
+		for choices, variant_steps in variants:
+			expanded.append(('%s[%s]' % (script_name, sweep_label(choices)), note_str, variant_steps))
+	return expanded
+
+#Works out which tools a config runs, in running order. Returns a list with one item per purpose in purposes, each a list of (tool_name, tool_dict, config_entry) for the active tools of that purpose. Tools that are in the config but not in the registry are skipped with a warning, as load_config does.
+def config_steps(config_entries, purposes, registry):
+	steps = [[] for purpose in purposes]
+	purpose_pos = dict()
+	for i, purpose in enumerate(purposes):
+		purpose_pos.setdefault(purpose, i)
+	for config_entry in config_entries:
+		if config_entry['STATE'] != 'active':
+			continue
+		tool_dict = registry.get(config_entry['NAME'])
+		if tool_dict == None:
+			sys.stderr.write('The tool %s was found in the selected configuration file but does not seem to exist. Skipping to next line.\n' % config_entry['NAME'])
+			continue
+		if tool_dict['PURPOSE'] in purpose_pos:
+			steps[purpose_pos[tool_dict['PURPOSE']]].append((config_entry['NAME'], tool_dict, config_entry))
+	return steps
+
+#Returns the name of the timestamped directory that a script creates and runs in
+def run_dir_name(script_name, timestamp=None):
+	if timestamp == None:
+		timestamp = time.time()
+	return script_name+'_'+time.strftime("%Y%m%d_%H%M%S", time.localtime(timestamp))
+
+#Returns the text of a pipeline script. The script will create a new, timestamped directory from which it will be run, and which should hold all of the output files from each tool. It places a copy of itself in this new directory, for the sake of record-keeping, writes the note to a NOTE file, runs one line per active tool (or per streamed group of purposes, see purpose_lines, or per step of a sweep or fan-out, see branch_lines) and, at the end, deletes itself. steps is laid out as returned by config_steps.
+@pims_trace.traced('render_script')
+def render_script(script_name, note_str, steps, new_dir, stream=False, sweep=False, fan_out=False):
+	script_list = ["#!/bin/bash\n"]
+	script_list.append("mkdir %s\n" % new_dir)
+	script_list.append("cp %s.script %s/%s.script\n" % (script_name, new_dir, script_name))
+	script_list.append("cd %s\n" % new_dir)
+	script_list.append("echo \"%s\" > NOTE\n" % note_str)
+	for line in script_lines(steps, stream, sweep, fan_out):
+		script_list.append(line+'\n')
+	script_list.append("cd ..\nrm %s.script\n" % script_name)
+	return ''.join(script_list)
+
+#Reads back a script written by render_script. Returns (script_name, note_str, run_dir, step_lines), where step_lines holds the command line of each purpose in running order (purposes with no active tool are left out). Raises a pims_error if the file does not look like a PIMS script.
+def parse_script(script_path):
+	script_file = open(script_path, 'r')
+	lines = [line.rstrip('\n') for line in script_file]
+	script_file.close()
+	script_name = os.path.basename(script_path).split('.')[0]
+	note_match = re.match(r'^echo "(.*)" > NOTE$', lines[4]) if len(lines) > 4 else None
+	if (len(lines) < 7) or (lines[0] != '#!/bin/bash') or (not lines[1].startswith('mkdir ')) or (note_match == None) or (lines[-2:] != ['cd ..', 'rm %s.script' % script_name]):
+		raise pims_error('%s is not a PIMS script.' % script_path)
+	run_dir = lines[1][len('mkdir '):]
+	step_lines = [line for line in lines[5:-2] if line.strip() != '']
+	return script_name, note_match.group(1), run_dir, step_lines
+
+#Finds a script given either a path or the name of a script in ~/pipeline/scripts
+def resolve_script_path(script, pipeline_path=None):
+	if os.path.isfile(script):
+		return script
+	if pipeline_path == None:
+		pipeline_path = get_pipeline_path()
+	script_path = pipeline_path+'/scripts/%s.script' % script
+	if os.path.isfile(script_path):
+		return script_path
+	raise pims_error('The script %s does not exist.' % script)
+
+#Checks a script name and writes the script text to <scripts_path>/<script_name>.script, refusing to replace an existing script unless overwrite is set. Returns the path written.
+@pims_trace.traced('write_script_file')
+def write_script_file(script_name, script_text, scripts_path=None, overwrite=False):
+	if not re.match(name_pattern, script_name):
+		raise pims_error('%s is not a valid file name. File names should contain only alphanumeric characters, underscores and hyphens.' % script_name)
+	if scripts_path == None:
+		scripts_path = get_pipeline_path()+'/scripts/'
+	script_path = os.path.join(scripts_path, '%s.script' % script_name)
+	if os.path.exists(script_path) and not overwrite:
+		raise pims_error('A file with the name %s already exists. Please choose another name.' % script_name)
+	script_file = open(script_path, 'w')
+	script_file.write(script_text)
+	script_file.close()
+	return script_path
+
+#Turns a saved configuration into a script without the GUI. config_path is a config file, purposes is the running order of the purposes, and the script is written to scripts_path (~/pipeline/scripts by default). A registry can be passed in to avoid re-reading tool files when compiling many scripts, and a pims_history.run_history to record the script in. Returns the path of the script.
+@pims_trace.traced('compile_config')
+def compile_config(config_path, purposes, script_name, note_str='', scripts_path=None, registry=None, timestamp=None, overwrite=False, stream=False, history=None, sweep=False, fan_out=False):
+	if registry == None:
+		registry = tool_registry()
+	if scripts_path == None:
+		scripts_path = get_pipeline_path()+'/scripts/'
+	if timestamp == None:
+		timestamp = time.time()
+	steps = config_steps(read_config(config_path), purposes, registry)
+	script_text = render_script(script_name, note_str, steps, run_dir_name(script_name, timestamp), stream, sweep, fan_out)
+	script_path = write_script_file(script_name, script_text, scripts_path, overwrite)
+	if history != None:
+		history.record_scripts([(script_name, note_str, steps)], scripts_path, timestamp, stream, sweep, fan_out)
+	return script_path
+
+#Sample sheets are CSV (or, for .tsv/.tab/.txt files, tab separated) files with one row per sample and a header row naming the columns. The "name" column gives the script name for each row and the optional "note" column its note. Every other column names a flag, option or argument of one of the active tools in the template configuration, either as TOOL.PARAM or, where only one active tool has that parameter, just PARAM. Options can be named in full (e.g. "-t <>") or without the "<>" (e.g. "-t" or "--min" for "--min=<>"). Empty cells leave the template value as it is. Flags are switched on by 1, true or yes and off by anything else.
+sheet_reserved_columns = ['name', 'note']
+
+def read_sample_sheet(sheet_path):
+	if re.search(r'\.(tsv|tab|txt)$', sheet_path):
+		delimiter = '\t'
+	else:
+		delimiter = ','
+	sheet_file = open(sheet_path, 'r')
+	rows = [row for row in csv.reader(sheet_file, delimiter=delimiter) if len(row) > 0]
+	sheet_file.close()
+	if len(rows) == 0:
+		raise pims_error('The sample sheet %s is empty.' % sheet_path)
+	return [col.strip() for col in rows[0]], rows[1:]
+
+#Returns the option name as it would be written on the command line, without the "<>" and the separator before it
+def short_option_name(opt):
+	return gtlt_pattern.sub('', opt).rstrip('= ')
+
+#Finds which flag, option or argument of which step a sample sheet column refers to. Returns (purpose index, step index, field, name), or raises a pims_error if the column matches nothing or more than one tool.
+def match_sheet_column(column, steps):
+	if '.' in column:
+		tool_part, param = column.split('.', 1)
+	else:
+		tool_part, param = None, column
+	matches = []
+	for i, purpose_steps in enumerate(steps):
+		for j, (tool_name, tool_dict, values) in enumerate(purpose_steps):
+			if (tool_part != None) and (tool_part != tool_name):
+				continue
+			for field in ['FLAGS', 'OPTIONS', 'ARGUMENTS']:
+				for name in tool_dict[field].split(','):
+					if (name != '') and ((name == param) or ((field == 'OPTIONS') and (short_option_name(name) == param))):
+						matches.append((i, j, field, name))
+	if len(matches) == 0:
+		raise pims_error('The sample sheet column %s does not match a flag, option or argument of any active tool.' % column)
+	if len(matches) > 1:
+		raise pims_error('The sample sheet column %s matches more than one tool. Use TOOL.%s to choose one.' % (column, param))
+	return matches[0]
+
+#Expands a template configuration and a sample sheet into one pipeline per row. The template and the tool definitions are read once and each column is matched to its step once, so each row only costs copying the values of the tools it changes. Returns a list of (script_name, note_str, steps), with steps laid out as returned by config_steps.
+def batch_pipelines(config_path, purposes, sheet_path, registry=None, name_prefix='', default_note=''):
+	if registry == None:
+		registry = tool_registry()
+	steps = config_steps(read_config(config_path), purposes, registry)
+	header, rows = read_sample_sheet(sheet_path)
+	lower_header = [col.lower() for col in header]
+	if 'name' not in lower_header:
+		raise pims_error('The sample sheet %s has no "name" column.' % sheet_path)
+	name_col = lower_header.index('name')
+	note_col = lower_header.index('note') if 'note' in lower_header else None
+	column_map = []
+	for col_num, column in enumerate(header):
+		if lower_header[col_num] in sheet_reserved_columns:
+			continue
+		column_map.append((col_num,) + match_sheet_column(column, steps))
+
+	pipelines = []
+	seen_names = set()
+	for row in rows:
+		row = row + ['']*(len(header)-len(row))
+		script_name = name_prefix+row[name_col].strip()
+		if not re.match(name_pattern, script_name):
+			raise pims_error('%s is not a valid file name. File names should contain only alphanumeric characters, underscores and hyphens.' % script_name)
+		if script_name in seen_names:
+			raise pims_error('%s has already been entered.' % script_name)
+		seen_names.add(script_name)
+		note_str = row[note_col] if note_col != None else default_note
+		row_steps = [list(purpose_steps) for purpose_steps in steps]
+		copied = set()
+		for col_num, i, j, field, name in column_map:
+			cell = row[col_num].strip()
+			if cell == '':
+				continue
+			tool_name, tool_dict, values = row_steps[i][j]
+			if (i, j) not in copied:
+				values = dict(values)
+				for f in ['FLAGS', 'OPTIONS', 'ARGUMENTS']:
+					values[f] = dict(values[f])
+				row_steps[i][j] = (tool_name, tool_dict, values)
+				copied.add((i, j))
+			if field == 'FLAGS':
+				cell = 1 if cell.lower() in ['1', 'true', 'yes', 'y'] else 0
+			values[field][name] = cell
+		pipelines.append((script_name, note_str, row_steps))
+	return pipelines
+
+#Writes one script per row of a sample sheet into scripts_path (~/pipeline/scripts by default), all with the same timestamp. Every row is checked before anything is written, so a bad sheet does not leave half a batch behind. With a pims_history.run_history, the whole batch is recorded in it. Returns the paths of the scripts.
+def compile_batch(config_path, purposes, sheet_path, scripts_path=None, registry=None, timestamp=None, overwrite=False, name_prefix='', default_note='', stream=False, history=None, sweep=False, fan_out=False):
+	if scripts_path == None:
+		scripts_path = get_pipeline_path()+'/scripts/'
+	if timestamp == None:
+		timestamp = time.time()
+	pipelines = batch_pipelines(config_path, purposes, sheet_path, registry, name_prefix, default_note)
+	if not overwrite:
+		existing = set(os.listdir(scripts_path))
+		for script_name, note_str, steps in pipelines:
+			if '%s.script' % script_name in existing:
+				raise pims_error('A file with the name %s already exists. Please choose another name.' % script_name)
+	#The whole sheet has been checked by now, so the scripts are written without checking again
+	script_paths = []
+	for script_name, note_str, steps in pipelines:
+		script_text = render_script(script_name, note_str, steps, run_dir_name(script_name, timestamp), stream, sweep, fan_out)
+		script_paths.append(write_script_file(script_name, script_text, scripts_path, overwrite=True))
+	if history != None:
+		history.record_scripts(pipelines, scripts_path, timestamp, stream, sweep, fan_out)
+	return script_paths
@@ -0,0 +1,338 @@
+#This is part of the source code for the Pipeline Interface and Management System (PIMS). PIMS was created by Joseph Gardner, Dept. of Genetics, University of Cambridge, UK, and is licensed under the Creative Commons Attribution-ShareAlike 4.0 International (CC BY-SA 4.0) license. See pims_v0.1.py or https://github.com/jg600/PIMS for full licensing information.
+
+#A record of every script generated and every run made, in an SQLite database (~/pipeline/history.sqlite), so that questions such as "which runs used bwa with -t 8 last month" are answered from an index rather than by looking through thousands of run directories. Each pipeline is one row of runs, keyed by its run directory, with the tools it runs (tools), the value of every flag, option and argument that was set (params) and its command lines (steps). Scripts are recorded when they are written (from the known tool values), and runs when pims_run starts and finishes them; run directories made before there was a history, or by running scripts by hand, can be added with index_run_dirs, which reads back the script copy in each. Like pims_core.py, this does not import Tkinter.
+
+import os
+import re
+import shlex
+import sqlite3
+import sys
+import threading
+import time
+import pims_core
+import pims_run
+
+history_name = 'history.sqlite'
+
+schema = '''
+CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, script_name TEXT NOT NULL, script_path TEXT, run_dir TEXT UNIQUE, note TEXT, created REAL, started REAL, finished REAL, exit_code INTEGER, status TEXT, time REAL);
+CREATE TABLE IF NOT EXISTS tools (run_id INTEGER NOT NULL, step INTEGER, tool TEXT, purpose TEXT);
+CREATE TABLE IF NOT EXISTS params (run_id INTEGER NOT NULL, tool TEXT, field TEXT, name TEXT, value TEXT);
+CREATE TABLE IF NOT EXISTS steps (run_id INTEGER NOT NULL, step INTEGER, command TEXT);
+CREATE INDEX IF NOT EXISTS runs_time ON runs (time);
+CREATE INDEX IF NOT EXISTS runs_script_name ON runs (script_name, time);
+CREATE INDEX IF NOT EXISTS runs_script_path ON runs (script_path);
+CREATE INDEX IF NOT EXISTS runs_status ON runs (status, time);
+CREATE INDEX IF NOT EXISTS tools_tool ON tools (tool, run_id);
+CREATE INDEX IF NOT EXISTS tools_run ON tools (run_id, tool);
+CREATE INDEX IF NOT EXISTS params_name ON params (name, value, run_id);
+CREATE INDEX IF NOT EXISTS params_run ON params (run_id, name, value);
+CREATE INDEX IF NOT EXISTS steps_run ON steps (run_id);
+'''
+
+#Number of runs a tool or parameter condition can match and still be used to pick out the runs, rather than checking the runs in time order (see run_history.find_runs)
+selective_count = 1000
+
+#Returns the run_history to record in: ~/pipeline/history.sqlite, or the database named by PIMS_HISTORY, or None if PIMS_HISTORY is "off" or, when it is not set, if there is no ~/pipeline directory (e.g. on a compute node), where the database could not be made
+def default_history():
+	db_path = os.getenv('PIMS_HISTORY')
+	if db_path == 'off':
+		return None
+	if (db_path == None) and (not os.path.isdir(pims_core.get_pipeline_path())):
+		return None
+	return run_history(db_path or None)
+
+#Run directories are named <script name>_<YYYYmmdd>_<HHMMSS> (see pims_core.run_dir_name)
+run_dir_pattern = re.compile(r'^([\w-]+)_(\d{8}_\d{6})(_\d+)?$')
+
+#Returns the tools and parameters of a pipeline, as rows for the tools and params tables (without the run id), from steps laid out as by pims_core.config_steps. Options are recorded by their short name (e.g. "-t" for "-t <>"), as sample sheets name them, and flags that are switched on with the value 1. For a sweep, each value swept is recorded, so that the sweep is found by any of them.
+def pipeline_rows(steps, sweep=False):
+	tool_rows = []
+	param_rows = []
+	step_num = 0
+	for purpose_steps in steps:
+		if len(purpose_steps) == 0:
+			continue
+		step_num += 1
+		for tool_name, tool_dict, values in purpose_steps:
+			tool_rows.append((step_num, tool_name, tool_dict['PURPOSE']))
+			for field in ['FLAGS', 'OPTIONS', 'ARGUMENTS']:
+				for name in tool_dict[field].split(','):
+					value = str(values[field].get(name, ''))
+					if (name == '') or (value == '') or ((field == 'FLAGS') and (value != '1')):
+						continue
+					for this_value in (pims_core.sweep_values(value) if sweep and (field != 'FLAGS') else [value]):
+						param_rows.append((tool_name, field, pims_core.short_option_name(name) if field == 'OPTIONS' else name, this_value))
+	return tool_rows, param_rows
+
+#Works out, as well as can be done from a command line alone, the values a tool was run with: the flags it lists that appear, the options it lists with the value that follows them, and the remaining words as its arguments, in order. Used for run directories made without the history, where only the script is left. Returns a values dictionary like those made by pims_core.parse_config_line.
+def command_values(tool_dict, command):
+	values = {'FLAGS':dict(), 'OPTIONS':dict(), 'ARGUMENTS':dict()}
+	try:
+		words = shlex.split(command)[len(shlex.split(tool_dict['COMMAND'])):]
+	except ValueError:
+		return values
+	flags = set([flag for flag in tool_dict['FLAGS'].split(',') if flag != ''])
+	options = [opt for opt in tool_dict['OPTIONS'].split(',') if opt != '']
+	arguments = [arg for arg in tool_dict['ARGUMENTS'].split(',') if arg != '']
+	remaining = []
+	i = 0
+	while i < len(words):
+		word = words[i]
+		i += 1
+		if word in flags:
+			values['FLAGS'][word] = 1
+			continue
+		for opt in options:
+			opt_name = pims_core.short_option_name(opt)
+			#"-t <>" is written as "-t VALUE", "--min=<>" as "--min=VALUE"
+			if re.search(r'=<>$', opt) and word.startswith(opt_name+'='):
+				values['OPTIONS'][opt] = word[len(opt_name)+1:]
+				break
+			if (word == opt_name) and (i < len(words)):
+				values['OPTIONS'][opt] = words[i]
+				i += 1
+				break
+		else:
+			remaining.append(word)
+	#Redirections (e.g. "> out.txt") were written as argument values, so are kept with the word after them
+	joined = []
+	for word in remaining:
+		if (len(joined) > 0) and (joined[-1] in ['>', '>>', '<', '2>']):
+			joined[-1] = '%s %s' % (joined[-1], word)
+		else:
+			joined.append(word)
+	for arg, value in zip(arguments, joined):
+		values['ARGUMENTS'][arg] = value
+	return values
+
+#The run history database. Each method opens its own connection, so that one run_history can be shared by the threads running pipelines (see pims_run.job_manager); SQLite's own locking lets several PIMS processes use it at once. Failures to write the history are reported as warnings, so that they never stop a pipeline being written or run.
+class run_history:
+	def __init__(self, db_path=None):
+		if db_path == None:
+			db_path = os.path.join(pims_core.get_pipeline_path(), history_name)
+		self.db_path = db_path
+		self.schema_ready = False
+		#The first connection makes the tables if need be; the others wait for it, rather than changing the schema under each other
+		self.schema_lock = threading.Lock()
+
+	def connect(self):
+		connection = sqlite3.connect(self.db_path, timeout=30)
+		if not self.schema_ready:
+			with self.schema_lock:
+				if not self.schema_ready:
+					try:
+						connection.executescript(schema)
+					except sqlite3.Error:
+						connection.close()
+						raise
+					self.schema_ready = True
+		return connection
+
+	def warn(self, e):
+		sys.stderr.write('pims: the run history %s could not be updated: %s\n' % (self.db_path, e))
+		return None
+
+	#Adds one pipeline, replacing any earlier record of the same run directory. Called within a transaction.
+	def add_pipeline(self, cursor, script_name, script_path, run_dir, note_str, created, tool_rows, param_rows, step_lines):
+		self.delete_run(cursor, run_dir)
+		cursor.execute('INSERT INTO runs (script_name, script_path, run_dir, note, created, status, time) VALUES (?, ?, ?, ?, ?, ?, ?)', (script_name, script_path, run_dir, note_str, created, 'generated', created))
+		run_id = cursor.lastrowid
+		cursor.executemany('INSERT INTO tools (run_id, step, tool, purpose) VALUES (?, ?, ?, ?)', [(run_id,)+row for row in tool_rows])
+		cursor.executemany('INSERT INTO params (run_id, tool, field, name, value) VALUES (?, ?, ?, ?, ?)', [(run_id,)+row for row in param_rows])
+		cursor.executemany('INSERT INTO steps (run_id, step, command) VALUES (?, ?, ?)', [(run_id, step_num+1, line) for step_num, line in enumerate(step_lines)])
+		return run_id
+
+	def delete_run(self, cursor, run_dir):
+		for (run_id,) in cursor.execute('SELECT id FROM runs WHERE run_dir = ?', (run_dir,)).fetchall():
+			for table in ['tools', 'params', 'steps']:
+				cursor.execute('DELETE FROM %s WHERE run_id = ?' % table, (run_id,))
+			cursor.execute('DELETE FROM runs WHERE id = ?', (run_id,))
+		return None
+
+	#Records scripts that have just been written to scripts_path with the given timestamp: pipelines is a list of (script_name, note_str, steps) as made by pims_core.batch_pipelines. A whole batch is recorded in one transaction.
+	def record_scripts(self, pipelines, scripts_path, timestamp, stream=False, sweep=False, fan_out=False):
+		scripts_path = os.path.abspath(scripts_path)
+		try:
+			connection = self.connect()
+			try:
+				with connection:
+					cursor = connection.cursor()
+					for script_name, note_str, steps in pipelines:
+						tool_rows, param_rows = pipeline_rows(steps, sweep)
+						step_lines = [line for line in pims_core.script_lines(steps, stream, sweep, fan_out) if line != '']
+						self.add_pipeline(cursor, script_name, os.path.join(scripts_path, '%s.script' % script_name), os.path.join(scripts_path, pims_core.run_dir_name(script_name, timestamp)), note_str, timestamp, tool_rows, param_rows, step_lines)
+			finally:
+				connection.close()
+		except sqlite3.Error as e:
+			self.warn(e)
+		return None
+
+	#Records that a pims_run.pipeline_run has started, in the run directory it has made. The record made when its script was written is used if there is one (looked up by run directory, or, for a run in another directory, by script); otherwise one is made from the script itself. Returns the id of the record, for run_finished, or None if it could not be written.
+	def run_started(self, run, start, registry=None):
+		run_id = None
+		try:
+			connection = self.connect()
+			try:
+				with connection:
+					cursor = connection.cursor()
+					row = cursor.execute('SELECT id FROM runs WHERE run_dir = ?', (run.run_dir,)).fetchone()
+					if row == None:
+						row = cursor.execute('SELECT id FROM runs WHERE script_path = ? AND started IS NULL ORDER BY id DESC LIMIT 1', (run.script_path,)).fetchone()
+					if row == None:
+						run_id = self.add_script(cursor, run.script_name, run.script_path, run.run_dir, run.note_str, start, run.step_lines, registry)
+					else:
+						run_id = row[0]
+					cursor.execute('UPDATE runs SET run_dir = ?, started = ?, finished = NULL, exit_code = NULL, status = ?, time = ? WHERE id = ?', (run.run_dir, start, 'running', start, run_id))
+			finally:
+				connection.close()
+		except (sqlite3.Error, pims_core.pims_error) as e:
+			self.warn(e)
+			run_id = None
+		return run_id
+
+	#Records how a run ended, from its result (see pims_run.pipeline_run.run), in the record run_started returned. The record is found by its id rather than the run directory, which can be shared by several runs of a script (e.g. incremental re-runs).
+	def run_finished(self, run_id, result):
+		if run_id == None:
+			return None
+		if result['cancelled']:
+			status = 'cancelled'
+		else:
+			status = 'done' if result['exit_code'] == 0 else 'failed'
+		try:
+			connection = self.connect()
+			try:
+				with connection:
+					connection.execute('UPDATE runs SET finished = ?, exit_code = ?, status = ? WHERE id = ?', (result['end'], result['exit_code'], status, run_id))
+			finally:
+				connection.close()
+		except sqlite3.Error as e:
+			self.warn(e)
+		return None
+
+	#Adds a pipeline known only from its script: the tools are found from the command lines (see tool_registry.match_command) and their values worked out as well as possible (see command_values)
+	def add_script(self, cursor, script_name, script_path, run_dir, note_str, created, step_lines, registry=None):
+		if registry == None:
+			registry = pims_core.tool_registry()
+		tool_rows = []
+		param_rows = []
+		for step_num, step_line in enumerate(step_lines):
+			for command in pims_core.step_commands(step_line):
+				tool_name = registry.match_command(command)
+				if tool_name == None:
+					continue
+				tool_dict = registry.get(tool_name)
+				tool_rows.append((step_num+1, tool_name, tool_dict['PURPOSE']))
+				values = command_values(tool_dict, command)
+				this_tool_rows, this_param_rows = pipeline_rows([[(tool_name, tool_dict, values)]])
+				param_rows.extend(this_param_rows)
+		return self.add_pipeline(cursor, script_name, script_path, run_dir, note_str, created, tool_rows, param_rows, step_lines)
+
+	#Adds the run directories found in each of dirs (by default ~/pipeline/scripts) that are not in the history yet, from the script copy each holds, and fills in those of scripts that were recorded when they were written but have been run since by running the script directly. When and how a run went is taken from its PIMS.profile if it was run by pims_run; otherwise the time is that of the run directory's name, and whether it succeeded is not known. Returns the number of runs added or filled in.
+	def index_run_dirs(self, dirs=None, registry=None):
+		if dirs == None:
+			dirs = [pims_core.get_pipeline_path()+'/scripts/']
+		if registry == None:
+			registry = pims_core.tool_registry()
+		added = 0
+		try:
+			connection = self.connect()
+		except sqlite3.Error as e:
+			raise pims_core.pims_error('The run history %s could not be opened: %s' % (self.db_path, e))
+		try:
+			with connection:
+				cursor = connection.cursor()
+				known = dict(cursor.execute('SELECT run_dir, id FROM runs WHERE run_dir IS NOT NULL AND status != ?', ('generated',)).fetchall())
+				generated = dict(cursor.execute('SELECT run_dir, id FROM runs WHERE status = ?', ('generated',)).fetchall())
+				for parent in dirs:
+					parent = os.path.abspath(parent)
+					try:
+						filenames = sorted(os.listdir(parent))
+					except OSError as e:
+						raise pims_core.pims_error('Could not list %s: %s' % (parent, e.strerror))
+					for filename in filenames:
+						name_match = run_dir_pattern.match(filename)
+						run_dir = os.path.join(parent, filename)
+						if (name_match == None) or (run_dir in known) or (not os.path.isdir(run_dir)):
+							continue
+						created = time.mktime(time.strptime(name_match.group(2), '%Y%m%d_%H%M%S'))
+						#A script that was recorded when it was written, and has since been run other than through pims_run
+						if run_dir in generated:
+							self.set_outcome(cursor, generated[run_dir], run_dir, created)
+							added += 1
+							continue
+						script_copy = os.path.join(run_dir, '%s.script' % name_match.group(1))
+						if not os.path.isfile(script_copy):
+							continue
+						try:
+							script_name, note_str, script_run_dir, step_lines = pims_core.parse_script(script_copy)
+						except (pims_core.pims_error, IOError):
+							continue
+						run_id = self.add_script(cursor, script_name, os.path.join(parent, '%s.script' % script_name), run_dir, note_str, created, step_lines, registry)
+						self.set_outcome(cursor, run_id, run_dir, created)
+						added += 1
+		finally:
+			connection.close()
+		return added
+
+	#Fills in the start, end and exit code of an indexed run from its profile, if it has one
+	def set_outcome(self, cursor, run_id, run_dir, created):
+		profiles = pims_run.read_profiles([run_dir])
+		if len(profiles) == 0:
+			cursor.execute('UPDATE runs SET started = ?, status = ?, time = ? WHERE id = ?', (created, 'unknown', created, run_id))
+			return None
+		started = min([profile['start'] for profile in profiles])
+		finished = max([profile['start']+profile['wall'] for profile in profiles])
+		failed = [profile['exit_code'] for profile in profiles if profile['exit_code'] != 0]
+		exit_code = failed[-1] if len(failed) > 0 else 0
+		cursor.execute('UPDATE runs SET started = ?, finished = ?, exit_code = ?, status = ?, time = ? WHERE id = ?', (started, finished, exit_code, 'done' if exit_code == 0 else 'failed', started, run_id))
+		return None
+
+	#Returns the runs (newest first) matching every condition given: a tool they ran, parameters (as (tool or None, name, value or None), so that a parameter can be matched whatever its value), a time range (on the start time, or the time the script was written if it has not run), a script name and a status. Each run is a dictionary of its row in the runs table, with its tools as a list of names.
+	def find_runs(self, tool=None, params=(), since=None, until=None, script_name=None, status=None, limit=100):
+		#Tool and parameter conditions, as (table, where clause, args)
+		matches = []
+		if tool != None:
+			matches.append(('tools', 'tool = ?', [tool]))
+		for param_tool, name, value in params:
+			where = 'name = ?'
+			where_args = [name]
+			if value != None:
+				where += ' AND value = ?'
+				where_args.append(value)
+			if param_tool != None:
+				where += ' AND tool = ?'
+				where_args.append(param_tool)
+			matches.append(('params', where, where_args))
+		try:
+			connection = self.connect()
+		except sqlite3.Error as e:
+			raise pims_core.pims_error('The run history %s could not be opened: %s' % (self.db_path, e))
+		try:
+			conditions = []
+			args = []
+			#A condition that few runs match (e.g. a particular value of an option) is fastest used to pick out those runs, and one that most runs match (e.g. a tool that every pipeline uses) by going through the runs newest first, checking each, until there are enough. Each condition is counted, up to selective_count, to find which.
+			counts = [connection.execute('SELECT count(*) FROM (SELECT run_id FROM %s WHERE %s LIMIT %d)' % (table, where, selective_count), where_args).fetchone()[0] for table, where, where_args in matches]
+			driving = counts.index(min(counts)) if (len(counts) > 0) and (min(counts) < selective_count) else None
+			for match_num, (table, where, where_args) in enumerate(matches):
+				if match_num == driving:
+					conditions.append('id IN (SELECT run_id FROM %s WHERE %s)' % (table, where))
+				else:
+					conditions.append('EXISTS (SELECT 1 FROM %s WHERE run_id = runs.id AND %s)' % (table, where))
+				args.extend(where_args)
+			for condition, value in [('time >= ?', since), ('time < ?', until), ('script_name = ?', script_name), ('status = ?', status)]:
+				if value != None:
+					conditions.append(condition)
+					args.append(value)
+			query = 'SELECT id, script_name, script_path, run_dir, note, created, started, finished, exit_code, status FROM runs'
+			if len(conditions) > 0:
+				query += ' WHERE '+' AND '.join(conditions)
+			query += ' ORDER BY time DESC, id DESC LIMIT ?'
+			args.append(limit)
+			columns = ['id', 'script_name', 'script_path', 'run_dir', 'note', 'created', 'started', 'finished', 'exit_code', 'status']
+			runs = [dict(zip(columns, row)) for row in connection.execute(query, args)]
+			for run in runs:
+				run['tools'] = [row[0] for row in connection.execute('SELECT tool FROM tools WHERE run_id = ? ORDER BY step', (run['id'],))]
+		finally:
+			connection.close()
+		return runs
@@ -0,0 +1,152 @@
+#This is part of the source code for the Pipeline Interface and Management System (PIMS). PIMS was created by Joseph Gardner, Dept. of Genetics, University of Cambridge, UK, and is licensed under the Creative Commons Attribution-ShareAlike 4.0 International (CC BY-SA 4.0) license. See pims_v0.1.py or https://github.com/jg600/PIMS for full licensing information.
+
+#Turns a configured pipeline, or a batch of them (one per row of a sample sheet, see pims_core.batch_pipelines), into a Makefile, so that GNU Make can run them instead of the scripts. Each step of each pipeline becomes a rule whose targets are the files its tools declare as outputs (the OUTPUTS field of their .tool files) and whose prerequisites are the files they declare as inputs (INPUTS) and the targets of the step before it. "make -j N" then runs up to N steps at once, from different pipelines of a batch, and running make again only runs the steps whose inputs are newer than their outputs, and the steps after them. A step that declares no outputs is given a stamp file in the run directory (PIMS.step<N>.done) instead. The usual pipeline scripts are written as well, and each pipeline runs in the timestamped run directory its script would use, which the first rule makes, with the script copy and NOTE file. The Makefile is run from the directory it is in, as the scripts are, and steps with several outputs need GNU Make 4.3 or later (for grouped targets). Like pims_core.py, this does not import Tkinter.
+
+import os
+import re
+import subprocess as sub
+import time
+import pims_core
+import pims_check
+
+#A shell redirection at the start of a word of a value (e.g. "> out.txt", "2>log" or "<in.txt"), and a redirection to another file descriptor (e.g. "2>&1"), which names no file
+redirection_pattern = re.compile(r'^\d*(?:&>>?|>>?|<)')
+fd_redirection_pattern = re.compile(r'^\d*[<>]&')
+
+#Characters that cannot be used in a target or prerequisite without escaping, so files whose names hold them are left out of the rules
+make_special_chars = set(':#%;=\\')
+
+#Returns the files named in a value, leaving out redirections, standard input and output and anything bash would expand (see pims_check.value_paths)
+def value_files(value):
+	files = []
+	for word in pims_check.value_paths(value) or []:
+		if fd_redirection_pattern.match(word):
+			continue
+		path = redirection_pattern.sub('', word)
+		if (path not in ['', '-']) and (not path.startswith('/dev/')) and (len(make_special_chars.intersection(path)) == 0):
+			files.append(path)
+	return files
+
+#Returns a file path used in a run directory as Make sees it, from the directory the Makefile is in
+def make_path(run_dir, path):
+	path = os.path.expanduser(path)
+	if os.path.isabs(path):
+		return os.path.normpath(path)
+	return os.path.normpath(os.path.join(run_dir, path))
+
+#Escapes text for a recipe, where Make would otherwise expand $
+def recipe_text(text):
+	return text.replace('$', '$$')
+
+#Returns (inputs, outputs): the files the tools of one step line (line_steps, as given by pims_core.purpose_groups) declare as inputs and outputs, as written in their values. In a streamed step, the files that the pipes replace (see pims_core.stream_values) are left out.
+def step_files(line_steps):
+	inputs = []
+	outputs = []
+	for k, (tool_name, tool_dict, values) in enumerate(line_steps):
+		streamed = values
+		if k > 0:
+			streamed = pims_core.stream_values(tool_dict, streamed, 'STDIN')
+		if k < len(line_steps)-1:
+			streamed = pims_core.stream_values(tool_dict, streamed, 'STDOUT')
+		for declaration, files in [('INPUTS', inputs), ('OUTPUTS', outputs)]:
+			for name, value in pims_check.input_values(tool_dict, values, declaration):
+				if str(streamed['OPTIONS'].get(name, streamed['ARGUMENTS'].get(name, ''))) == value:
+					files.extend(value_files(value))
+	return inputs, outputs
+
+#Returns the Makefile text for one pipeline. The first rule makes the run directory, copies the script into it and writes the NOTE file, as the script does; every step waits for it, without being run again when it changes. Each step line of the script (see pims_core.purpose_groups) is then one rule, run in the run directory. Relative input files that an earlier tool of the pipeline also uses are taken to be made by an earlier step, as pims_check does, and are only prerequisites if that step declares them as outputs, since Make would otherwise look for a rule to make them.
+def pipeline_rules(script_name, note_str, steps, run_dir, stream=False):
+	note_path = '%s/NOTE' % run_dir
+	rule_list = ['\n#%s\n' % script_name]
+	rule_list.append('%s:\n\tmkdir -p %s\n\tcp %s.script %s/%s.script\n\techo "%s" > %s\n' % (note_path, run_dir, script_name, run_dir, script_name, recipe_text(note_str), note_path))
+	previous = []
+	made = set()
+	earlier_values = set()
+	step_num = 0
+	for purpose_nums, line_steps, line in pims_core.purpose_groups(steps, stream):
+		if line.strip() == '':
+			continue
+		step_num += 1
+		inputs, outputs = step_files(line_steps)
+		targets = []
+		for path in outputs:
+			if make_path(run_dir, path) not in targets:
+				targets.append(make_path(run_dir, path))
+		stamp = None
+		if len(targets) == 0:
+			stamp = '%s/PIMS.step%d.done' % (run_dir, step_num)
+			targets = [stamp]
+		prerequisites = list(previous)
+		for path in inputs:
+			full_path = make_path(run_dir, path)
+			if (full_path in prerequisites) or (full_path in targets):
+				continue
+			if (full_path in made) or (path not in earlier_values):
+				prerequisites.append(full_path)
+		rule_list.append('%s%s %s | %s\n' % (' '.join(targets), ' &:' if len(targets) > 1 else ':', ' '.join(prerequisites), note_path))
+		rule_list.append('\tcd %s || exit 1; %s\n' % (run_dir, recipe_text(line.rstrip(' '))))
+		if stamp != None:
+			rule_list.append('\ttouch %s\n' % stamp)
+		made.update(targets)
+		previous = targets
+		for tool_name, tool_dict, values in line_steps:
+			for field in ['OPTIONS', 'ARGUMENTS']:
+				for value in values[field].values():
+					earlier_values.update(value_files(str(value)))
+	rule_list.append('%s: %s\n' % (script_name, ' '.join(previous if len(previous) > 0 else [note_path])))
+	return ''.join(rule_list)
+
+#Returns the text of a Makefile running a list of pipelines (script_name, note_str, steps), each in its run directory for the given timestamp. "make" (or "make all") runs every pipeline, and "make <script name>" just one.
+def makefile_text(make_name, pipelines, timestamp, stream=False):
+	names = [script_name for script_name, note_str, steps in pipelines]
+	make_list = ['#Written by PIMS. Run it from this directory, e.g. make -f %s.mk -j 4\n' % make_name]
+	make_list.append('SHELL := /bin/bash\n')
+	#A step that fails leaves no outputs behind that would look up to date
+	make_list.append('.DELETE_ON_ERROR:\n')
+	make_list.append('.PHONY: all %s\n' % ' '.join(names))
+	make_list.append('all: %s\n' % ' '.join(names))
+	for script_name, note_str, steps in pipelines:
+		make_list.append(pipeline_rules(script_name, note_str, steps, pims_core.run_dir_name(script_name, timestamp), stream))
+	return ''.join(make_list)
+
+#Compiles a config (or, with sheet_path, one pipeline per sample sheet row) into a Makefile, <make name>.mk, written to scripts_path (~/pipeline/scripts by default) with the pipeline scripts, as pims.py compile/batch would write them. Nothing is written unless every name is free (or overwrite is set). With a pims_history.run_history, the pipelines are recorded in it. Returns the path of the Makefile.
+def compile_make(config_path, purposes, make_name, sheet_path=None, note_str='', scripts_path=None, registry=None, timestamp=None, overwrite=False, stream=False, name_prefix='', history=None):
+	if not pims_core.name_pattern.match(make_name):
+		raise pims_core.pims_error('%s is not a valid file name. File names should contain only alphanumeric characters, underscores and hyphens.' % make_name)
+	if registry == None:
+		registry = pims_core.tool_registry()
+	if scripts_path == None:
+		scripts_path = pims_core.get_pipeline_path()+'/scripts/'
+	if timestamp == None:
+		timestamp = time.time()
+	if sheet_path != None:
+		pipelines = pims_core.batch_pipelines(config_path, purposes, sheet_path, registry, name_prefix, note_str)
+	else:
+		pipelines = [(make_name, note_str, pims_core.config_steps(pims_core.read_config(config_path), purposes, registry))]
+	if 'all' in [script_name for script_name, this_note, steps in pipelines]:
+		raise pims_core.pims_error('all cannot be used as a script name in a Makefile. Please choose another name.')
+	make_path = os.path.join(scripts_path, '%s.mk' % make_name)
+	if not overwrite:
+		for script_name, this_note, steps in pipelines:
+			if os.path.exists(os.path.join(scripts_path, '%s.script' % script_name)):
+				raise pims_core.pims_error('A file with the name %s already exists. Please choose another name.' % script_name)
+		if os.path.exists(make_path):
+			raise pims_core.pims_error('A file with the name %s.mk already exists. Please choose another name.' % make_name)
+	make_text = makefile_text(make_name, pipelines, timestamp, stream)
+	for script_name, this_note, steps in pipelines:
+		pims_core.write_script_file(script_name, pims_core.render_script(script_name, this_note, steps, pims_core.run_dir_name(script_name, timestamp), stream), scripts_path, overwrite=True)
+	pims_core.write_atomic(make_path, make_text)
+	if history != None:
+		history.record_scripts(pipelines, scripts_path, timestamp, stream)
+	return make_path
+
+#Runs a Makefile written by compile_make with make, as found on the PATH, from the directory it is in, running up to jobs steps at once (one if jobs is None). Returns make's exit code.
+def run_make(make_path, jobs=None, targets=()):
+	make_args = ['make', '-f', os.path.basename(make_path)]
+	if jobs != None:
+		make_args.append('-j%d' % jobs)
+	make_args.extend(targets)
+	try:
+		return sub.call(make_args, cwd=os.path.dirname(os.path.abspath(make_path)))
+	except OSError:
+		raise pims_core.pims_error('Could not run make. Is GNU Make installed and on the PATH?')
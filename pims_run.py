@@ -0,0 +1,701 @@
+#This is part of the source code for the Pipeline Interface and Management System (PIMS). PIMS was created by Joseph Gardner, Dept. of Genetics, University of Cambridge, UK, and is licensed under the Creative Commons Attribution-ShareAlike 4.0 International (CC BY-SA 4.0) license. See pims_v0.1.py or https://github.com/jg600/PIMS for full licensing information.
+
+#Runs generated pipeline scripts from Python rather than as one serial bash process, so that many pipelines (e.g. a batch of samples) can run at once. Each pipeline still runs its steps one after another in purpose order, in its own timestamped run directory holding a copy of the script and the NOTE file, exactly as the script itself would. Like pims_core.py, this does not import Tkinter.
+
+import hashlib
+import json
+import os
+import re
+import shlex
+import shutil
+import signal
+import subprocess as sub
+import sys
+import threading
+import time
+from collections import deque
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+import pims_core
+
+#Popen options that start a step in a process group of its own. preexec_fn is not safe in Python 3 while other threads are running, as they are here (see run_pipelines), so start_new_session is used there instead; Python 2 only has preexec_fn.
+if sys.version_info[0] >= 3:
+	new_session_args = {'start_new_session':True}
+else:
+	new_session_args = {'preexec_fn':os.setsid}
+
+#Name of the file in each run directory that records when each step started, finished, was skipped or failed
+log_name = 'PIMS.log'
+#Each step that is run writes its output (stdout and stderr) to a log file of its own in the run directory, named by its step number
+step_log_pattern = re.compile(r'^PIMS\.step(\d+)\.log$')
+
+def step_log_name(step_number):
+	return 'PIMS.step%d.log' % step_number
+#Name of the file in each run directory that records the fingerprint and outputs of each completed step, for incremental re-runs
+state_name = 'PIMS.state'
+#Name of the file in each run directory that records the resources used by each step, one JSON object per line
+profile_name = 'PIMS.profile'
+
+#Reads /proc/<pid>/io, which counts the bytes a process (and, once they have been waited for, its children) has read and written. Returns an empty dictionary where this is not available.
+def read_proc_io(pid):
+	proc_io = dict()
+	try:
+		io_file = open('/proc/%d/io' % pid, 'r')
+	except IOError:
+		return proc_io
+	for line in io_file:
+		key_val = line.split(':')
+		if len(key_val) == 2:
+			proc_io[key_val[0].strip()] = int(key_val[1])
+	io_file.close()
+	return proc_io
+
+#Waits for a process to finish and measures what it used. The rusage from wait4 covers the process and all the children it waited for (bash waits for every tool it starts), giving user/sys CPU time, peak RSS and block I/O. Where os.waitid is available (Python 3), the finished process is first looked at without being reaped, so that /proc/<pid>/io can still be read for exact byte counts. Returns (exit code, profile dictionary); the exit code follows the subprocess convention of -N for a process killed by signal N.
+def wait_and_measure(proc):
+	proc_io = dict()
+	if hasattr(os, 'waitid') and hasattr(os, 'WNOWAIT'):
+		try:
+			os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+			proc_io = read_proc_io(proc.pid)
+		except OSError:
+			pass
+	pid, status, rusage = os.wait4(proc.pid, 0)
+	if os.WIFSIGNALED(status):
+		exit_code = -os.WTERMSIG(status)
+	else:
+		exit_code = os.WEXITSTATUS(status)
+	#Tell the Popen object the process has been reaped, so it does not try to wait for it again
+	proc.returncode = exit_code
+	profile = {'user_cpu':rusage.ru_utime, 'sys_cpu':rusage.ru_stime, 'max_rss_kb':rusage.ru_maxrss}
+	if 'read_bytes' in proc_io:
+		profile['read_bytes'] = proc_io['read_bytes']
+		profile['write_bytes'] = proc_io['write_bytes']
+		profile['rchar'] = proc_io.get('rchar', 0)
+		profile['wchar'] = proc_io.get('wchar', 0)
+	else:
+		profile['read_bytes'] = rusage.ru_inblock*512
+		profile['write_bytes'] = rusage.ru_oublock*512
+	return exit_code, profile
+
+#Returns the paths (in the run directory, or absolute) that a step's command line names, whether or not they exist. Each word of the command is taken as a path, as is the value part of --option=value words; for a step of a sweep or fan-out branch (see pims_core.branch_lines), paths are taken from the branch directory.
+def step_paths(step_line):
+	branch_dir, command = pims_core.split_branch_line(step_line)
+	try:
+		words = shlex.split(command)
+	except ValueError:
+		words = command.split()
+	paths = []
+	for word in words:
+		for candidate in [word] + word.split('=', 1)[1:]:
+			if candidate == '':
+				continue
+			if branch_dir != '':
+				candidate = os.path.normpath(os.path.join(branch_dir, candidate))
+			if candidate not in paths:
+				paths.append(candidate)
+	return paths
+
+#Returns the files in the run directory (or absolute paths) that a step's command line refers to and that exist, i.e. the step's inputs (see step_paths). Paths in exclude (the step's own outputs) are left out, so that a file a step writes is not treated as one of its inputs on the next run.
+def step_inputs(step_line, run_dir, exclude=()):
+	return [path for path in step_paths(step_line) if (path not in exclude) and os.path.isfile(os.path.join(run_dir, path))]
+
+#Returns what is recorded about a file to tell whether it has changed: its size and modification time, or (if hash_contents is set) a SHA-1 of its contents, which also notices files that were rewritten with the same size and time.
+def file_stamp(path, hash_contents=False):
+	path_stat = os.stat(path)
+	if not hash_contents:
+		return [path_stat.st_size, path_stat.st_mtime]
+	sha = hashlib.sha1()
+	this_file = open(path, 'rb')
+	block = this_file.read(1<<20)
+	while block:
+		sha.update(block)
+		block = this_file.read(1<<20)
+	this_file.close()
+	return sha.hexdigest()
+
+#Fingerprint of a step: a hash of its resolved command line together with the stamps of the input files it refers to
+def step_fingerprint(step_line, run_dir, exclude=(), hash_contents=False):
+	sha = hashlib.sha1(step_line.encode('utf-8'))
+	for input_path in step_inputs(step_line, run_dir, exclude):
+		sha.update(('\0%s\0%s' % (input_path, file_stamp(os.path.join(run_dir, input_path), hash_contents))).encode('utf-8'))
+	return sha.hexdigest()
+
+#Returns {relative path: [size, mtime]} for every file in the run directory, apart from the files PIMS itself keeps there. With branch_dir, only the files in that branch directory (see pims_core.branch_lines) are looked at, still with paths relative to the run directory, so that a step is not taken to have made the files that steps of other branches make while it runs.
+def snapshot_dir(run_dir, script_name, branch_dir=''):
+	own_files = set([log_name, state_name, profile_name, 'NOTE', '%s.script' % script_name])
+	snapshot = dict()
+	for dirpath, dirnames, filenames in os.walk(os.path.join(run_dir, branch_dir)):
+		for filename in filenames:
+			rel_path = os.path.relpath(os.path.join(dirpath, filename), run_dir)
+			if (rel_path in own_files) or re.match(step_log_pattern, rel_path):
+				continue
+			try:
+				snapshot[rel_path] = file_stamp(os.path.join(dirpath, filename))
+			except OSError:
+				continue
+	return snapshot
+
+#The cores and memory of the machine, shared out between the steps of the pipelines running at once, so that together they never ask for more than there is. A step waits until the threads and memory it needs (see pims_core.step_resources) are free. Waiting steps are started in the order they asked, except that a later step that fits may go ahead of an earlier one that does not, so the machine is kept busy; once a step has waited reserve_after seconds, nothing else is started until it fits, so that large steps are never held back for ever. A step that needs more than the whole machine is given the whole machine.
+class resource_pool:
+	def __init__(self, cores=None, memory=None, reserve_after=30.0):
+		self.cores = cores if cores != None else cpu_count()
+		self.memory = memory if memory != None else machine_memory()
+		self.reserve_after = reserve_after
+		self.free_cores = self.cores
+		self.free_memory = self.memory
+		#[threads, memory, time asked] for each step waiting, in the order they asked
+		self.waiting = []
+		self.condition = threading.Condition()
+
+	#Scales a request down to what the machine has
+	def fit(self, threads, memory):
+		return min(max(1, threads), self.cores), min(memory, self.memory)
+
+	#Waits until threads and memory are free and takes them. Returns the (threads, memory) given, or None if stop() became true while waiting (checked every second).
+	def acquire(self, threads, memory, stop=None):
+		request = list(self.fit(threads, memory))+[time.time()]
+		self.condition.acquire()
+		try:
+			self.waiting.append(request)
+			while not self.can_start(request):
+				if (stop != None) and stop():
+					self.waiting.remove(request)
+					self.condition.notify_all()
+					return None
+				self.condition.wait(1.0)
+			self.waiting.remove(request)
+			self.free_cores -= request[0]
+			self.free_memory -= request[1]
+			#Others may fit in what is left
+			self.condition.notify_all()
+		finally:
+			self.condition.release()
+		return request[0], request[1]
+
+	#Whether a waiting request may start now. Called with the lock held.
+	def can_start(self, request):
+		if (request[0] > self.free_cores) or (request[1] > self.free_memory):
+			return False
+		oldest = self.waiting[0]
+		if (oldest is not request) and (time.time()-oldest[2] > self.reserve_after):
+			return False
+		return True
+
+	def release(self, threads, memory):
+		self.condition.acquire()
+		try:
+			self.free_cores += threads
+			self.free_memory += memory
+			self.condition.notify_all()
+		finally:
+			self.condition.release()
+		return None
+
+#Returns the total memory of the machine in bytes
+def machine_memory():
+	try:
+		return os.sysconf('SC_PAGE_SIZE')*os.sysconf('SC_PHYS_PAGES')
+	except (ValueError, OSError, AttributeError):
+		return 1<<62
+
+#One pipeline to be run, made from a generated script (see pims_core.parse_script). work_dir is the directory the run directory is created in; like running the script by hand, this defaults to the directory holding the script. After running, result holds the exit code, start and end times, and the step that failed (if any).
+class pipeline_run:
+	def __init__(self, script_path, work_dir=None, incremental=False, run_dir=None, hash_inputs=False, cache=None, resources=None, registry=None, history=None):
+		self.script_path = os.path.abspath(script_path)
+		self.script_name, self.note_str, script_run_dir, self.step_lines = pims_core.parse_script(self.script_path)
+		if work_dir == None:
+			work_dir = os.path.dirname(self.script_path)
+		self.work_dir = work_dir
+		self.run_dir = os.path.join(work_dir, script_run_dir)
+		#In incremental mode the steps are run in an existing run directory, skipping those that are still up to date: the one given, or the one holding this script (when re-running the copy kept in a run directory), or the newest earlier run of this script.
+		self.incremental = incremental
+		self.hash_inputs = hash_inputs
+		#A pims_cache.output_cache, or None to always run every step
+		self.cache = cache
+		#A resource_pool shared with other runs, or None to start each step as soon as the one before has finished. What each step needs is worked out here from the tool files (through registry), rather than while running, so that the registry is only used by the thread that made the run.
+		self.resources = resources
+		self.step_needs = None
+		#Without a resource pool: a resource_pool shared with the other runs started together (see run_pipelines), used only to limit the number of steps running at once across all of them, one core each, or None
+		self.step_slots = None
+		#A pims_history.run_history to record the run in, or None
+		self.history = history
+		if resources != None:
+			if registry == None:
+				registry = pims_core.tool_registry()
+			self.step_needs = [pims_core.step_resources(step_line, registry) for step_line in self.step_lines]
+		if run_dir != None:
+			self.run_dir = os.path.abspath(run_dir)
+		elif incremental:
+			if os.path.basename(os.path.dirname(self.script_path)) == script_run_dir:
+				self.run_dir = os.path.dirname(self.script_path)
+			elif not os.path.isdir(self.run_dir):
+				previous_run_dir = self.find_previous_run_dir()
+				if previous_run_dir != None:
+					self.run_dir = previous_run_dir
+		self.result = None
+		#Set by cancel(); the steps running at the time are killed and no further steps are started
+		self.cancelled = False
+		self.current_procs = set()
+		#Held while writing to the log, state and profile files, which the steps of different branches share
+		self.lock = threading.Lock()
+
+	#Returns the newest existing <script name>_<timestamp> directory in the work directory, or None
+	def find_previous_run_dir(self):
+		run_dir_pattern = re.compile(r'^%s_\d{8}_\d{6}(_\d+)?$' % re.escape(self.script_name))
+		try:
+			candidates = [d for d in os.listdir(self.work_dir) if re.match(run_dir_pattern, d) and os.path.isdir(os.path.join(self.work_dir, d))]
+		except OSError:
+			return None
+		if len(candidates) == 0:
+			return None
+		return os.path.join(self.work_dir, max(candidates))
+
+	#Reads the step records of an earlier run in this run directory (an empty list if there are none)
+	def load_state(self):
+		try:
+			state_file = open(os.path.join(self.run_dir, state_name), 'r')
+		except IOError:
+			return []
+		try:
+			state = json.load(state_file)
+		except ValueError:
+			state = []
+		state_file.close()
+		return state
+
+	#Writes the step records (None for steps that have not been run) via a temporary file, so that an interrupted run never leaves a half written state file behind
+	def save_state(self, state):
+		state_path = os.path.join(self.run_dir, state_name)
+		with self.lock:
+			state_file = open(state_path+'.tmp', 'w')
+			json.dump(state, state_file)
+			state_file.close()
+			os.rename(state_path+'.tmp', state_path)
+		return None
+
+	#Checks whether a step recorded in an earlier run can be skipped: the command line must be the same, the inputs must not have changed since, and every output it made must still be there unchanged.
+	def step_up_to_date(self, step_line, record):
+		if (record == None) or (record['command'] != step_line):
+			return False
+		for output_path, output_stamp in record['outputs'].items():
+			try:
+				if file_stamp(os.path.join(self.run_dir, output_path)) != output_stamp:
+					return False
+			except OSError:
+				return False
+		return record['fingerprint'] == step_fingerprint(step_line, self.run_dir, record['outputs'], self.hash_inputs)
+
+	#Creates the run directory, copies the script into it and writes the NOTE file. If the directory named in the script already exists (i.e., the script has been run before), a new timestamped directory is used instead, so that earlier results are never overwritten.
+	def prepare(self):
+		if self.incremental and os.path.isdir(self.run_dir):
+			if os.path.abspath(os.path.dirname(self.script_path)) != self.run_dir:
+				shutil.copy(self.script_path, os.path.join(self.run_dir, '%s.script' % self.script_name))
+			note_file = open(os.path.join(self.run_dir, 'NOTE'), 'w')
+			note_file.write(self.note_str+'\n')
+			note_file.close()
+			return None
+		if os.path.exists(self.run_dir):
+			self.run_dir = os.path.join(self.work_dir, pims_core.run_dir_name(self.script_name))
+			suffix = 1
+			while os.path.exists(self.run_dir):
+				self.run_dir = os.path.join(self.work_dir, pims_core.run_dir_name(self.script_name)+'_%d' % suffix)
+				suffix += 1
+		os.makedirs(self.run_dir)
+		shutil.copy(self.script_path, os.path.join(self.run_dir, '%s.script' % self.script_name))
+		note_file = open(os.path.join(self.run_dir, 'NOTE'), 'w')
+		note_file.write(self.note_str+'\n')
+		note_file.close()
+		return None
+
+	#Runs one step with bash in the run directory, sending its output to its own step log (replacing the output of any earlier run of the step), and appends what it used (wall time, CPU time, peak memory and I/O, see wait_and_measure) to the profile file. With a resource pool, the step first waits for the threads and memory it needs, and the tools in it that take a thread count share the threads it is given (through PIMS_THREADS, see pims_core.tool_command); otherwise it waits for one of the step_slots, if there are any. Returns the exit code.
+	def run_step(self, step_line, step_num=0):
+		env = None
+		allocation = None
+		if self.resources != None:
+			threads, memory, threaded_tools = self.step_needs[step_num]
+			allocation = self.resources.acquire(threads, memory, lambda: self.cancelled)
+			if allocation == None:
+				return -signal.SIGTERM
+			env = dict(os.environ)
+			env[pims_core.thread_variable] = str(max(1, allocation[0]//max(1, threaded_tools)))
+		elif self.step_slots != None:
+			if self.step_slots.acquire(1, 0, lambda: self.cancelled) == None:
+				return -signal.SIGTERM
+		try:
+			return self.run_process(step_line, step_num, env, allocation)
+		finally:
+			if allocation != None:
+				self.resources.release(allocation[0], allocation[1])
+			elif self.step_slots != None:
+				self.step_slots.release(1, 0)
+
+	def run_process(self, step_line, step_num, env, allocation):
+		start = time.time()
+		step_log_file = open(os.path.join(self.run_dir, step_log_name(step_num+1)), 'w')
+		#Each step runs in its own process group, so that cancelling it also stops every tool bash started for it
+		try:
+			proc = sub.Popen(step_line, shell=True, executable='/bin/bash', cwd=self.run_dir, stdout=step_log_file, stderr=sub.STDOUT, env=env, **new_session_args)
+		finally:
+			step_log_file.close()
+		with self.lock:
+			self.current_procs.add(proc)
+		if self.cancelled:
+			kill_step(proc)
+		exit_code, profile = wait_and_measure(proc)
+		with self.lock:
+			self.current_procs.discard(proc)
+		profile.update({'step':step_num+1, 'command':step_line, 'start':start, 'wall':time.time()-start, 'exit_code':exit_code})
+		if allocation != None:
+			profile['threads'] = allocation[0]
+			profile['memory'] = allocation[1]
+		with self.lock:
+			profile_file = open(os.path.join(self.run_dir, profile_name), 'a')
+			profile_file.write(json.dumps(profile, sort_keys=True)+'\n')
+			profile_file.close()
+		return exit_code
+
+	#Stops the run: the steps running at the time are killed, and the run ends as a failure at the first of them. May be called from another thread.
+	def cancel(self):
+		self.cancelled = True
+		with self.lock:
+			procs = list(self.current_procs)
+		for proc in procs:
+			kill_step(proc)
+		return None
+
+	#Runs the whole pipeline and fills in self.result. Each step starts once the step before it has finished, or, in a script with branches (a sweep or fan-out, see pims_core.branch_lines), once the step before it in its own branch has (see pims_core.step_parents), so that the branches run at the same time: up to one step per core, or as many as the resource pool has room for. A step that fails stops the steps after it in its branch, but other branches carry on, and the run fails at the first step that failed. After each step its fingerprint and the files it made are recorded in the state file; in incremental mode, steps are skipped for as long as they are up to date, and every step of a branch from the first one that is not is run again. With an output cache, a step that has been run before with the same command and input contents has its outputs restored from the cache instead of being run, and the outputs of every step that is run are added to it. As with the script, the original script file is deleted at the end, but only if every step succeeded, so that failed runs can be run again.
+	def run(self, keep_script=False):
+		start = time.time()
+		try:
+			self.prepare()
+		except (OSError, IOError) as e:
+			self.result = {'name':self.script_name, 'run_dir':self.run_dir, 'exit_code':-1, 'failed_step':None, 'start':start, 'end':time.time(), 'log':None, 'error':str(e), 'skipped_steps':0, 'cached_steps':0, 'cancelled':self.cancelled}
+			if self.history != None:
+				self.history.run_finished(self.history.run_started(self, start), self.result)
+			return self.result
+		#Recorded once prepare has made the run directory, which is a new one if the script's was already there
+		history_id = None
+		if self.history != None:
+			history_id = self.history.run_started(self, start)
+		old_state = self.load_state() if self.incremental else []
+		state = [None]*len(self.step_lines)
+		log_file = open(os.path.join(self.run_dir, log_name), 'a')
+		try:
+			outcomes = self.run_steps(old_state, state, log_file)
+		finally:
+			log_file.close()
+		self.save_state(state)
+		failed = [step_num for step_num, (outcome, step_exit_code) in enumerate(outcomes) if outcome in ['failed', 'cancelled']]
+		exit_code = outcomes[failed[0]][1] if len(failed) > 0 else 0
+		failed_step = failed[0]+1 if len(failed) > 0 else None
+		skipped_steps = len([outcome for outcome, step_exit_code in outcomes if outcome == 'skipped'])
+		cached_steps = len([outcome for outcome, step_exit_code in outcomes if outcome == 'cached'])
+		if (exit_code == 0) and (not keep_script) and os.path.exists(self.script_path):
+			os.remove(self.script_path)
+		self.result = {'name':self.script_name, 'run_dir':self.run_dir, 'exit_code':exit_code, 'failed_step':failed_step, 'start':start, 'end':time.time(), 'log':os.path.join(self.run_dir, log_name), 'error':None, 'skipped_steps':skipped_steps, 'cached_steps':cached_steps, 'cancelled':self.cancelled}
+		if self.history != None:
+			self.history.run_finished(history_id, self.result)
+		return self.result
+
+	#Starts each step, in a thread of its own, as soon as the step it waits for has run, been skipped or been restored from the cache, and waits for them all. Returns (outcome, exit code) for each step, the outcome being 'run', 'skipped', 'cached', 'failed', 'cancelled', or None for a step that was never reached because a step before it failed.
+	def run_steps(self, old_state, state, log_file):
+		parents = pims_core.step_parents(self.step_lines)
+		children = [[] for step_line in self.step_lines]
+		for step_num, parent in enumerate(parents):
+			if parent >= 0:
+				children[parent].append(step_num)
+		outcomes = [(None, 0)]*len(self.step_lines)
+		#Steps that can start, as (step number, whether every step before it was up to date). The steps after one that has finished go to the front, so that a branch is followed to its end before the next one is started.
+		ready = [(step_num, True) for step_num, parent in enumerate(parents) if parent < 0]
+		running = set()
+		errors = []
+		#Steps wait for a resource pool or step slots shared with other runs when they start (see run_step), so only a pipeline run on its own is limited here, to one step per core
+		max_running = cpu_count() if (self.resources == None) and (self.step_slots == None) else max(1, len(self.step_lines))
+		finished = threading.Condition()
+		def run_ready(step_num, still_valid):
+			outcome = ('failed', -1)
+			try:
+				outcome = self.run_one_step(step_num, still_valid, old_state, state, log_file)
+			except Exception as e:
+				errors.append(e)
+			with finished:
+				outcomes[step_num] = outcome
+				running.discard(step_num)
+				if outcome[0] in ['run', 'skipped', 'cached']:
+					ready[0:0] = [(child, outcome[0] == 'skipped') for child in children[step_num]]
+				finished.notify()
+		with finished:
+			while True:
+				while (len(ready) > 0) and (len(running) < max_running) and (not self.cancelled):
+					step_num, still_valid = ready.pop(0)
+					running.add(step_num)
+					threading.Thread(target=run_ready, args=(step_num, still_valid)).start()
+				if len(running) == 0:
+					break
+				finished.wait()
+		if len(errors) > 0:
+			raise errors[0]
+		for step_num, still_valid in ready:
+			self.write_log(log_file, '#PIMS %s cancelled before step %d\n' % (time.strftime('%Y-%m-%d %H:%M:%S'), step_num+1))
+			outcomes[step_num] = ('cancelled', -signal.SIGTERM)
+		return outcomes
+
+	#Runs one step, unless it is up to date (and so was every step before it, still_valid) or its outputs can be restored from the cache, and records it in state. Returns (outcome, exit code), as run_steps does.
+	def run_one_step(self, step_num, still_valid, old_state, state, log_file):
+		step_line = self.step_lines[step_num]
+		if self.cancelled:
+			self.write_log(log_file, '#PIMS %s cancelled before step %d\n' % (time.strftime('%Y-%m-%d %H:%M:%S'), step_num+1))
+			return 'cancelled', -signal.SIGTERM
+		record = old_state[step_num] if step_num < len(old_state) else None
+		if still_valid and self.step_up_to_date(step_line, record):
+			self.write_log(log_file, '#PIMS %s step %d up to date, skipped: %s\n' % (time.strftime('%Y-%m-%d %H:%M:%S'), step_num+1, step_line))
+			state[step_num] = record
+			return 'skipped', 0
+		#The files a branch is given are links to those before it, which are not worth keeping in the cache
+		if (self.cache != None) and not pims_core.is_fork_line(step_line):
+			cache_key = self.cache.step_key(step_line, self.run_dir, record['outputs'] if record != None else ())
+			#Outputs that a later step names may be appended to or changed in place by it, so they are given copies of their own rather than links to the read-only cached files
+			later_paths = set()
+			for later_line in self.step_lines[step_num+1:]:
+				later_paths.update([os.path.normpath(path) for path in step_paths(later_line)])
+			outputs = self.cache.restore(cache_key, self.run_dir, later_paths)
+			if outputs != None:
+				self.write_log(log_file, '#PIMS %s step %d restored from cache: %s\n' % (time.strftime('%Y-%m-%d %H:%M:%S'), step_num+1, step_line))
+				state[step_num] = {'command':step_line, 'outputs':outputs, 'fingerprint':step_fingerprint(step_line, self.run_dir, outputs, self.hash_inputs), 'cached':True}
+				self.save_state(state)
+				return 'cached', 0
+		#Outputs that were linked in from the cache are removed before the step is run again, so that the step writes new files rather than into the cached ones
+		if (record != None) and record.get('cached', False):
+			for output_path in record['outputs']:
+				if os.path.lexists(os.path.join(self.run_dir, output_path)):
+					os.remove(os.path.join(self.run_dir, output_path))
+		self.write_log(log_file, '#PIMS %s step %d (output in %s): %s\n' % (time.strftime('%Y-%m-%d %H:%M:%S'), step_num+1, step_log_name(step_num+1), step_line))
+		branch_dir = pims_core.split_branch_line(step_line)[0]
+		before = snapshot_dir(self.run_dir, self.script_name, branch_dir)
+		exit_code = self.run_step(step_line, step_num)
+		if exit_code != 0:
+			self.write_log(log_file, '#PIMS step %d failed with exit code %d\n' % (step_num+1, exit_code))
+			return 'cancelled' if self.cancelled else 'failed', exit_code
+		after = snapshot_dir(self.run_dir, self.script_name, branch_dir)
+		outputs = dict((path, stamp) for path, stamp in after.items() if before.get(path) != stamp)
+		state[step_num] = {'command':step_line, 'outputs':outputs, 'fingerprint':step_fingerprint(step_line, self.run_dir, outputs, self.hash_inputs)}
+		self.save_state(state)
+		if (self.cache != None) and not pims_core.is_fork_line(step_line):
+			self.cache.store(self.cache.step_key(step_line, self.run_dir, outputs), self.run_dir, outputs)
+		return 'run', 0
+
+	def write_log(self, log_file, text):
+		with self.lock:
+			log_file.write(text)
+			log_file.flush()
+		return None
+
+#Sends SIGTERM to the process group of a running step
+def kill_step(proc):
+	#Once the step has been reaped its process group id may belong to something else
+	if proc.returncode != None:
+		return None
+	try:
+		os.killpg(proc.pid, signal.SIGTERM)
+	except OSError:
+		pass
+	return None
+
+#Runs a list of pipeline_run objects, up to workers at a time (by default one per core). Each worker is a thread waiting on a bash process, so the pipelines themselves run in parallel. Runs without a resource pool share workers step slots, so that the branches of a sweep or fan-out (see run_steps) do not start more than workers steps in all. Returns the results in the order the runs were given.
+def run_pipelines(runs, workers=None, keep_script=False):
+	if workers == None:
+		workers = cpu_count()
+	if len(runs) == 0:
+		return []
+	step_slots = resource_pool(max(1, workers), 0)
+	for this_run in runs:
+		if (this_run.resources == None) and (this_run.step_slots == None):
+			this_run.step_slots = step_slots
+	pool = ThreadPool(max(1, min(workers, len(runs))))
+	try:
+		results = pool.map(lambda this_run: this_run.run(keep_script), runs)
+	finally:
+		pool.close()
+		pool.join()
+	return results
+
+#A pipeline submitted to a job_manager. state is one of queued, running, done, failed or cancelled.
+class pipeline_job:
+	def __init__(self, job_id, this_run):
+		self.job_id = job_id
+		self.run = this_run
+		self.name = this_run.script_name
+		self.state = 'queued'
+		self.submitted = time.time()
+		self.start = None
+		self.end = None
+		self.result = None
+
+	#Seconds the job has been running for (or ran for), 0 while it is queued
+	def elapsed(self):
+		if self.start == None:
+			return 0.0
+		if self.end == None:
+			return time.time()-self.start
+		return self.end-self.start
+
+#Runs pipelines in the background, up to max_running at a time, for callers that must not wait for them (the GUI). Jobs are taken from the queue in the order they were submitted by worker threads, which are started as they are needed; lowering the limit takes effect as running jobs finish. Everything here may be read from any thread: the GUI looks at jobs and their state while the workers update them, and never waits on a lock held while a pipeline runs.
+class job_manager:
+	def __init__(self, max_running=None, keep_script=False):
+		self.max_running = max_running if max_running != None else cpu_count()
+		self.keep_script = keep_script
+		#Every job submitted, in order
+		self.jobs = []
+		self.waiting = deque()
+		self.running = 0
+		self.workers = 0
+		self.condition = threading.Condition()
+
+	#Queues a pipeline_run and returns its pipeline_job
+	def submit(self, this_run):
+		self.condition.acquire()
+		try:
+			this_job = pipeline_job(len(self.jobs)+1, this_run)
+			self.jobs.append(this_job)
+			self.waiting.append(this_job)
+			self.start_workers()
+			self.condition.notify_all()
+		finally:
+			self.condition.release()
+		return this_job
+
+	#Changes the number of jobs that may run at once
+	def set_limit(self, max_running):
+		self.condition.acquire()
+		try:
+			self.max_running = max(1, max_running)
+			self.start_workers()
+			self.condition.notify_all()
+		finally:
+			self.condition.release()
+		return None
+
+	#Starts worker threads until there is one for every job that may run. Called with the lock held.
+	def start_workers(self):
+		while self.workers < min(self.max_running, self.running+len(self.waiting)):
+			worker = threading.Thread(target=self.work)
+			#The GUI can be closed while jobs are running; see cancel_all
+			worker.daemon = True
+			worker.start()
+			self.workers += 1
+		return None
+
+	def work(self):
+		while True:
+			self.condition.acquire()
+			try:
+				while (len(self.waiting) == 0) or (self.running >= self.max_running):
+					self.condition.wait()
+				this_job = self.waiting.popleft()
+				self.running += 1
+				this_job.start = time.time()
+				this_job.state = 'running'
+			finally:
+				self.condition.release()
+			try:
+				result = this_job.run.run(self.keep_script)
+			except Exception as e:
+				result = {'name':this_job.name, 'run_dir':this_job.run.run_dir, 'exit_code':-1, 'error':str(e), 'cancelled':this_job.run.cancelled}
+			self.condition.acquire()
+			try:
+				this_job.result = result
+				this_job.end = time.time()
+				if result['cancelled']:
+					this_job.state = 'cancelled'
+				elif result['exit_code'] == 0:
+					this_job.state = 'done'
+				else:
+					this_job.state = 'failed'
+				self.running -= 1
+				self.condition.notify_all()
+			finally:
+				self.condition.release()
+
+	#Cancels a job: a queued job is taken off the queue, and a running one is stopped (see pipeline_run.cancel). Finished jobs are left as they are.
+	def cancel(self, this_job):
+		self.condition.acquire()
+		try:
+			if this_job.state == 'queued':
+				self.waiting.remove(this_job)
+				this_job.state = 'cancelled'
+				return None
+		finally:
+			self.condition.release()
+		if this_job.state == 'running':
+			this_job.run.cancel()
+		return None
+
+	def cancel_all(self):
+		for this_job in list(self.jobs):
+			self.cancel(this_job)
+		return None
+
+	#Returns the number of jobs in each state
+	def counts(self):
+		counts = dict((state, 0) for state in ['queued', 'running', 'done', 'failed', 'cancelled'])
+		for this_job in list(self.jobs):
+			counts[this_job.state] += 1
+		return counts
+
+#Reads the step profiles of every run directory found in (or given as) the directories in dir_list. Returns a list of profile dictionaries, each with the run directory added.
+def read_profiles(dir_list):
+	profiles = []
+	for top_dir in dir_list:
+		candidates = [top_dir]
+		try:
+			candidates += [os.path.join(top_dir, d) for d in os.listdir(top_dir)]
+		except OSError:
+			continue
+		for run_dir in candidates:
+			try:
+				profile_file = open(os.path.join(run_dir, profile_name), 'r')
+			except IOError:
+				continue
+			for line in profile_file:
+				try:
+					profile = json.loads(line)
+				except ValueError:
+					continue
+				profile['run_dir'] = run_dir
+				profiles.append(profile)
+			profile_file.close()
+	return profiles
+
+#Totals the profiles by tool, purpose or command and ranks them by the chosen cost (wall, cpu, rss or io), most expensive first. Each command line is split into the commands it runs (see pims_core.step_commands), so that a step is put down to every tool in it, and tools are found by matching the start of each command against the COMMAND of the tools in the registry. A step running several tools counts, in full, towards each of them, as what each one used cannot be told apart. Returns a list of dictionaries with the group name, the number of steps and the totals.
+def summarise_profiles(profiles, registry, group_by='tool', sort_by='wall'):
+	groups = dict()
+	for profile in profiles:
+		if group_by == 'command':
+			step_groups = [profile['command']]
+		else:
+			step_groups = []
+			for part in pims_core.step_commands(profile['command']) or [profile['command']]:
+				tool_name = registry.match_command(part)
+				if group_by == 'tool':
+					group = tool_name if tool_name != None else part.split(' ')[0]
+				else:
+					group = registry.purpose_of(tool_name) if tool_name != None else '(unknown)'
+				if group not in step_groups:
+					step_groups.append(group)
+		for group in step_groups:
+			add_profile(groups, group, profile)
+	sort_keys = {'wall':'wall', 'cpu':'cpu', 'rss':'max_rss_kb', 'io':'io_bytes'}
+	return sorted(groups.values(), key=lambda totals: totals[sort_keys[sort_by]], reverse=True)
+
+#Adds one step's profile to the totals of a group
+def add_profile(groups, group, profile):
+	if group not in groups:
+		groups[group] = {'group':group, 'steps':0, 'failed':0, 'wall':0.0, 'cpu':0.0, 'max_rss_kb':0, 'io_bytes':0}
+	totals = groups[group]
+	totals['steps'] += 1
+	totals['failed'] += 1 if profile['exit_code'] != 0 else 0
+	totals['wall'] += profile['wall']
+	totals['cpu'] += profile['user_cpu']+profile['sys_cpu']
+	totals['max_rss_kb'] = max(totals['max_rss_kb'], profile['max_rss_kb'])
+	totals['io_bytes'] += profile['read_bytes']+profile['write_bytes']
+	return None
@@ -0,0 +1,95 @@
+#This is part of the source code for the Pipeline Interface and Management System (PIMS). PIMS was created by Joseph Gardner, Dept. of Genetics, University of Cambridge, UK, and is licensed under the Creative Commons Attribution-ShareAlike 4.0 International (CC BY-SA 4.0) license. See pims_v0.1.py or https://github.com/jg600/PIMS for full licensing information.
+
+#Optional tracing of where PIMS spends its time. The slow paths (reading tool files, building the purpose and tool frames, switching tools on and off, loading and saving configurations, writing scripts) are marked as spans, with the traced decorator or a span block. When tracing is switched on, by setting PIMS_TRACE to a file name or with pims.py --trace, each span is recorded and the whole trace is written to that file when PIMS exits, in the Chrome trace event format, which can be opened in chrome://tracing or https://ui.perfetto.dev. When it is off, a span costs one check of a module variable. Like pims_core.py, this does not import Tkinter.
+
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+
+#Whether spans are being recorded, the file the trace is written to, and the spans recorded so far as (name, category, start, duration, thread id, args) with times in seconds
+enabled = False
+trace_path = None
+events = []
+start_time = 0.0
+#Names of the threads spans were recorded in, by thread id
+thread_names = dict()
+
+#Starts recording spans, to be written to path when PIMS exits (or when save() is called)
+def start(path):
+	global enabled, trace_path, start_time
+	if enabled:
+		return None
+	trace_path = path
+	start_time = time.time()
+	enabled = True
+	atexit.register(save)
+	return None
+
+#Starts recording if the PIMS_TRACE environment variable names a file to write the trace to
+def start_from_env():
+	if os.getenv('PIMS_TRACE'):
+		start(os.getenv('PIMS_TRACE'))
+	return None
+
+def record(name, cat, start, duration, args=None):
+	this_thread = threading.current_thread()
+	thread_names[this_thread.ident] = this_thread.name
+	events.append((name, cat, start, duration, this_thread.ident, args))
+	return None
+
+#Writes the spans recorded so far to the trace file, as complete ("X") events with times in microseconds from the start of tracing. Threads are named, so that the job manager's workers are told apart from the GUI.
+def save():
+	if trace_path == None:
+		return None
+	pid = os.getpid()
+	trace_events = [{'name':'process_name', 'ph':'M', 'pid':pid, 'tid':0, 'args':{'name':'PIMS'}}]
+	for tid, thread_name in list(thread_names.items()):
+		trace_events.append({'name':'thread_name', 'ph':'M', 'pid':pid, 'tid':tid, 'args':{'name':thread_name}})
+	for name, cat, start, duration, tid, args in list(events):
+		event = {'name':name, 'cat':cat, 'ph':'X', 'ts':(start-start_time)*1e6, 'dur':duration*1e6, 'pid':pid, 'tid':tid}
+		if args != None:
+			event['args'] = args
+		trace_events.append(event)
+	trace_file = open(trace_path+'.tmp', 'w')
+	json.dump({'traceEvents':trace_events, 'displayTimeUnit':'ms'}, trace_file)
+	trace_file.close()
+	os.rename(trace_path+'.tmp', trace_path)
+	return None
+
+#Marks a block of code as a span:
+#	with pims_trace.span('list tools directory'):
+#		...
+class span:
+	def __init__(self, name, args=None, cat='pims'):
+		self.name = name
+		self.args = args
+		self.cat = cat
+		self.start = None
+
+	def __enter__(self):
+		if enabled:
+			self.start = time.time()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		if enabled and (self.start != None):
+			record(self.name, self.cat, self.start, time.time()-self.start, self.args)
+		return False
+
+#Decorator that marks every call of a function as a span. detail, if given, is called with the same arguments as the function (only while tracing) and returns a dictionary of details to record with the span, such as the tool name.
+def traced(name, detail=None, cat='pims'):
+	def decorate(func):
+		@functools.wraps(func)
+		def wrapper(*args, **kwargs):
+			if not enabled:
+				return func(*args, **kwargs)
+			start = time.time()
+			try:
+				return func(*args, **kwargs)
+			finally:
+				record(name, cat, start, time.time()-start, detail(*args, **kwargs) if detail != None else None)
+		return wrapper
+	return decorate
@@ -11,35 +11,82 @@ import subprocess as sub
 import os
 import re
 import time
+import pims_core
+import pims_run
+import pims_view
+import pims_trace
+import pims_check
+import pims_watch
+import pims_history
+
+#Record where the time goes if PIMS_TRACE names a trace file (see pims_trace.py)
+pims_trace.start_from_env()
 
 #Create the directory structure needed, if it isn't in place already. This is a possible issue for cross-platforming, and needs to be checked (although os.getenv might work across the board).
-pipeline_path = os.getenv("HOME")+'/pipeline'
-if (not os.path.isdir(pipeline_path)):
-	os.makedirs(pipeline_path)
-for folder in ['/tools/', '/config/', '/scripts/', '/outputs/']:
-	if (not os.path.isdir(pipeline_path+folder)):
-		os.makedirs(pipeline_path+folder)
-
-#Each bioinformatics tool is assigned a purpose when it is added to the list of tools in PIMS. This function creates a list of all the purposes found in the current tool set.
+pipeline_path = pims_core.get_pipeline_path()
+pims_core.make_pipeline_dirs(pipeline_path)
+
+#All tool files are read once into this registry (see pims_core.py), which every window and the script generation use instead of opening the tool files themselves. After that it is kept up to date by pipeline_dirs (below), re-reading only the tool files that change.
+tool_index = pims_core.tool_registry(pipeline_path+'/tools/')
+
+#Each bioinformatics tool is assigned a purpose when it is added to the list of tools in PIMS. This function creates a list of all the purposes found in the current tool set, from the tool registry.
 global purposes_list
 
+@pims_trace.traced('make_purposes_list')
 def make_purposes_list():
 	global purposes_list
-	purposes_list = []
-	for filename in os.listdir(pipeline_path+'/tools/'):
-			#In case another file has ended up in there
-			if (re.search(r'\.tool$', filename)):
-				tool_file = open(pipeline_path+"/tools/%s" % filename, 'r')
-				for line in tool_file:
-					if (re.search(r'^PURPOSE', line)):
-						line_list = line.rstrip().split(':')
-						if (line_list[1] not in purposes_list):
-							purposes_list.append(line_list[1])	
+	tool_index.ensure_loaded()
+	purposes_list = list(tool_index.purposes_list)
 	return None
 
 #Initialise the list of purposes
 make_purposes_list()
+
+#Watches the tools, config and scripts directories (see pims_watch.py), so that tools, configurations and scripts added, changed or removed by anyone - another PIMS, pims.py, or a user sharing the directories - show up in the open windows within watch_ms milliseconds, without the directories ever being listed again. Windows that show one of these lists register a function with add_dir_listener, which is called with the names that changed in each directory ({'tools':names, 'config':names, 'scripts':names}) whenever something has.
+pipeline_dirs = pims_watch.pipeline_watcher(pipeline_path)
+watch_ms = 1000
+#[widget, function] for each open window that wants to know about changes, dropped once the widget has been destroyed
+dir_listeners = []
+
+def add_dir_listener(widget, listener):
+	dir_listeners.append([widget, listener])
+	return None
+
+#Picks up the changes since the last poll: changed tool files are re-read into the registry, and the open windows are told. Called every watch_ms milliseconds, and straight away when something that might have just been changed is needed.
+def poll_pipeline_dirs():
+	global dir_listeners
+	changes = pipeline_dirs.poll()
+	if (len(changes['tools']) > 0) and tool_index.refresh_files(changes['tools']):
+		make_purposes_list()
+	if len([names for names in changes.values() if len(names) > 0]) == 0:
+		return changes
+	open_listeners = []
+	for widget, listener in dir_listeners:
+		try:
+			if not widget.winfo_exists():
+				continue
+		except TclError:
+			continue
+		open_listeners.append([widget, listener])
+		listener(changes)
+	dir_listeners = open_listeners
+	return changes
+
+def watch_pipeline_dirs():
+	poll_pipeline_dirs()
+	root.after(watch_ms, watch_pipeline_dirs)
+	return None
+
+#Pipelines launched from the jobs window run in the background through this (see pims_run.job_manager), one per core at a time unless changed in the window. It lives as long as PIMS does, so jobs keep running when the jobs window is closed and are still listed when it is opened again.
+pipeline_jobs = pims_run.job_manager(keep_script=True)
+#The cores and memory of this machine, shared out between the steps of those jobs as their tools declare (THREADS and MEMORY in the .tool files, see pims_run.resource_pool)
+machine_resources = pims_run.resource_pool()
+#Every script written and every job run is recorded here (see pims_history.py), or nowhere if PIMS_HISTORY=off
+run_history = pims_history.default_history()
 				
+#Tool fields that are entered in a single line Entry widget in the add and edit windows (the rest, FLAGS, OPTIONS and ARGUMENTS, are lists entered one per line). The optional fields (see pims_core.tool_fields) are only written to the tool file if they are given a value.
+entry_fields = ['NAME', 'PURPOSE', 'COMMAND'] + pims_core.optional_tool_fields
+
 #Set up the root for the Tkinter GUI and hide it
 root = Tk()
 root.withdraw()
@@ -58,7 +105,13 @@ def error_message(opt=None, problem_string=None):
 8:'The tool %s does not exist. Please choose another, or create a new tool.' % problem_string,
 9:'Please choose a script to view.',
 10:'The script %s does not exist. Please choose another, or create a new script.' % problem_string,
-11:'Please choose at least one purpose'
+11:'Please choose at least one purpose',
+12:'%s is not a PIMS script and cannot be run.' % problem_string,
+13:'Please choose at least one script to run.',
+14:'Only the output of runs can be followed. Please choose a run log.',
+15:'The tool %s could not be saved.' % problem_string,
+16:'The script was written, but these problems will stop it running:\n%s' % problem_string,
+17:'The script could not be written: %s' % problem_string
 }
 	if ((opt != None) & (opt in error_msgs.keys())):
 		popup = Toplevel()
@@ -71,9 +124,11 @@ def error_message(opt=None, problem_string=None):
 	else:
 		return None
 
-#Define the class purpose_frame. Each purpose in the list has a frame associated with it. The purpose frame contains a tool frame for each tool with the relevant purpose. These tool_frames are stored in a dictionary, with tool names used as keys.
+#Define the class purpose_frame. Each purpose in the list has a frame associated with it. The purpose frame contains a tool frame for each tool with the relevant purpose. These tool_frames are stored in a dictionary, with tool names used as keys. fan_out_var is the IntVar of the window's "Fan out" checkbutton, if it has one.
 class purpose_frame:
-	def __init__(self, parent, purpose, row_num):
+	@pims_trace.traced('purpose_frame', lambda self, parent, purpose, row_num, fan_out_var=None: {'purpose':purpose})
+	def __init__(self, parent, purpose, row_num, fan_out_var=None):
+		self.fan_out_var = fan_out_var
 		#Define the LabelFrame widget and place it
 		self.frame = ttk.LabelFrame(parent, padding = "3 3 12 12", text = purpose, borderwidth = '2m', relief = GROOVE)
 		self.frame.grid(column=0, row = row_num, sticky = (N,W))
@@ -83,26 +138,20 @@ class purpose_frame:
 		#Create the dictionary used to hold the tool frames
 		self.tool_frame_dict = dict()
 		col_num = 0
-		#Populate the dictionary by searching through the pipeline file system and opening each tool file in turn
-		for filename in os.listdir(pipeline_path+'/tools/'):
-			if (re.search(r'\.tool$', filename)):
-				#Open each tool file and save the fields as a dictionary for use by the tool_frame class
-				tool_name = filename.split('.')[0]
-				tool_file = open(pipeline_path+"/tools/%s" % filename, 'r')
-				tool_dict = dict()
-				for line in tool_file:
-					line_list = line.rstrip().split(':')
-					tool_dict[line_list[0]] = line_list[1]
-				#If the tool is of the correct purpose, create a tool frame for it, which is made inactive
-				if tool_dict['PURPOSE'] == purpose:
-					self.tool_frame_dict[tool_name] = tool_frame(self.frame, tool_dict, col_num)
-					self.tool_frame_dict[tool_name].make_inactive()
-					#Bind a a click to the frame to change activity state
-					self.tool_frame_dict[tool_name].frame.bind('<Button-1>', lambda event, this_tool=tool_name: self.change_state(this_tool))
-					col_num += 1
-	#Define the function used to change the state of a tool frame
+		#Populate the dictionary from the tool registry, which already holds the fields of each tool of this purpose as a dictionary for use by the tool_frame class
+		for tool_name in tool_index.tools_for_purpose(purpose):
+			tool_dict = tool_index.get(tool_name)
+			#Create a tool frame for each tool, which is made inactive
+			self.tool_frame_dict[tool_name] = tool_frame(self.frame, tool_dict, col_num)
+			self.tool_frame_dict[tool_name].make_inactive()
+			#Bind a a click to the frame to change activity state
+			self.tool_frame_dict[tool_name].bind_click(lambda event, this_tool=tool_name: self.change_state(this_tool))
+			col_num += 1
+	#Define the function used to change the state of a tool frame. Only one tool of a purpose can be active, unless the pipeline fans out (see pims_core.fan_out_variants), in which case each active tool gets a branch of its own.
 	def change_state(self, this_tool):
-		if self.tool_frame_dict[this_tool].state == 'inactive':
+		if (self.tool_frame_dict[this_tool].state == 'inactive') and (self.fan_out_var != None) and (self.fan_out_var.get() == 1):
+			self.tool_frame_dict[this_tool].make_active()
+		elif self.tool_frame_dict[this_tool].state == 'inactive':
 			for tool in self.tool_frame_dict.keys():
 				if (tool != this_tool) & (self.tool_frame_dict[tool].tool_dict['PURPOSE']==self.tool_frame_dict[this_tool].tool_dict['PURPOSE']):
 					self.tool_frame_dict[tool].make_inactive()
@@ -112,7 +161,9 @@ class purpose_frame:
 			self.tool_frame_dict[this_tool].make_inactive()
 
 #Define the class for a tool frame, which requires a parent widget (i.e., a purpose_frame), a dictionary with tool information (name, purpose, command, etc.), and its column within the parent's grid. Tool frames can be active or inactive - if they are active they will be used in the final pipeline script. Activity control is through the purpose_frame class, as this makes it easier to control all tool_frames at once (and, in particular, to make sure at most one is active at a time).
+#To keep the pipeline window quick to open with a large number of tools, a tool frame only shows a one line summary until it is first made active. The widgets for its flags, options and arguments are created at that point. Until then, any values given to it (e.g. by loading a configuration) are kept in self.values, and get_values/set_value work the same whether or not the widgets exist.
 class tool_frame:
+	@pims_trace.traced('tool_frame', lambda self, parent, tool_dict, col_num: {'tool':tool_dict['NAME']})
 	def __init__(self, parent, tool_dict, col_num):
 		self.tool_dict = tool_dict
 		#Initialise the state field, which records whether the frame is active or not
@@ -122,6 +173,24 @@ class tool_frame:
 		self.frame.grid(column = col_num, row = 0)
 		self.frame.columnconfigure(0, weight = 1)
 		self.frame.rowconfigure(0, weight = 1)
+		#Values of the flags, options and arguments, laid out as a parsed config line (see pims_core.parse_config_line). Only used until the widgets are built.
+		self.values = {'FLAGS':dict(), 'OPTIONS':dict(), 'ARGUMENTS':dict()}
+		self.built = False
+		counts = [len([name for name in self.tool_dict[field].split(',') if name != '']) for field in ['FLAGS', 'OPTIONS', 'ARGUMENTS']]
+		self.header_label = ttk.Label(self.frame, text = '%d flags, %d options, %d arguments' % tuple(counts))
+		self.header_label.grid(column = 0, row = 0, sticky = (N,W))
+
+	#Binds a click on the frame (or on its summary line) to the given function
+	def bind_click(self, callback):
+		self.frame.bind('<Button-1>', callback)
+		self.header_label.bind('<Button-1>', callback)
+
+	#Creates the widgets for the flags, options and arguments, filled in with any values already given
+	@pims_trace.traced('tool_frame.build_widgets', lambda self: {'tool':self.tool_dict['NAME']})
+	def build_widgets(self):
+		if self.built:
+			return None
+		self.header_label.grid_forget()
 		row_num = 1
 		#Tools can have flags (on/off switches), options (i.e., keyword arguments), and arguments (non-keyword, order-dependent arguments). For each of FLAGS, OPTIONS and ARGUMENTS, check if any have been given, then create a dictionary to hold a list of widgets/vars for each
 		if self.tool_dict['FLAGS'] != '':
@@ -134,11 +203,12 @@ class tool_frame:
 					self.flags_dict[flag].append(ttk.Label(self.frame, text = flag))
 					self.flags_dict[flag][0].grid(column=0, row = row_num, sticky = (N,E))
 					self.flags_dict[flag].append(IntVar())
+					self.flags_dict[flag][1].set(1 if str(self.values['FLAGS'].get(flag, 0)) == '1' else 0)
 					self.flags_dict[flag].append(Checkbutton(self.frame, variable = self.flags_dict[flag][1]))
 					self.flags_dict[flag][2].grid(column=1, row = row_num, sticky = (N,W))
 					row_num += 1
 				else:
-					continue
+					del self.flags_dict[flag]
 
 		if self.tool_dict['OPTIONS'] != '':
 			options_list = self.tool_dict['OPTIONS'].split(',')
@@ -151,11 +221,12 @@ class tool_frame:
 					self.options_dict[opt].append(ttk.Label(self.frame, text = opt))
 					self.options_dict[opt][0].grid(column=0, row = row_num, sticky = (N,W))
 					self.options_dict[opt].append(StringVar())
+					self.options_dict[opt][1].set(self.values['OPTIONS'].get(opt, ''))
 					self.options_dict[opt].append(ttk.Entry(self.frame, textvariable = self.options_dict[opt][1]))
 					self.options_dict[opt][2].grid(column=1, row = row_num, sticky = (N,W))
 					row_num += 1
 				else:
-					continue
+					del self.options_dict[opt]
 
 		if self.tool_dict['ARGUMENTS'] != '':
 			arguments_list = self.tool_dict['ARGUMENTS'].split(',')
@@ -168,26 +239,34 @@ class tool_frame:
 					self.arguments_dict[arg].append(ttk.Label(self.frame, text = '<'+arg+'>'))
 					self.arguments_dict[arg][0].grid(column=0, row = row_num, sticky = (N,W))
 					self.arguments_dict[arg].append(StringVar())
+					self.arguments_dict[arg][1].set(self.values['ARGUMENTS'].get(arg, ''))
 					self.arguments_dict[arg].append(ttk.Entry(self.frame, textvariable = self.arguments_dict[arg][1]))
 					self.arguments_dict[arg][2].grid(column=1, row = row_num, sticky = (N,W))
 					row_num += 1
 				else:
-					continue
-	#These are called by the purpose_frame parent to change the activity state of a given tool_frame.
+					del self.arguments_dict[arg]
+		self.built = True
+		return None
+
+	#These are called by the purpose_frame parent to change the activity state of a given tool_frame. An inactive frame whose widgets have not been built yet has nothing to disable.
+	@pims_trace.traced('tool_frame.make_inactive', lambda self: {'tool':self.tool_dict['NAME']})
 	def make_inactive(self):
 		self.frame.configure(relief = SUNKEN)
-		if self.tool_dict['FLAGS'] != '':
-			for flag in self.flags_dict.keys():
-				self.flags_dict[flag][2].configure(state=DISABLED)
-		if self.tool_dict['OPTIONS'] != '':
-			for opt in self.options_dict.keys():
-				self.options_dict[opt][2].configure(state=DISABLED)
-		if self.tool_dict['ARGUMENTS'] != '':
-			for arg in self.arguments_dict.keys():
-				self.arguments_dict[arg][2].configure(state=DISABLED)
+		if self.built:
+			if self.tool_dict['FLAGS'] != '':
+				for flag in self.flags_dict.keys():
+					self.flags_dict[flag][2].configure(state=DISABLED)
+			if self.tool_dict['OPTIONS'] != '':
+				for opt in self.options_dict.keys():
+					self.options_dict[opt][2].configure(state=DISABLED)
+			if self.tool_dict['ARGUMENTS'] != '':
+				for arg in self.arguments_dict.keys():
+					self.arguments_dict[arg][2].configure(state=DISABLED)
 		self.state = 'inactive'
 	
+	@pims_trace.traced('tool_frame.make_active', lambda self: {'tool':self.tool_dict['NAME']})
 	def make_active(self):
+		self.build_widgets()
 		self.frame.configure(relief = RAISED)
 		if self.tool_dict['FLAGS'] != '':
 			for flag in self.flags_dict.keys():
@@ -200,11 +279,43 @@ class tool_frame:
 				self.arguments_dict[arg][2].configure(state=NORMAL)
 		self.state = 'active'
 
+	#Returns the current values of the flags, options and arguments, in the same layout as a parsed config line (see pims_core.parse_config_line), for use in saving configurations and script generation. These come from the widgets if they have been built, and from self.values otherwise.
+	def get_values(self):
+		if not self.built:
+			return {'FLAGS':dict(self.values['FLAGS']), 'OPTIONS':dict(self.values['OPTIONS']), 'ARGUMENTS':dict(self.values['ARGUMENTS'])}
+		values = {'FLAGS':dict(), 'OPTIONS':dict(), 'ARGUMENTS':dict()}
+		if self.tool_dict['FLAGS'] != '':
+			for flag in self.flags_dict.keys():
+				values['FLAGS'][flag] = self.flags_dict[flag][1].get()
+		if self.tool_dict['OPTIONS'] != '':
+			for opt in self.options_dict.keys():
+				values['OPTIONS'][opt] = self.options_dict[opt][1].get()
+		if self.tool_dict['ARGUMENTS'] != '':
+			for arg in self.arguments_dict.keys():
+				values['ARGUMENTS'][arg] = self.arguments_dict[arg][1].get()
+		return values
+
+	#Sets the value of one flag, option or argument (field is FLAGS, OPTIONS or ARGUMENTS). Names the tool does not have are ignored.
+	def set_value(self, field, name, value):
+		if name not in self.tool_dict[field].split(','):
+			return None
+		if not self.built:
+			self.values[field][name] = value
+		elif field == 'FLAGS':
+			self.flags_dict[name][1].set(1 if str(value) == '1' else 0)
+		elif field == 'OPTIONS':
+			self.options_dict[name][1].set(value)
+		elif field == 'ARGUMENTS':
+			self.arguments_dict[name][1].set(value)
+		return None
+
 
 #Define the basic class for a new window. This is the parent class for all windows (except error messages and similar popups). It opens a toplevel window, and places a canvas widget inside this. This canvas has vertical and horizontal scrollbars associated with it. A frame is put inside the canvas as a holder for subsequent widgets.
 
 class window(Frame):
 	def __init__(self):
+		#Pick up anything changed since the watcher was last polled, so that the new window starts up to date
+		poll_pipeline_dirs()
 		self.top = Toplevel()
 		Frame.__init__(self, self.top)
 		self.canvas = Canvas(self.top)
@@ -230,7 +341,7 @@ class addtool_window(window):
 		self.top.title('Add tool')
 
 		#List of fields that need to be populated for a tool
-		self.labels_list = ['NAME', 'PURPOSE', 'COMMAND', 'FLAGS', 'OPTIONS', 'ARGUMENTS']
+		self.labels_list = list(pims_core.tool_fields)
 
 		#Define and fill a dictionary that use the above labels as keys. Values are a
 		#list of either [Label_widget, StringVar, Entry_widget] or [Label_widget, Text_widget]. The textvariable for the entry
@@ -241,7 +352,7 @@ class addtool_window(window):
 		for lab in self.labels_list:
 			self.rows_dict[lab].append(ttk.Label(self.mainframe, text = lab))
 			self.rows_dict[lab][0].grid(column = 0, row = row_num, sticky = (N,W))
-			if lab in ['NAME', 'PURPOSE', 'COMMAND']:
+			if lab in entry_fields:
 				self.rows_dict[lab].append(StringVar())
 				self.rows_dict[lab].append(ttk.Entry(self.mainframe, textvariable = self.rows_dict[lab][1], width=30))
 				self.rows_dict[lab][2].grid(column = 1, row = row_num, sticky = (N,W))
@@ -302,25 +413,37 @@ class addtool_window(window):
 	#Function for adding a new tool. The directory is checked to see if the file already exists. The file is created and populated, and the purposes list
 	#is updated. The entry widgets are cleared to make way for a new tool entry.
 	def add_tool(self):
-		if "%s.tool" % self.rows_dict['NAME'][2].get() in os.listdir(pipeline_path+"/tools/"):
+		poll_pipeline_dirs()
+		if self.rows_dict['NAME'][2].get() in tool_index.tool_names():
 			error_message(opt=6, problem_string=self.rows_dict['NAME'][2].get())
 			return None
 		self.add_to_list('FLAGS')
 		self.add_to_list('OPTIONS')
 		self.add_to_list('ARGUMENTS')
-		tool_path = pipeline_path+"/tools/%s.tool" % self.rows_dict['NAME'][2].get()
-		tool_file = open(tool_path,'w')
-		tool_file.seek(0,0)
-		tool_file.write("NAME:%s\n" % self.rows_dict['NAME'][1].get())
-		tool_file.write("PURPOSE:%s\n" % self.rows_dict['PURPOSE'][1].get())
-		tool_file.write("COMMAND:%s\n" % self.rows_dict['COMMAND'][1].get())
+		tool_dict = dict()
+		for k in entry_fields:
+			tool_dict[k] = self.rows_dict[k][1].get()
 		for k in self.list_dict.keys():
-			inputs_str = ','.join(map(str, self.list_dict[k]))
-			tool_file.write("%s:%s\n" % (k, inputs_str))
-		tool_file.close()
+			tool_dict[k] = ','.join(map(str, self.list_dict[k]))
+		try:
+			pims_core.tool_resources(tool_dict)
+		except pims_core.pims_error:
+			error_message(opt=1, problem_string='%s/%s' % (tool_dict['THREADS'], tool_dict['MEMORY']))
+			return None
+		try:
+			pims_core.split_record_lines(tool_dict)
+		except pims_core.pims_error:
+			error_message(opt=1, problem_string=tool_dict['SPLIT_BY'])
+			return None
+		#The tool is written through the registry, as a .tool file or into the tool catalog
+		try:
+			tool_index.save_tool(self.rows_dict['NAME'][2].get(), tool_dict)
+		except pims_core.pims_error:
+			error_message(opt=15, problem_string=self.rows_dict['NAME'][2].get())
+			return None
 		make_purposes_list()
 		for lab in self.labels_list:
-			if lab in ['NAME', 'PURPOSE', 'COMMAND']:
+			if lab in entry_fields:
 				self.rows_dict[lab][2].delete(0,END)
 			elif lab in ['FLAGS', 'OPTIONS', 'ARGUMENTS']:
 				self.rows_dict[lab][1].delete('1.0',END)
@@ -328,72 +451,380 @@ class addtool_window(window):
 			self.list_dict[k] = []
 		return None
 
-#Window for viewing scripts that have already been generated. Error messages are generated if no tool is selected, or if the selected tool does not exist for some reason (although that should not happen - I think it could only occur if someone opened this window and generated the list and then deleted the relevant script before trying to view it). 
+#A Text widget that shows one page of a file at a time, with its own scrollbar, so that files of any size (large scripts and run logs) can be viewed without loading them. The file is read through a pims_view.file_pager, and only the lines on screen are ever put into the Text widget. The scrollbar position follows the position in the file by bytes, so the number of lines never has to be counted.
+class paged_text:
+	def __init__(self, parent, row_num, col_num, columnspan = 1, page_lines = 50):
+		self.page_lines = page_lines
+		self.text = Text(parent, width = 100, height = page_lines)
+		self.scrollbar = Scrollbar(parent, orient = VERTICAL, command = self.on_scroll)
+		self.row_num = row_num
+		self.col_num = col_num
+		self.columnspan = columnspan
+		self.pager = None
+		self.start = 0
+		self.end = 0
+		#The mouse wheel moves through the file rather than within the page shown
+		self.text.bind('<MouseWheel>', lambda event: self.on_wheel(-1 if event.delta > 0 else 1))
+		self.text.bind('<Button-4>', lambda event: self.on_wheel(-1))
+		self.text.bind('<Button-5>', lambda event: self.on_wheel(1))
+
+	def show(self):
+		self.text.grid(column = self.col_num, row = self.row_num, columnspan = self.columnspan, sticky = (N,W))
+		self.scrollbar.grid(column = self.col_num+self.columnspan, row = self.row_num, sticky = (N,S))
+
+	#Opens a file (closing any file already open) and shows its first page
+	def open_file(self, path):
+		self.close()
+		self.pager = pims_view.file_pager(path)
+		self.show_from(0)
+
+	def close(self):
+		if self.pager != None:
+			self.pager.close()
+			self.pager = None
+
+	#Shows the page of lines starting at offset (the start of a line) and moves the scrollbar to match
+	def show_from(self, offset):
+		lines, self.end = self.pager.lines_from(offset, self.page_lines)
+		#Near the end of the file, show a full last page rather than a part-empty one
+		if (len(lines) < self.page_lines) and (offset > 0):
+			offset = self.pager.lines_back(self.pager.line_start(self.pager.size-1), self.page_lines-1)
+			lines, self.end = self.pager.lines_from(offset, self.page_lines)
+		self.start = offset
+		self.text.configure(state = NORMAL)
+		self.text.delete('1.0', END)
+		self.text.insert('1.0', '\n'.join(lines))
+		self.text.configure(state = DISABLED)
+		if self.pager.size > 0:
+			self.scrollbar.set(float(self.start)/self.pager.size, float(self.end)/self.pager.size)
+		else:
+			self.scrollbar.set(0.0, 1.0)
+
+	#Called by the scrollbar, with either ('moveto', fraction) or ('scroll', number, 'units'/'pages')
+	def on_scroll(self, *args):
+		if self.pager == None:
+			return None
+		if args[0] == 'moveto':
+			fraction = min(max(float(args[1]), 0.0), 1.0)
+			self.show_from(self.pager.line_start(int(fraction*self.pager.size)))
+		elif args[0] == 'scroll':
+			lines = int(args[1])
+			if args[2] == 'pages':
+				lines = lines*(self.page_lines-1)
+			if lines > 0:
+				if self.end < self.pager.size:
+					self.show_from(self.pager.lines_from(self.start, lines)[1])
+			elif lines < 0:
+				self.show_from(self.pager.lines_back(self.start, -lines))
+		return None
+
+	def on_wheel(self, direction):
+		self.on_scroll('scroll', 3*direction, 'units')
+		return 'break'
+
+#Window for viewing scripts that have already been generated, and the logs of runs made with pims.py run (PIMS.log in each run directory). Nothing is opened until a file is chosen, and files are shown a page at a time (see paged_text), so the window opens quickly however many scripts there are and can show files of any size. Error messages are generated if no script is selected, or if the selected script does not exist for some reason (e.g. if someone deleted it after this window was opened).
 class viewscripts_window(window):
 	def __init__(self):
 		window.__init__(self)
 		self.top.title("View scripts")
+		#Maps each name shown in the combobox to the path of its file. The entries come from pipeline_dirs, and follow scripts and runs coming and going while the window is open (see update_scripts).
 		self.script_dict = dict()
-		for filename in os.listdir(pipeline_path+'/scripts/'):
-			if (re.search(r'\.script$', filename)):
-				script_name = filename.split('.')[0]
-				self.script_dict[script_name] = open(pipeline_path+"/scripts/%s" % filename, 'r')
+		#Run directories made while the window is open, whose log has not been written yet
+		self.pending_runs = set()
+		for filename in pipeline_dirs.dirs['scripts'].names:
+			self.add_entry(filename)
+		#Runs that were already there without a log (scripts run directly with bash) are not waited for
+		self.pending_runs = set()
+		self.is_open = True
 		self.script_sel_label = ttk.Label(self.mainframe, text = "Select script: ")
 		self.script_sel_label.grid(column=0, row=0, sticky = (N,W))
 		self.selected_script = StringVar()
-		self.script_combobox = ttk.Combobox(self.mainframe, values = self.script_dict.keys(), textvariable = self.selected_script)
+		self.script_combobox = ttk.Combobox(self.mainframe, values = sorted(self.script_dict.keys()), textvariable = self.selected_script)
 		self.script_combobox.grid(column=1, row=0, sticky=(N,W))
 		self.view_button = ttk.Button(self.mainframe, text = 'View', command = self.view_script)
 		self.view_button.grid(column=2, row=0, sticky = (N,W))
-		self.cancel_button = ttk.Button(self.mainframe, text = 'Cancel', command = self.top.destroy)
-		self.cancel_button.grid(column=3, row=0, sticky = (N,W))
-		self.script_text = Text(self.mainframe, width = 100, height = 50)
+		self.follow_button = ttk.Button(self.mainframe, text = 'Follow output', command = self.follow_output)
+		self.follow_button.grid(column=3, row=0, sticky = (N,W))
+		self.cancel_button = ttk.Button(self.mainframe, text = 'Cancel', command = self.close)
+		self.cancel_button.grid(column=4, row=0, sticky = (N,W))
+		self.script_text = paged_text(self.mainframe, 1, 0, columnspan = 5)
+		self.top.protocol('WM_DELETE_WINDOW', self.close)
+		add_dir_listener(self.top, self.update_scripts)
+		#Checks for logs in new run directories (see add_entry), for as long as there are any waiting
+		self.top.after(watch_ms, self.check_pending)
+
+	run_dir_pattern = re.compile(r'^[\w-]+_\d{8}_\d{6}(_\d+)?$')
+
+	#Adds the entry for one name in the scripts directory, if it is a script or a run directory with a log. Run directories whose log is not there yet are kept in pending_runs, to be looked at again.
+	def add_entry(self, filename):
+		if (re.search(r'\.script$', filename)):
+			self.script_dict[filename.split('.')[0]] = pipeline_path+"/scripts/%s" % filename
+		elif re.match(self.run_dir_pattern, filename):
+			log_path = pipeline_path+"/scripts/%s/%s" % (filename, pims_run.log_name)
+			if os.path.isfile(log_path):
+				self.script_dict['%s/%s' % (filename, pims_run.log_name)] = log_path
+				self.pending_runs.discard(filename)
+			else:
+				self.pending_runs.add(filename)
+		return None
+
+	def update_scripts(self, changes):
+		if len(changes['scripts']) == 0:
+			return None
+		for filename in changes['scripts']:
+			self.script_dict.pop(filename.split('.')[0] if re.search(r'\.script$', filename) else '%s/%s' % (filename, pims_run.log_name), None)
+			self.pending_runs.discard(filename)
+			if filename in pipeline_dirs.dirs['scripts'].names:
+				self.add_entry(filename)
+		self.script_combobox.configure(values = sorted(self.script_dict.keys()))
+		return None
+
+	def check_pending(self):
+		if not self.is_open:
+			return None
+		if len(self.pending_runs) > 0:
+			for filename in list(self.pending_runs):
+				self.add_entry(filename)
+			self.script_combobox.configure(values = sorted(self.script_dict.keys()))
+		self.top.after(watch_ms, self.check_pending)
+		return None
 
-	#Shows the Text widget and displays the script
+	#Shows the paged Text widget and displays the chosen file. Another file can be chosen and viewed afterwards.
 	def view_script(self):
+		if str(self.selected_script.get()) == '':
+			error_message(opt=9, problem_string = None)
+			return None
+		elif (str(self.selected_script.get()) not in self.script_dict.keys()) or (not os.path.isfile(self.script_dict[self.selected_script.get()])):
+			error_message(opt=10, problem_string = str(self.selected_script.get()))
+			return None
+		self.script_text.show()
+		self.script_text.open_file(self.script_dict[self.selected_script.get()])
+
+	#For a run log, opens a window following the output of the steps of that run as they are written
+	def follow_output(self):
 		if str(self.selected_script.get()) == '':
 			error_message(opt=9, problem_string = None)
 			return None
 		elif str(self.selected_script.get()) not in self.script_dict.keys():
 			error_message(opt=10, problem_string = str(self.selected_script.get()))
 			return None
-		self.script_combobox.configure(state=DISABLED)
-		selected_script_file = self.script_dict[self.selected_script.get()]
-		self.script_text.grid(column=0, row = 1, columnspan=4)
-		i = 1
-		for line in selected_script_file.readlines():
-			self.script_text.insert('%d.0' % i, line)
-			i += 1
-		selected_script_file.close()
-		self.script_text.configure(state = DISABLED)
-		self.view_button.configure(state=DISABLED)
+		elif os.path.basename(self.script_dict[self.selected_script.get()]) != pims_run.log_name:
+			error_message(opt=14, problem_string = None)
+			return None
+		log1 = log_window(os.path.dirname(self.script_dict[self.selected_script.get()]))
+		return None
+
+	#Closes the file being viewed along with the window
+	def close(self):
+		self.is_open = False
+		self.script_text.close()
+		self.top.destroy()
 		
 		
+#Window for running scripts without waiting for them. Scripts chosen from the list are handed to pipeline_jobs, which runs them in the background up to the chosen number at a time, and the table of jobs below is brought up to date every poll_ms milliseconds with root.after, so the GUI never waits on a running pipeline. Queued and running jobs can be cancelled. Scripts are kept after they have run, so they can be run again from here.
+class jobs_window(window):
+	poll_ms = 500
+	
+	def __init__(self):
+		window.__init__(self)
+		self.top.title("Jobs")
+		self.is_open = True
+		self.script_label = ttk.Label(self.mainframe, text = "Scripts: ")
+		self.script_label.grid(column=0, row=0, sticky = (N,W))
+		self.script_list = StringVar()
+		self.script_listbox = Listbox(self.mainframe, listvariable = self.script_list, selectmode = EXTENDED, height = 8, exportselection = False)
+		self.script_listbox.grid(column=1, row=0, columnspan=2, sticky = (N,W,E))
+		self.run_button = ttk.Button(self.mainframe, text = 'Run selected', command = self.run_scripts)
+		self.run_button.grid(column=3, row=0, sticky = (N,W))
+		self.limit_label = ttk.Label(self.mainframe, text = "Run at once: ")
+		self.limit_label.grid(column=0, row=1, sticky = (N,W))
+		self.limit_var = IntVar()
+		self.limit_var.set(pipeline_jobs.max_running)
+		self.limit_spinbox = Spinbox(self.mainframe, from_ = 1, to = 256, width = 5, textvariable = self.limit_var, command = self.set_limit)
+		self.limit_spinbox.grid(column=1, row=1, sticky = (N,W))
+		self.limit_spinbox.bind('<Return>', self.set_limit)
+		self.status_var = StringVar()
+		self.status_label = ttk.Label(self.mainframe, textvariable = self.status_var)
+		self.status_label.grid(column=2, row=1, columnspan=2, sticky = (N,W))
+		#One row per job, keyed by job_id. The values last shown for each job are kept in shown_values, so that only the rows that have changed are updated on each poll.
+		self.job_tree = ttk.Treeview(self.mainframe, columns = ('script', 'state', 'elapsed', 'exit'), show = 'headings', height = 15)
+		for column, heading, width in [('script', 'Script', 250), ('state', 'State', 90), ('elapsed', 'Elapsed', 90), ('exit', 'Exit code', 80)]:
+			self.job_tree.heading(column, text = heading)
+			self.job_tree.column(column, width = width)
+		self.job_tree.grid(column=0, row=2, columnspan=4, sticky = (N,W,E,S))
+		self.shown_values = dict()
+		self.cancel_job_button = ttk.Button(self.mainframe, text = 'Cancel selected jobs', command = self.cancel_jobs)
+		self.cancel_job_button.grid(column=0, row=3, columnspan=2, sticky = (N,W))
+		self.follow_button = ttk.Button(self.mainframe, text = 'Follow output', command = self.follow_jobs)
+		self.follow_button.grid(column=2, row=3, sticky = (N,W))
+		self.close_button = ttk.Button(self.mainframe, text = 'Close', command = self.close)
+		self.close_button.grid(column=3, row=3, sticky = (N,E))
+		self.top.protocol('WM_DELETE_WINDOW', self.close)
+		self.script_names = []
+		self.list_scripts()
+		add_dir_listener(self.top, self.update_scripts)
+		self.poll()
+	
+	#Fills the list with the scripts currently in the scripts directory (as known to pipeline_dirs), keeping the scripts that were selected selected
+	def list_scripts(self):
+		selected = set([self.script_names[int(i)] for i in self.script_listbox.curselection() if int(i) < len(self.script_names)])
+		self.script_names = pipeline_dirs.file_names('scripts', '.script')
+		self.script_list.set(' '.join(self.script_names))
+		self.script_listbox.selection_clear(0, END)
+		for i, script_name in enumerate(self.script_names):
+			if script_name in selected:
+				self.script_listbox.selection_set(i)
+		return None
+
+	def update_scripts(self, changes):
+		if len([name for name in changes['scripts'] if name.endswith('.script')]) > 0:
+			self.list_scripts()
+		return None
+	
+	#Queues every selected script, apart from those already queued or running
+	def run_scripts(self):
+		selected = [self.script_names[int(i)] for i in self.script_listbox.curselection()]
+		if len(selected) == 0:
+			error_message(opt=13, problem_string = None)
+			return None
+		active = set([this_job.run.script_path for this_job in pipeline_jobs.jobs if this_job.state in ['queued', 'running']])
+		for script_name in selected:
+			script_path = os.path.abspath(pipeline_path+'/scripts/%s.script' % script_name)
+			if script_path in active:
+				continue
+			try:
+				pipeline_jobs.submit(pims_run.pipeline_run(script_path, resources = machine_resources, registry = tool_index, history = run_history))
+			except (pims_core.pims_error, IOError, OSError):
+				error_message(opt=12, problem_string = script_name)
+		self.poll_now()
+		return None
+	
+	def set_limit(self, event=None):
+		try:
+			pipeline_jobs.set_limit(int(self.limit_var.get()))
+		except (ValueError, TclError):
+			self.limit_var.set(pipeline_jobs.max_running)
+		return None
+	
+	def cancel_jobs(self):
+		jobs_by_id = dict((str(this_job.job_id), this_job) for this_job in pipeline_jobs.jobs)
+		for item in self.job_tree.selection():
+			if item in jobs_by_id:
+				pipeline_jobs.cancel(jobs_by_id[item])
+		self.poll_now()
+		return None
+	
+	#Opens a window following the output of each selected job that has started
+	def follow_jobs(self):
+		jobs_by_id = dict((str(this_job.job_id), this_job) for this_job in pipeline_jobs.jobs)
+		for item in self.job_tree.selection():
+			if (item in jobs_by_id) and (jobs_by_id[item].state != 'queued'):
+				log1 = log_window(jobs_by_id[item].run.run_dir)
+		return None
+	
+	#Brings the table and the totals up to date with the jobs. Only rows whose values have changed are touched.
+	def update_jobs(self):
+		for this_job in list(pipeline_jobs.jobs):
+			item = str(this_job.job_id)
+			elapsed = int(this_job.elapsed())
+			exit_str = '' if this_job.result == None else str(this_job.result['exit_code'])
+			values = (this_job.name, this_job.state, '%d:%02d:%02d' % (elapsed//3600, (elapsed//60)%60, elapsed%60), exit_str)
+			if item not in self.shown_values:
+				self.job_tree.insert('', 'end', iid = item, values = values)
+			elif self.shown_values[item] != values:
+				self.job_tree.item(item, values = values)
+			self.shown_values[item] = values
+		counts = pipeline_jobs.counts()
+		self.status_var.set('%d queued, %d running, %d done, %d failed, %d cancelled' % (counts['queued'], counts['running'], counts['done'], counts['failed'], counts['cancelled']))
+		return None
+	
+	#Called every poll_ms milliseconds for as long as the window is open
+	def poll(self):
+		if not self.is_open:
+			return None
+		self.update_jobs()
+		self.top.after(self.poll_ms, self.poll)
+		return None
+	
+	#Updates straight away after the user has done something, without starting a second round of polling
+	def poll_now(self):
+		if self.is_open:
+			self.update_jobs()
+		return None
+	
+	#The jobs carry on running when the window is closed
+	def close(self):
+		self.is_open = False
+		self.top.destroy()
+		return None
+
+
+#Window that follows the output of a run as it is written (see pims_view.run_log_follower). Every poll_ms milliseconds only the bytes added to the step logs since the last poll are read, so a long log never holds up the GUI, and only the last max_lines lines are kept in the Text widget, so a run that goes on for days does not use more and more memory. The view keeps scrolling with the output unless it has been scrolled up.
+class log_window(window):
+	poll_ms = 1000
+	max_lines = 5000
+	
+	def __init__(self, run_dir):
+		window.__init__(self)
+		self.top.title("Output of %s" % os.path.basename(run_dir))
+		self.is_open = True
+		self.follower = pims_view.run_log_follower(run_dir)
+		self.log_text = Text(self.mainframe, width = 100, height = 40)
+		self.log_text.grid(column=0, row=0, columnspan=2, sticky = (N,W,E,S))
+		self.log_scrollbar = Scrollbar(self.mainframe, orient = VERTICAL, command = self.log_text.yview)
+		self.log_scrollbar.grid(column=2, row=0, sticky = (N,S))
+		self.log_text.configure(yscrollcommand = self.log_scrollbar.set, state = DISABLED)
+		self.close_button = ttk.Button(self.mainframe, text = 'Close', command = self.close)
+		self.close_button.grid(column=1, row=1, sticky = (N,E))
+		self.top.protocol('WM_DELETE_WINDOW', self.close)
+		self.poll()
+	
+	#Adds any new output to the end of the Text widget, and removes lines from the top beyond max_lines
+	def poll(self):
+		if not self.is_open:
+			return None
+		new_text = self.follower.read_new()
+		if new_text != '':
+			at_end = self.log_text.yview()[1] >= 1.0
+			self.log_text.configure(state = NORMAL)
+			self.log_text.insert(END, new_text)
+			#The Text widget always ends with a newline of its own, hence the extra line
+			extra_lines = int(self.log_text.index('end-1c').split('.')[0])-1-self.max_lines
+			if extra_lines > 0:
+				self.log_text.delete('1.0', '%d.0' % (extra_lines+1))
+			self.log_text.configure(state = DISABLED)
+			if at_end:
+				self.log_text.see(END)
+		self.top.after(self.poll_ms, self.poll)
+		return None
+	
+	def close(self):
+		self.is_open = False
+		self.top.destroy()
+		return None
+
+
 #Window for editing tools that have already been created. Similar to the script view window in many ways, just with more widgets to hold all the different fields. In particular, the error-handling is veruy similar - see above.
 class edittool_window(window):
 	
 	def __init__(self):
 		window.__init__(self)
 		self.top.title('Edit tools')
-		self.tool_file_dict = dict()
-		for filename in os.listdir(pipeline_path+'/tools/'):
-			if (re.search(r'\.tool$', filename)):
-				tool_name = filename.split('.')[0]
-				self.tool_file_dict[tool_name] = open(pipeline_path+"/tools/%s" % filename, 'a+r')
 		self.tool_sel_label = ttk.Label(self.mainframe, text = "Select tool: ")
 		self.tool_sel_label.grid(column = 0, row = 0)
 		self.selected_tool = StringVar()
-		self.tool_combobox = ttk.Combobox(self.mainframe, values = self.tool_file_dict.keys(), textvariable = self.selected_tool)
+		self.tool_combobox = ttk.Combobox(self.mainframe, values = tool_index.tool_names(), textvariable = self.selected_tool)
 		self.tool_combobox.grid(column = 1, row = 0)
+		add_dir_listener(self.top, self.update_tools)
 		self.goedit_button = ttk.Button(self.mainframe, text = 'Go', command = self.go_edit)
 		self.goedit_button.grid(column=2, row=0)
 
-		self.labels_list = ['NAME', 'PURPOSE', 'COMMAND', 'FLAGS', 'OPTIONS', 'ARGUMENTS']
+		self.labels_list = list(pims_core.tool_fields)
 		self.rows_dict = {lab:[] for lab in self.labels_list}
 
 		for lab in self.labels_list:
 			self.rows_dict[lab].append(ttk.Label(self.mainframe, text = lab))
-			if lab in ['NAME', 'PURPOSE', 'COMMAND']:
+			if lab in entry_fields:
 				self.rows_dict[lab].append(StringVar())
 				self.rows_dict[lab].append(ttk.Entry(self.mainframe, textvariable = self.rows_dict[lab][1]))
 			elif lab in ['FLAGS', 'OPTIONS', 'ARGUMENTS']:
@@ -402,27 +833,28 @@ class edittool_window(window):
 		self.saveedit_button = ttk.Button(self.mainframe, text = 'Save', command = self.save_edit)
 		self.canceledit_button = ttk.Button(self.mainframe, text = 'Cancel', command = self.top.destroy)
 		self.deletetool_button = ttk.Button(self.mainframe, text = 'Delete tool', command = self.delete_tool)
-		self.selected_tool_file = None
 
 		
+	#Keeps the list of tools up to date as tools are added and removed
+	def update_tools(self, changes):
+		if len(changes['tools']) > 0:
+			self.tool_combobox.configure(values = tool_index.tool_names())
+		return None
+
 	#Displays the widgets for the tool's fields, and populates them from the tool file.
 	def go_edit(self):
 		if str(self.selected_tool.get()) == '':
 			error_message(opt=7, problem_string=None)
 			return None
-		elif str(self.selected_tool.get()) not in self.tool_file_dict.keys():
+		elif tool_index.get(str(self.selected_tool.get())) == None:
 			error_message(opt=8, problem_string=str(self.selected_tool.get()))
 			return None
 		self.tool_combobox.configure(state=DISABLED)
-		self.selected_tool_file = self.tool_file_dict[self.selected_tool.get()]
-		this_tool_dict = dict()
-		for line in self.selected_tool_file:
-			line_list = line.rstrip().split(':')
-			this_tool_dict[line_list[0]] = line_list[1]
+		this_tool_dict = tool_index.get(str(self.selected_tool.get()))
 		row_num = 1
 		for lab in self.labels_list:
 			self.rows_dict[lab][0].grid(column = 0, row = row_num)
-			if lab in ['NAME', 'PURPOSE', 'COMMAND']:
+			if lab in entry_fields:
 				self.rows_dict[lab][2].insert(0,this_tool_dict[lab])
 				self.rows_dict[lab][2].grid(column = 1, row = row_num)
 			elif lab in ['FLAGS', 'OPTIONS', 'ARGUMENTS']:
@@ -440,7 +872,7 @@ class edittool_window(window):
 	def save_edit(self):
 		new_vals_dict = dict()
 		for lab in self.rows_dict.keys():
-			if lab in ['NAME', 'PURPOSE', 'COMMAND']:
+			if lab in entry_fields:
 				if re.search(r',$', self.rows_dict[lab][1].get()):
 					new_vals_dict[lab] = self.rows_dict[lab][1].get()[:-1]
 				else:
@@ -467,16 +899,23 @@ class edittool_window(window):
 				
 				new_vals_dict[lab] = ','.join(line_list)
 		
-		#The new tool values are saved by deleting the old file and then creating a new file and writing to it in the same way as adding a new tool.
-		os.remove(pipeline_path+"/tools/%s.tool" % self.selected_tool.get())
-		tool_path = pipeline_path+"/tools/%s.tool" % new_vals_dict['NAME']
-		tool_file = open(tool_path,'w')
-		tool_file.seek(0,0)
-		for l in self.labels_list:
-			tool_file.write("%s:%s\n" % (l, new_vals_dict[l]))
-		tool_file.close()
+		try:
+			pims_core.tool_resources(new_vals_dict)
+		except pims_core.pims_error:
+			error_message(opt=1, problem_string='%s/%s' % (new_vals_dict.get('THREADS', ''), new_vals_dict.get('MEMORY', '')))
+			return None
+		try:
+			pims_core.split_record_lines(new_vals_dict)
+		except pims_core.pims_error:
+			error_message(opt=1, problem_string=new_vals_dict.get('SPLIT_BY', ''))
+			return None
+		#The new tool values replace the old ones in one step, and the old tool is only removed (if it has been renamed) once the new one has been written, so a crash never loses the tool.
+		try:
+			tool_index.save_tool(new_vals_dict['NAME'], new_vals_dict, old_name = self.selected_tool.get())
+		except pims_core.pims_error:
+			error_message(opt=15, problem_string=new_vals_dict['NAME'])
+			return None
 		make_purposes_list()
-		self.selected_tool_file.close()
 		self.top.destroy()
 		return None
 	#Used to delete and existing tool.
@@ -486,7 +925,8 @@ class edittool_window(window):
 		sure_msg = Message(sure_popup, text = 'This will permanently delete the file for the selected tool. Are you sure you want to proceed?')
 		sure_msg.grid(column=0, columnspan=2, row = 0)
 		def sure_delete():
-			os.remove(pipeline_path+"/tools/%s.tool" % self.selected_tool.get())
+			tool_index.delete_tool(self.selected_tool.get())
+			make_purposes_list()
 			sure_popup.destroy()
 			self.top.destroy()
 		yes_button = ttk.Button(sure_popup, text = 'Yes', command = sure_delete)
@@ -522,18 +962,18 @@ class purpose_select_window(window):
 		self.instruct_label = ttk.Label(self.mainframe, text = 'Select tool types, in running order')
 		self.instruct_label.grid(column=0, row=0, columnspan = 2, sticky = (N,W))
 		self.selected_list = StringVar()
+		#The purpose buttons are kept in their own frame, so that buttons can be added and removed as tools with new purposes are added and the last tools of a purpose are removed (see update_purposes)
+		self.purpose_button_frame = ttk.Frame(self.mainframe)
+		self.purpose_button_frame.grid(column=0, row = 1, sticky = (N,W))
 		self.purpose_button_dict = dict()
-		row_num = 1
-		for p in purposes_list:
-			self.purpose_button_dict[p] = purpose_button(self.mainframe, p, self.selected_list)
-			self.purpose_button_dict[p].button.grid(column=0, row = row_num, sticky = (N,W))
-			row_num += 1
+		self.show_purposes()
+		add_dir_listener(self.top, self.update_purposes)
 
 		self.selected_listbox = Listbox(self.mainframe, listvariable = self.selected_list, selectmode = SINGLE)
-		self.selected_listbox.grid(column=1, row = 1, rowspan = row_num-1, sticky = (N,W))
+		self.selected_listbox.grid(column=1, row = 1, sticky = (N,W))
 
 		self.button_frame = ttk.Frame(self.mainframe, padding = "3 3 12 12", borderwidth = '2m', relief = GROOVE)
-		self.button_frame.grid(column=0, row = row_num, columnspan = 2, sticky = (N,W))
+		self.button_frame.grid(column=0, row = 2, columnspan = 2, sticky = (N,W))
 
 		self.go_button = ttk.Button(self.button_frame, text = 'Go', command = self.go)
 		self.go_button.grid(column = 0, row = 0, sticky = (N,W))
@@ -547,6 +987,23 @@ class purpose_select_window(window):
 		self.cancel_button = ttk.Button(self.button_frame, text = 'Cancel', command = self.top.destroy)
 		self.cancel_button.grid(column=3, row = 0, sticky = (N,W))
 		
+	#Makes a button for each purpose that does not have one yet, and removes those of purposes that no longer have any tools, keeping the buttons in the order of purposes_list
+	def show_purposes(self):
+		for p in list(self.purpose_button_dict.keys()):
+			if p not in purposes_list:
+				self.purpose_button_dict[p].button.destroy()
+				del self.purpose_button_dict[p]
+		for row_num, p in enumerate(purposes_list):
+			if p not in self.purpose_button_dict:
+				self.purpose_button_dict[p] = purpose_button(self.purpose_button_frame, p, self.selected_list)
+			self.purpose_button_dict[p].button.grid(column=0, row = row_num, sticky = (N,W))
+		return None
+
+	def update_purposes(self, changes):
+		if len(changes['tools']) > 0:
+			self.show_purposes()
+		return None
+
 	def reset_selection(self):
 		self.selected_listbox.delete(first = 0, last = END)
 	
@@ -571,15 +1028,18 @@ class purpose_select_window(window):
 		
 #The window where the desired tools are selected (i.e., made active), and all flags/options/arguments are either selected or given values, as appropriate. Once values have been input, they can be saved as a config file and loaded again from that file. When all all the required fields have been selected/filled, the script can be generated.
 class runpipeline_window(window):
+	@pims_trace.traced('runpipeline_window', lambda self, used_purposes: {'purposes':len(used_purposes)})
 	def __init__(self, used_purposes):
 		window.__init__(self)
 		self.top.title('Run pipeline')
 		#Set up all of the purpose frames needed, based on the list of purposes selected and their order. Each purpose frame is populated with relevant tool frames.
 		self.purposes_list = used_purposes
 		self.purpose_frame_dict = dict()
+		#If this is ticked, several tools of a purpose can be active at once, and the script runs each of them (and everything after it) in a branch of its own, sharing the steps before (see pims_core.fan_out_variants)
+		self.fan_out_var = IntVar()
 		row_num = 1
 		for p in self.purposes_list:
-			self.purpose_frame_dict[p] = purpose_frame(self.mainframe, p, row_num)
+			self.purpose_frame_dict[p] = purpose_frame(self.mainframe, p, row_num, self.fan_out_var)
 			row_num += 1
 		self.button_frame = ttk.Frame(self.mainframe, padding = "3 3 12 12", borderwidth = '2m', relief = GROOVE)
 		self.button_frame.grid(column=0, row = row_num, sticky = (N,W))
@@ -592,6 +1052,16 @@ class runpipeline_window(window):
 		self.load_config_button.grid(column = 2, row = row_num, sticky = (N,W))
 		self.cancel_run_button = ttk.Button(self.button_frame, text = 'Cancel', command = self.top.destroy)
 		self.cancel_run_button.grid(column=3, row = row_num, sticky = (N,W))
+		#If this is ticked, consecutive tools that can read standard input/write standard output (see pims_core.purpose_lines) are joined by pipes in the script, rather than each writing an intermediate file
+		self.stream_var = IntVar()
+		self.stream_checkbutton = Checkbutton(self.button_frame, text = 'Stream between tools', variable = self.stream_var)
+		self.stream_checkbutton.grid(column=4, row = row_num, sticky = (N,W))
+		#If this is ticked, option and argument values can hold lists ({5,10,20}) and ranges ({10..30..5}), and the script runs every combination of them, sharing the steps they have in common (see pims_core.branch_lines)
+		self.sweep_var = IntVar()
+		self.sweep_checkbutton = Checkbutton(self.button_frame, text = 'Sweep values', variable = self.sweep_var)
+		self.sweep_checkbutton.grid(column=5, row = row_num, sticky = (N,W))
+		self.fan_out_checkbutton = Checkbutton(self.button_frame, text = 'Fan out', variable = self.fan_out_var, command = self.fan_out_changed)
+		self.fan_out_checkbutton.grid(column=6, row = row_num, sticky = (N,W))
 	
 	#Writes the script to a file. The script will crete a new, timestamped directory from which the script will be run, and which should hold all of the output files from each tool. It will also place a copy of itself in this new directory, for the sake of record-keeping. At the end, it will delete itself.
 	def make_pipeline_script(self):
@@ -629,126 +1099,123 @@ class runpipeline_window(window):
 		
 		def write_script(script_name, note_str):
 			if (re.match(r'^[\w-]+$', script_name)):
-				if ('%s.script' % script_name) in  os.listdir(pipeline_path+"/scripts/"):
+				if os.path.exists(pipeline_path+"/scripts/%s.script" % script_name):
 					error_message(opt=3, problem_string=script_name)
 					return None
 				else:
 					print('Making script %s ... ' % script_name)
-					script_file = open(pipeline_path+"/scripts/%s.script" % script_name, 'a')
-					script_file.write("#!/bin/bash\n")
-					new_dir = script_name+'_'+time.strftime("%Y%m%d_%H%M%S")
-					script_file.write("mkdir %s\n" % new_dir)
-					script_file.write("cp %s.script %s/%s.script\n" % (script_name, new_dir, script_name))
-					script_file.write("cd %s\n" % new_dir)
-					script_file.write("echo \"%s\" > NOTE\n" % note_str)
-					for purpose in self.purposes_list:
-						for tool in self.purpose_frame_dict[purpose].tool_frame_dict.keys():
-							if self.purpose_frame_dict[purpose].tool_frame_dict[tool].state == 'active':
-								tool_file = open(pipeline_path+"/tools/%s.tool" % tool, 'r')
-								for line in tool_file:
-									if re.search(r'^COMMAND:', line):
-										tool_cmd = line.split(':')[1][:-1]
-									elif re.search(r'^FLAGS:', line):
-										tool_flags = line.split(':')[1][:-1].split(',')
-									elif re.search(r'OPTIONS:', line):
-										tool_opts = line.split(':')[1][:-1].split(',')
-									elif re.search(r'^ARGUMENTS:', line):
-										tool_args = line.split(':')[1][:-1].split(',')
-								script_file.write(tool_cmd+' ')
-								if tool_flags[0] != '':
-									for flag in tool_flags:
-										flag_state = self.purpose_frame_dict[purpose].tool_frame_dict[tool].flags_dict[flag][1].get()
-										if flag_state == 1:
-											script_file.write('%s ' % flag)
-								if tool_opts[0] != '':
-									for opt in tool_opts:
-										opt_val = self.purpose_frame_dict[purpose].tool_frame_dict[tool].options_dict[opt][1].get()
-										if opt_val != '':
-											gtlt_pattern = re.compile('<{1}>{1}')
-											opt_to_write = gtlt_pattern.sub('',opt)
-											script_file.write('%s%s ' % (opt_to_write, opt_val))
-								if tool_args[0] != '':
-									for arg in tool_args:
-										arg_val = self.purpose_frame_dict[purpose].tool_frame_dict[tool].arguments_dict[arg][1].get()
-										if arg_val != '':
-											script_file.write('%s ' % arg_val)
-							script_file.write('\n')
-					script_file.write("cd ..\nrm %s.script\n" % script_name)
+					try:
+						self.generate_script(script_name, note_str)
+					except pims_core.pims_error as e:
+						error_message(opt=17, problem_string=str(e))
+						return None
 					print('Done')
-					script_file.close()
 					pipeline_name_window.destroy()
+					problems = self.check_script(script_name, note_str)
+					if len(problems) > 0:
+						error_message(opt=16, problem_string='\n'.join(problems))
 				
 			else:
 				error_message(opt=2, problem_string=script_name)
 				return None
 		
 
+	#When fanning out is switched off, only the first active tool of each purpose (by name) is left active, as if the others had been clicked off
+	def fan_out_changed(self):
+		if self.fan_out_var.get() == 1:
+			return None
+		for purpose in self.purposes_list:
+			active_tools = [tool for tool in sorted(self.purpose_frame_dict[purpose].tool_frame_dict.keys()) if self.purpose_frame_dict[purpose].tool_frame_dict[tool].state == 'active']
+			for tool in active_tools[1:]:
+				self.purpose_frame_dict[purpose].tool_frame_dict[tool].make_inactive()
+		return None
+
+	#Collects the active tools of each purpose, in running order, and has pims_core write the script, so that the GUI and the command line (pims.py compile) always produce the same script. The script is then recorded in the run history. Returns the path of the script.
+	@pims_trace.traced('write_script', lambda self, script_name, note_str: {'script':script_name})
+	def generate_script(self, script_name, note_str):
+		steps = self.active_steps()
+		timestamp = time.time()
+		script_text = pims_core.render_script(script_name, note_str, steps, pims_core.run_dir_name(script_name, timestamp), self.stream_var.get() == 1, self.sweep_var.get() == 1, self.fan_out_var.get() == 1)
+		script_path = pims_core.write_script_file(script_name, script_text, pipeline_path+"/scripts/")
+		if run_history != None:
+			run_history.record_scripts([(script_name, note_str, steps)], pipeline_path+"/scripts/", timestamp, self.stream_var.get() == 1, self.sweep_var.get() == 1, self.fan_out_var.get() == 1)
+		return script_path
+
+	#Returns the active tools of each purpose, in running order, laid out as pims_core.config_steps returns them
+	def active_steps(self):
+		steps = []
+		for purpose in self.purposes_list:
+			purpose_steps = []
+			for tool in self.purpose_frame_dict[purpose].tool_frame_dict.keys():
+				this_tool_frame = self.purpose_frame_dict[purpose].tool_frame_dict[tool]
+				if this_tool_frame.state == 'active':
+					purpose_steps.append((tool, this_tool_frame.tool_dict, this_tool_frame.get_values()))
+			steps.append(purpose_steps)
+		return steps
+
+	#Looks for commands that are not installed and input files that are missing (see pims_check.py), so that they can be fixed before the script is run rather than when bash reaches them. Returns a list of problems.
+	@pims_trace.traced('check_script')
+	def check_script(self, script_name, note_str):
+		pipelines = [(script_name, note_str, self.active_steps())]
+		if (self.sweep_var.get() == 1) or (self.fan_out_var.get() == 1):
+			pipelines = pims_core.variant_pipelines(pipelines, self.sweep_var.get() == 1, self.fan_out_var.get() == 1)
+		return pims_check.check_pipelines(pipelines, pipeline_path+"/scripts/", self.stream_var.get() == 1)
+
+	#Applies a saved configuration to the tool frames. Each line is applied to the matching tool frame through set_value, so that tools left inactive do not need their widgets to be built.
+	@pims_trace.traced('load_config', lambda self, config_path: {'path':config_path})
+	def apply_config(self, config_path):
+		for config_entry in pims_core.read_config(config_path):
+			tool_name = config_entry['NAME']
+			tool_purpose = tool_index.purpose_of(tool_name)
+			if tool_purpose == None:
+				error_message(opt = 5, problem_string=tool_name)
+				continue
+
+			if (tool_purpose in self.purposes_list) and (tool_name in self.purpose_frame_dict[tool_purpose].tool_frame_dict):
+				this_tool_frame = self.purpose_frame_dict[tool_purpose].tool_frame_dict[tool_name]
+				for field in ['FLAGS', 'OPTIONS', 'ARGUMENTS']:
+					for name, value in config_entry[field].items():
+						this_tool_frame.set_value(field, name, value)
+
+				if config_entry['STATE'] == 'active':
+					this_tool_frame.make_active()
+				elif config_entry['STATE'] == 'inactive':
+					this_tool_frame.make_inactive()
+		return None
+
+	#Writes the state and values of every tool frame to a config file (see save_config for the format)
+	@pims_trace.traced('save_config', lambda self, config_path: {'path':config_path})
+	def write_config(self, config_path):
+		config_file = open(config_path, 'a')
+		for purpose in self.purpose_frame_dict.keys():
+			for tool_name in self.purpose_frame_dict[purpose].tool_frame_dict.keys():
+				this_tool_frame = self.purpose_frame_dict[purpose].tool_frame_dict[tool_name]
+				config_file.write(pims_core.format_config_line(tool_name, this_tool_frame.state, this_tool_frame.tool_dict, this_tool_frame.get_values()))
+		config_file.close()
+		return None
+
 	def load_config(self):
 		choose_file_window = Toplevel()
 		choose_file_window.title('Choose configuration')
 		choose_label = ttk.Label(choose_file_window, text = 'Choose a configuration')
 		choose_label.grid(column=0, row=0, sticky = (N,W))
 		
-		existing_configs_list = ''
+		#The list of configurations comes from pipeline_dirs, and follows configurations being saved and deleted while the window is open
+		poll_pipeline_dirs()
 		existing_configs = StringVar()
-		for filename in os.listdir(pipeline_path+'/config/'):
-			if (re.search(r'\.config$', filename)):
-				config_name = filename.split('.')[0]
-				existing_configs_list = existing_configs_list+'%s ' % config_name
-		existing_configs_list.rstrip()
-		existing_configs.set(existing_configs_list)
+		existing_configs.set(' '.join(pipeline_dirs.file_names('config', '.config')))
 		config_listbox = Listbox(choose_file_window, listvariable = existing_configs, selectmode = SINGLE)
 		config_listbox.grid(column=0, row=1, columnspan = 3, sticky = (N,W))
 
+		def update_configs(changes):
+			if len(changes['config']) > 0:
+				existing_configs.set(' '.join(pipeline_dirs.file_names('config', '.config')))
+			return None
+		add_dir_listener(choose_file_window, update_configs)
+
 		def load_file(to_destroy):
 			selected_file_name = str(config_listbox.get(int(config_listbox.curselection()[0])))
-			selected_file = open(pipeline_path+'/config/%s.config' % selected_file_name, 'r')
-			for line in selected_file:
-				line_list = line.rstrip().split(':')
-				if (line_list[2] != '') & (line_list[3] != '') & (line_list[4] != ''):
-					continue
-
-				tool_name = line_list[0]
-				try:
-					tool_file = open(pipeline_path+'/tools/%s.tool' % tool_name, 'r')
-				except IOError:
-					error_message(opt = 5, problem_string=tool_name)
-					continue
-
-				for line in tool_file:
-					if re.search(r'^PURPOSE:', line):
-						tool_purpose = line.rstrip().split(':')[1]
-				tool_file.close()
-				if tool_purpose in self.purposes_list:
-					self.purpose_frame_dict[tool_purpose].tool_frame_dict[tool_name].make_active()
-					flag_list = line_list[2].split(';') if line_list[2] != '' else []
-					opt_list = line_list[3].split(';') if line_list[3] != '' else []
-					arg_list = line_list[4].split(';') if line_list[4] != '' else []
-
-					for pair in flag_list:
-						key_val = pair.split('$')
-						flag_widgets_list = self.purpose_frame_dict[tool_purpose].tool_frame_dict[tool_name].flags_dict[key_val[0]]
-						flag_widgets_list[2].select()
-
-					for pair in opt_list:
-						key_val = pair.split('$')
-						opt_widgets_list = self.purpose_frame_dict[tool_purpose].tool_frame_dict[tool_name].options_dict[key_val[0]]
-						opt_widgets_list[2].delete(0, last = len(opt_widgets_list[1].get())+1)
-						opt_widgets_list[2].insert(0, key_val[1])
-
-					for pair in arg_list:
-						key_val = pair.split('$')
-						arg_widgets_list = self.purpose_frame_dict[tool_purpose].tool_frame_dict[tool_name].arguments_dict[key_val[0]]
-						arg_widgets_list[2].delete(0, last = len(arg_widgets_list[1].get())+1)
-						arg_widgets_list[2].insert(0, key_val[1])
-
-					if line_list[1] == 'active':
-						continue
-					elif line_list[1] == 'inactive':
-						self.purpose_frame_dict[tool_purpose].tool_frame_dict[tool_name].make_inactive()
-				else:
-					continue
-			
+			self.apply_config(pipeline_path+'/config/%s.config' % selected_file_name)
 			to_destroy.destroy()
 		
 		def delete_file():
@@ -761,9 +1228,7 @@ class runpipeline_window(window):
 			def confirm_delete():
 				selected_file_name = str(config_listbox.get(int(config_listbox.curselection()[0])))
 				os.remove(pipeline_path+'/config/%s.config' % selected_file_name)
-				new_file_list = existing_configs_list.split(' ')
-				new_file_list.remove(selected_file_name)
-				existing_configs.set(' '.join(new_file_list))
+				poll_pipeline_dirs()
 				sure_window.destroy()
 			def cancel_delete():
 				sure_window.destroy()
@@ -788,47 +1253,7 @@ class runpipeline_window(window):
 	def save_config(self):
 
 		def make_config_file(to_destroy, config_name):
-			config_file = open(pipeline_path+'/config/%s.config' % config_name, 'a')
-			for purpose in self.purpose_frame_dict.keys():
-				for tool_name in self.purpose_frame_dict[purpose].tool_frame_dict.keys():
-					tool_state = self.purpose_frame_dict[purpose].tool_frame_dict[tool_name].state
-					config_file.write('%s:%s:' % (tool_name, tool_state))
-					flag_list_to_write = []
-					opt_list_to_write = []
-					arg_list_to_write = []
-					try:
-						for flag_name in self.purpose_frame_dict[purpose].tool_frame_dict[tool_name].flags_dict.keys():
-							flag_state = self.purpose_frame_dict[purpose].tool_frame_dict[tool_name].flags_dict[flag_name]
-							if flag_state[1].get() == 1:
-								flag_list_to_write.append("%s$1" % flag_name)
-							else:
-								continue
-					except AttributeError:
-						flag_list_to_write.append('')
-
-					try:
-						for opt_name in self.purpose_frame_dict[purpose].tool_frame_dict[tool_name].options_dict.keys():
-							opt_val = self.purpose_frame_dict[purpose].tool_frame_dict[tool_name].options_dict[opt_name]
-							if len(opt_val[1].get()) != 0:
-								opt_list_to_write.append('%s$%s' % (opt_name, opt_val[1].get()))
-							else:
-								continue
-					except AttributeError:
-						opt_list_to_write.append('')
-					
-					try:
-						for arg_name in self.purpose_frame_dict[purpose].tool_frame_dict[tool_name].arguments_dict.keys():
-							arg_val = self.purpose_frame_dict[purpose].tool_frame_dict[tool_name].arguments_dict[arg_name]
-							if len(arg_val[1].get()) != 0:
-								arg_list_to_write.append('%s$%s' % (arg_name, arg_val[1].get()))
-							else:
-								continue
-					except AttributeError:
-						arg_list_to_write.append('')
-
-					config_file.write(";".join(flag_list_to_write)+':'+";".join(opt_list_to_write)+':'+";".join(arg_list_to_write)+"\n")
-			config_file.close()
-
+			self.write_config(pipeline_path+'/config/%s.config' % config_name)
 			to_destroy.destroy()
 			print('Configuration %s saved' % config_name)		
 		
@@ -836,7 +1261,7 @@ class runpipeline_window(window):
 			#Check entry input does not contain illegal characters
 			if (re.match(r'^[\w-]+$', config_name)):
 				#Open the file to write to. If it already exists, give the option to overwrite
-				if ('%s.config' % config_name) in os.listdir(pipeline_path+'/config/'):
+				if os.path.exists(pipeline_path+'/config/%s.config' % config_name):
 					file_exists_popup = Toplevel()
 					file_exists_popup.title('File already exists!')
 					file_exists_msg = Message(file_exists_popup, text = 'A file with this name already exists. Would you like to overwrite this file?')
@@ -898,9 +1323,13 @@ class init_window(window):
 		self.viewscript_button = ttk.Button(self.mainframe, text = 'View scripts', command = self.view_scripts)
 		self.viewscript_button.grid(row=1, column=0, sticky = (N,W))
 
+		#Button to open the jobs window, for running scripts in the background
+		self.jobs_button = ttk.Button(self.mainframe, text = 'Jobs', command = self.open_jobs)
+		self.jobs_button.grid(row=1, column=1, sticky = (N,W))
+
 		#Quit button
-		self.quitButton = ttk.Button(self.mainframe, text = 'Quit', command = root.destroy)
-		self.quitButton.grid(row = 1, column = 1, sticky = (S))
+		self.quitButton = ttk.Button(self.mainframe, text = 'Quit', command = self.quit_pims)
+		self.quitButton.grid(row = 1, column = 2, sticky = (S))
 	
 	#A tentative feature that would create small information windows when the user hovers a mouse over a given widget. Currently just for testing.
 	def hover_info(self,event):
@@ -926,10 +1355,20 @@ class init_window(window):
 	def view_scripts(self):
 		view1 = viewscripts_window()
 		return None
+	def open_jobs(self):
+		jobs1 = jobs_window()
+		return None
+	#Jobs that are still running are cancelled rather than left without anything to start their remaining steps
+	def quit_pims(self):
+		pipeline_jobs.cancel_all()
+		root.destroy()
+		return None
 
-init1 = init_window()
-
-root.mainloop()
+#Only start the GUI when run as a program, so that the windows can also be created from other code (e.g. pims_bench.py)
+if __name__ == '__main__':
+	init1 = init_window()
+	watch_pipeline_dirs()
+	root.mainloop()
 
 		
 
@@ -0,0 +1,157 @@
+#This is part of the source code for the Pipeline Interface and Management System (PIMS). PIMS was created by Joseph Gardner, Dept. of Genetics, University of Cambridge, UK, and is licensed under the Creative Commons Attribution-ShareAlike 4.0 International (CC BY-SA 4.0) license. See pims_v0.1.py or https://github.com/jg600/PIMS for full licensing information.
+
+#Reads pages of lines from files that may be far too big to load (large scripts and run logs), and follows the logs of pipelines that are still running, for the viewers in the GUI. Like pims_core.py, this does not import Tkinter.
+
+import mmap
+import os
+import pims_run
+
+#Gives access to the lines of a file by byte position, without reading the whole file or even counting its lines. The file is memory mapped, so only the pages that are looked at are read from disk, and opening a file of any size is instant. Positions are byte offsets; a page is found by going to the start of the line holding a given offset and reading a number of lines forwards (or backwards) from there. The file is only kept open while the pager is in use - call close() when done.
+class file_pager:
+	def __init__(self, path):
+		self.path = path
+		self.this_file = open(path, 'rb')
+		self.size = 0
+		self.data = None
+		self.refresh()
+
+	#Maps the file again if it has grown (e.g. a log that is still being written). Returns True if the size changed.
+	def refresh(self):
+		new_size = os.fstat(self.this_file.fileno()).st_size
+		if (new_size == self.size) and ((self.data != None) or (new_size == 0)):
+			return False
+		if self.data != None:
+			self.data.close()
+			self.data = None
+		self.size = new_size
+		if self.size > 0:
+			self.data = mmap.mmap(self.this_file.fileno(), 0, access=mmap.ACCESS_READ)
+		return True
+
+	def close(self):
+		if self.data != None:
+			self.data.close()
+			self.data = None
+		self.this_file.close()
+		return None
+
+	#Returns the offset of the start of the line that holds offset
+	def line_start(self, offset):
+		if (self.data == None) or (offset <= 0):
+			return 0
+		offset = min(offset, self.size)
+		return self.data.rfind(b'\n', 0, offset)+1
+
+	#Returns (lines, end offset) for up to count lines from offset (which should be the start of a line). Lines are returned as text without their newlines, with any bytes that are not valid UTF-8 replaced.
+	def lines_from(self, offset, count):
+		lines = []
+		if self.data == None:
+			return lines, 0
+		pos = offset
+		while (len(lines) < count) and (pos < self.size):
+			end = self.data.find(b'\n', pos)
+			if end == -1:
+				end = self.size
+			lines.append(self.data[pos:end].decode('utf-8', 'replace'))
+			pos = end+1
+		return lines, min(pos, self.size)
+
+	#Returns the offset count lines before offset (which should be the start of a line)
+	def lines_back(self, offset, count):
+		pos = offset
+		for i in range(count):
+			if pos <= 0:
+				return 0
+			pos = self.line_start(pos-1)
+		return pos
+
+#Follows a file that is being written to, like tail -f. Each call to read_new returns only what has been added since the last call, so a log can be followed for days at the cost of the new bytes alone. Reading starts start_bytes from the end (at the start of a line), so that opening the log of a long run does not read all of it. The file need not exist yet, and a file that shrinks (e.g. a step that has been run again) is followed from its start.
+class log_tail:
+	def __init__(self, path, start_bytes=1<<16):
+		self.path = path
+		self.start_bytes = start_bytes
+		self.offset = None
+		#Bytes read after the last newline, kept until the rest of their line arrives (which also keeps multi-byte characters whole)
+		self.partial = b''
+
+	#Returns (text, skipped): the complete lines added since the last call, and the number of bytes passed over. At most max_bytes are read per call; if more than max_backlog bytes are waiting (a tool writing faster than the log is being shown), everything but the last max_bytes is skipped rather than falling further and further behind.
+	def read_new(self, max_bytes=1<<20, max_backlog=1<<22):
+		try:
+			this_file = open(self.path, 'rb')
+		except IOError:
+			return '', 0
+		skipped = 0
+		try:
+			size = os.fstat(this_file.fileno()).st_size
+			if self.offset == None:
+				self.offset = self.line_after(this_file, max(0, size-self.start_bytes))
+				skipped = self.offset
+			elif size < self.offset:
+				self.offset = 0
+				self.partial = b''
+			if size-self.offset > max_backlog:
+				new_offset = self.line_after(this_file, size-max_bytes)
+				skipped += new_offset-self.offset
+				self.offset = new_offset
+				self.partial = b''
+			this_file.seek(self.offset)
+			data = this_file.read(min(max_bytes, size-self.offset))
+		finally:
+			this_file.close()
+		self.offset += len(data)
+		data = self.partial+data
+		end = data.rfind(b'\n')+1
+		self.partial = data[end:]
+		return data[:end].decode('utf-8', 'replace'), skipped
+
+	#Returns the offset of the start of the first line that begins at or after offset
+	def line_after(self, this_file, offset):
+		if offset <= 0:
+			return 0
+		this_file.seek(offset-1)
+		while True:
+			block = this_file.read(1<<16)
+			if not block:
+				return offset
+			newline = block.find(b'\n')
+			if newline != -1:
+				return offset+newline
+			offset += len(block)
+
+#Follows the output of every step of a run as it is written (see pims_run.step_log_name). The step logs are followed in step order, with a header line whenever the output shown moves on to another step; step logs that appear later are picked up as they are created.
+class run_log_follower:
+	def __init__(self, run_dir, start_bytes=1<<16):
+		self.run_dir = run_dir
+		self.start_bytes = start_bytes
+		#[step number, log_tail] for each step log found so far
+		self.tails = []
+		self.last_step = None
+
+	def find_step_logs(self):
+		known = set([step_number for step_number, this_tail in self.tails])
+		try:
+			filenames = os.listdir(self.run_dir)
+		except OSError:
+			return None
+		for filename in filenames:
+			log_match = pims_run.step_log_pattern.match(filename)
+			if (log_match != None) and (int(log_match.group(1)) not in known):
+				self.tails.append([int(log_match.group(1)), log_tail(os.path.join(self.run_dir, filename), self.start_bytes)])
+		self.tails.sort(key=lambda step_tail: step_tail[0])
+		return None
+
+	#Returns the text added to the step logs since the last call
+	def read_new(self, max_bytes=1<<20):
+		self.find_step_logs()
+		text_list = []
+		for step_number, this_tail in self.tails:
+			text, skipped = this_tail.read_new(max_bytes)
+			if (text == '') and (skipped == 0):
+				continue
+			if step_number != self.last_step:
+				text_list.append('==> %s <==\n' % pims_run.step_log_name(step_number))
+				self.last_step = step_number
+			if skipped > 0:
+				text_list.append('[... %d bytes not shown ...]\n' % skipped)
+			text_list.append(text)
+		return ''.join(text_list)
@@ -0,0 +1,212 @@
+#This is part of the source code for the Pipeline Interface and Management System (PIMS). PIMS was created by Joseph Gardner, Dept. of Genetics, University of Cambridge, UK, and is licensed under the Creative Commons Attribution-ShareAlike 4.0 International (CC BY-SA 4.0) license. See pims_v0.1.py or https://github.com/jg600/PIMS for full licensing information.
+
+#Keeps track of what is in the pipeline directories (tools, config and scripts) as they change, whoever changes them, so that the GUI can keep its lists up to date without listing the directories again. Each directory is listed once, when it starts being watched; after that, on Linux, the kernel reports each change with inotify, so nothing is read until something happens, and the changes are picked up the next time the watcher is polled. Where inotify cannot be used (other systems, running out of inotify watches, or PIMS_WATCH=poll, e.g. for network filesystems, where inotify does not see changes made from other machines) the watcher polls instead, listing a directory again only when its modification time has changed. Like pims_core.py, this does not import Tkinter.
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+import sys
+
+#inotify event bits, from <sys/inotify.h>
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+#Changes to the names in a directory, and to the contents of the files in it
+name_events = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+content_events = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE
+#The directory itself has gone, or the kernel has dropped events, so it has to be listed again
+lost_events = IN_DELETE_SELF | IN_MOVE_SELF | IN_Q_OVERFLOW | IN_IGNORED
+event_header = struct.Struct('iIII')
+
+#The C library, if it has the inotify functions (False if not). Looked up the first time it is needed.
+libc = None
+
+def get_libc():
+	global libc
+	if libc == None:
+		libc = False
+		if sys.platform.startswith('linux'):
+			try:
+				this_libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+				if hasattr(this_libc, 'inotify_init1') and hasattr(this_libc, 'inotify_add_watch'):
+					libc = this_libc
+			except OSError:
+				pass
+	return libc
+
+#An inotify instance watching one directory. Raises OSError if inotify cannot be used for it.
+class inotify_watch:
+	def __init__(self, path, events):
+		this_libc = get_libc()
+		if not this_libc:
+			raise OSError(errno.ENOSYS, 'inotify is not available')
+		self.fd = this_libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+		if self.fd < 0:
+			raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+		if this_libc.inotify_add_watch(self.fd, path.encode(sys.getfilesystemencoding()), events | IN_ONLYDIR) < 0:
+			error_num = ctypes.get_errno()
+			os.close(self.fd)
+			raise OSError(error_num, 'inotify_add_watch failed for %s' % path)
+
+	#Returns [(mask, name)] for the events waiting, without waiting for more
+	def read_events(self):
+		events = []
+		while True:
+			try:
+				data = os.read(self.fd, 1<<16)
+			except OSError as e:
+				if e.errno in [errno.EAGAIN, errno.EWOULDBLOCK]:
+					return events
+				raise
+			if not data:
+				return events
+			pos = 0
+			while pos+event_header.size <= len(data):
+				wd, mask, cookie, name_len = event_header.unpack_from(data, pos)
+				pos += event_header.size
+				name = data[pos:pos+name_len].rstrip(b'\0')
+				#Names are kept as the same type of string that os.listdir gives
+				if not isinstance(name, str):
+					name = name.decode(sys.getfilesystemencoding(), 'replace')
+				pos += name_len
+				events.append((mask, name))
+
+	def close(self):
+		if self.fd != None:
+			os.close(self.fd)
+			self.fd = None
+		return None
+
+#Watches one directory. names always holds what was in the directory when poll() was last called. poll() returns the names that were added or removed since, together with (if track_changes is set) those whose contents changed - tools are re-read when their files change, but config and script lists only need the names. method is 'inotify' or 'poll' (the default is inotify where it can be used, unless PIMS_WATCH=poll).
+class dir_watcher:
+	def __init__(self, path, track_changes=False, method=None):
+		self.path = path
+		self.track_changes = track_changes
+		if method == None:
+			method = 'poll' if os.getenv('PIMS_WATCH') == 'poll' else 'inotify'
+		self.watch = None
+		if method == 'inotify':
+			try:
+				self.watch = inotify_watch(path, name_events | (content_events if track_changes else 0) | IN_DELETE_SELF | IN_MOVE_SELF)
+			except OSError:
+				method = 'poll'
+		self.method = method
+		#For polling: the modification time of the directory when it was last listed, and the stamp of each file (only kept with track_changes)
+		self.dir_stamp = None
+		self.stamps = dict()
+		self.names = set()
+		self.list_dir()
+
+	#Lists the directory, returning the names added and removed since it was last listed (or every name whose contents may have changed, with track_changes, since the changes in between are not known)
+	def list_dir(self):
+		try:
+			self.dir_stamp = self.get_stamp(self.path)
+			new_names = set(os.listdir(self.path))
+		except OSError:
+			self.dir_stamp = None
+			new_names = set()
+		changed = new_names.symmetric_difference(self.names)
+		if self.track_changes:
+			if self.method == 'poll':
+				self.stamps = dict((name, self.get_stamp(os.path.join(self.path, name))) for name in new_names)
+			changed.update(new_names)
+		self.names = new_names
+		return changed
+
+	def get_stamp(self, path):
+		try:
+			path_stat = os.stat(path)
+		except OSError:
+			return None
+		return (path_stat.st_mtime, path_stat.st_size, path_stat.st_ino)
+
+	def poll(self):
+		if self.method == 'inotify':
+			return self.poll_inotify()
+		return self.poll_stat()
+
+	def poll_inotify(self):
+		changed = set()
+		for mask, name in self.watch.read_events():
+			if mask & lost_events:
+				#The directory was removed, replaced or too much happened at once: list it again, and poll from then on if it can no longer be watched
+				if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+					self.watch.close()
+					self.watch = None
+					self.method = 'poll'
+					self.stamps = dict()
+				changed.update(self.list_dir())
+				if self.watch == None:
+					return changed
+				continue
+			if name == '':
+				continue
+			if mask & (IN_CREATE | IN_MOVED_TO):
+				self.names.add(name)
+			elif mask & (IN_DELETE | IN_MOVED_FROM):
+				self.names.discard(name)
+			elif not self.track_changes:
+				continue
+			changed.add(name)
+		return changed
+
+	#Lists the directory again only if its modification time has changed (any file being added, removed or renamed changes it); with track_changes, also looks at each file for changes to its contents
+	def poll_stat(self):
+		if self.get_stamp(self.path) != self.dir_stamp:
+			return self.list_dir_changes()
+		changed = set()
+		if self.track_changes:
+			for name in self.names:
+				stamp = self.get_stamp(os.path.join(self.path, name))
+				if stamp != self.stamps.get(name):
+					self.stamps[name] = stamp
+					changed.add(name)
+		return changed
+
+	#As list_dir, but when the files are tracked, only reports those that are new, gone or changed
+	def list_dir_changes(self):
+		if not self.track_changes:
+			return self.list_dir()
+		old_stamps = self.stamps
+		self.list_dir()
+		return set([name for name in set(old_stamps.keys()).union(self.stamps.keys()) if old_stamps.get(name) != self.stamps.get(name)])
+
+	def close(self):
+		if self.watch != None:
+			self.watch.close()
+			self.watch = None
+		return None
+
+#Watches the tools, config and scripts directories of a pipeline directory structure (see pims_core.make_pipeline_dirs). poll() returns {'tools':names, 'config':names, 'scripts':names} with the names changed in each since the last poll; tool files are also reported when their contents change.
+class pipeline_watcher:
+	def __init__(self, pipeline_path, method=None):
+		self.dirs = {
+			'tools':dir_watcher(os.path.join(pipeline_path, 'tools'), True, method),
+			'config':dir_watcher(os.path.join(pipeline_path, 'config'), False, method),
+			'scripts':dir_watcher(os.path.join(pipeline_path, 'scripts'), False, method),
+		}
+
+	def poll(self):
+		return dict((kind, self.dirs[kind].poll()) for kind in self.dirs)
+
+	#Returns the names of the files in one of the directories that end in suffix (e.g. '.config'), without it, in alphabetical order
+	def file_names(self, kind, suffix):
+		return sorted([name[:-len(suffix)] for name in self.dirs[kind].names if name.endswith(suffix) and (len(name) > len(suffix))])
+
+	def close(self):
+		for kind in self.dirs:
+			self.dirs[kind].close()
+		return None
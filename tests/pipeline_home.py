@@ -0,0 +1,82 @@
+#This is part of the source code for the Pipeline Interface and Management System (PIMS). PIMS was created by Joseph Gardner, Dept. of Genetics, University of Cambridge, UK, and is licensed under the Creative Commons Attribution-ShareAlike 4.0 International (CC BY-SA 4.0) license. See pims_v0.1.py or https://github.com/jg600/PIMS for full licensing information.
+
+#Shared set-up for the tests, which build a ~/pipeline of small tools (made from standard programs such as cut and sort) in a temporary HOME, compile real scripts from it with pims_core and run them with pims_run. Run them from the top directory with either of:
+#	python -m pytest tests
+#	python -m unittest discover -s tests
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pims_core
+import pims_run
+
+class pipeline_home_case(unittest.TestCase):
+	def setUp(self):
+		self.old_home = os.environ.get('HOME')
+		self.home = tempfile.mkdtemp(prefix='pims_test_')
+		os.environ['HOME'] = self.home
+		pims_core.make_pipeline_dirs()
+		self.pipeline_path = pims_core.get_pipeline_path()
+		self.data_path = os.path.join(self.home, 'data')
+		os.makedirs(self.data_path)
+
+	def tearDown(self):
+		if self.old_home == None:
+			del os.environ['HOME']
+		else:
+			os.environ['HOME'] = self.old_home
+		shutil.rmtree(self.home, ignore_errors=True)
+
+	#Writes a .tool file. extra holds any optional fields (STDIN, SPLIT, etc.).
+	def add_tool(self, name, purpose, command, flags='', options='', arguments='', **extra):
+		tool_dict = {'NAME':name, 'PURPOSE':purpose, 'COMMAND':command, 'FLAGS':flags, 'OPTIONS':options, 'ARGUMENTS':arguments}
+		tool_dict.update(extra)
+		for field in pims_core.tool_fields:
+			tool_dict.setdefault(field, '')
+		tool_file = open(os.path.join(self.pipeline_path, 'tools', '%s.tool' % name), 'w')
+		tool_file.write(pims_core.format_tool_file(tool_dict))
+		tool_file.close()
+		return tool_dict
+
+	#Writes a config from (tool name, values) pairs, values being {'FLAGS':..., 'OPTIONS':..., 'ARGUMENTS':...} with any of the three left out. Every tool is active. Returns its path.
+	def add_config(self, name, tools):
+		registry = pims_core.tool_registry()
+		config_path = os.path.join(self.pipeline_path, 'config', '%s.config' % name)
+		config_file = open(config_path, 'w')
+		for tool_name, values in tools:
+			full_values = {'FLAGS':dict(), 'OPTIONS':dict(), 'ARGUMENTS':dict()}
+			full_values.update(values)
+			config_file.write(pims_core.format_config_line(tool_name, 'active', registry.get(tool_name), full_values))
+		config_file.close()
+		return config_path
+
+	#Writes a file in the data directory and returns its path
+	def add_data(self, name, text):
+		data_file_path = os.path.join(self.data_path, name)
+		data_file = open(data_file_path, 'w')
+		data_file.write(text)
+		data_file.close()
+		return data_file_path
+
+	#Compiles a script from a config, replacing any earlier script of the same name. Returns its path.
+	def compile(self, config_path, purposes, script_name, **options):
+		return pims_core.compile_config(config_path, purposes, script_name, overwrite=True, **options)
+
+	def read(self, path):
+		this_file = open(path, 'r')
+		text = this_file.read()
+		this_file.close()
+		return text
+
+	#Returns the command of every step that was run (not skipped or restored from the cache) in a run directory, from its profile file
+	def commands_run(self, run_dir):
+		profile_path = os.path.join(run_dir, pims_run.profile_name)
+		if not os.path.exists(profile_path):
+			return []
+		return [json.loads(line)['command'] for line in self.read(profile_path).splitlines() if line.strip() != '']
@@ -0,0 +1,112 @@
+#This is part of the source code for the Pipeline Interface and Management System (PIMS). PIMS was created by Joseph Gardner, Dept. of Genetics, University of Cambridge, UK, and is licensed under the Creative Commons Attribution-ShareAlike 4.0 International (CC BY-SA 4.0) license. See pims_v0.1.py or https://github.com/jg600/PIMS for full licensing information.
+
+#Tests of the output cache (pims_cache.output_cache): steps run before with the same command and input contents are restored rather than run, and the least recently used entries are removed to keep the store under its size limit.
+
+import os
+import stat
+import time
+import unittest
+
+from pipeline_home import pipeline_home_case
+import pims_cache
+import pims_run
+
+class cache_test(pipeline_home_case):
+	def setUp(self):
+		pipeline_home_case.setUp(self)
+		self.add_tool('trim', 'trim', 'cut', options='-c <>', arguments='in,out')
+		self.add_tool('top', 'top', 'head', options='-n <>', arguments='in,out')
+		self.add_tool('srt', 'sort', 'sort', flags='-r', arguments='in,out')
+		self.input_path = self.add_data('input.txt', 'alpha\nbravo\ncharlie\ndelta\necho\n')
+		self.cache_path = os.path.join(self.home, 'cache')
+
+	def make_script(self):
+		config_path = self.add_config('c', [('trim', {'OPTIONS':{'-c <>':'1-3'}, 'ARGUMENTS':{'in':self.input_path, 'out':'> t.txt'}}), ('top', {'OPTIONS':{'-n <>':'3'}, 'ARGUMENTS':{'in':'t.txt', 'out':'> h.txt'}}), ('srt', {'FLAGS':{'-r':'1'}, 'ARGUMENTS':{'in':'h.txt', 'out':'> s.txt'}})])
+		return self.compile(config_path, ['trim', 'top', 'sort'], 'cached')
+
+	def run_cached(self):
+		return pims_run.pipeline_run(self.make_script(), cache=pims_cache.output_cache(self.cache_path, reflink=False)).run()
+
+	def test_hit_restores_outputs(self):
+		first = self.run_cached()
+		self.assertEqual(first['cached_steps'], 0)
+		second = self.run_cached()
+		self.assertEqual(second['exit_code'], 0)
+		self.assertNotEqual(second['run_dir'], first['run_dir'])
+		self.assertEqual(second['cached_steps'], 3)
+		self.assertEqual(self.commands_run(second['run_dir']), [])
+		for output_name in ['t.txt', 'h.txt', 's.txt']:
+			self.assertEqual(self.read(os.path.join(second['run_dir'], output_name)), self.read(os.path.join(first['run_dir'], output_name)))
+
+	def test_changed_input_misses(self):
+		first = self.run_cached()
+		#Only the trim step reads the input, and its output is the same, so the steps after it are still restored
+		self.add_data('input.txt', 'alphabet\nbravo\ncharlie\ndelta\necho\n')
+		second = self.run_cached()
+		self.assertEqual(second['cached_steps'], 2)
+		self.assertEqual(len(self.commands_run(second['run_dir'])), 1)
+		self.add_data('input.txt', 'zulu\nyankee\nxray\n')
+		third = self.run_cached()
+		self.assertEqual(third['cached_steps'], 0)
+		self.assertEqual(self.read(os.path.join(third['run_dir'], 's.txt')), 'zul\nyan\nxra\n')
+
+	def test_outputs_named_later_are_copies(self):
+		self.run_cached()
+		second = self.run_cached()
+		#h.txt is read by the sort step, so it gets a writable copy; s.txt is named by no later step, so it shares the read-only cached file
+		restored = os.stat(os.path.join(second['run_dir'], 'h.txt'))
+		self.assertEqual(restored.st_nlink, 1)
+		self.assertTrue(restored.st_mode & stat.S_IWUSR)
+		linked = os.stat(os.path.join(second['run_dir'], 's.txt'))
+		self.assertEqual(linked.st_nlink, 2)
+		self.assertFalse(linked.st_mode & stat.S_IWUSR)
+
+	#Stores an entry holding one file of size bytes, as a step that made it would
+	def store_entry(self, cache, key, size):
+		run_dir = os.path.join(self.home, 'run_%s' % key)
+		os.makedirs(run_dir)
+		output_file = open(os.path.join(run_dir, 'out.txt'), 'w')
+		output_file.write('x'*size)
+		output_file.close()
+		cache.store(key, run_dir, {'out.txt':pims_run.file_stamp(os.path.join(run_dir, 'out.txt'))})
+		return run_dir
+
+	def set_last_used(self, cache, key, last_used):
+		os.utime(os.path.join(cache.entry_path(key), 'ENTRY'), (last_used, last_used))
+
+	def stored_size(self, cache):
+		return sum([size for last_used, size, key in cache.entries()])
+
+	def test_eviction_stays_under_max_size(self):
+		cache = pims_cache.output_cache(self.cache_path, max_size='3000', reflink=False)
+		now = time.time()
+		for i in range(6):
+			self.store_entry(cache, 'k%d' % i, 1000)
+			self.set_last_used(cache, 'k%d' % i, now-100+i)
+			self.assertTrue(self.stored_size(cache) <= cache.max_bytes)
+		self.assertEqual(sorted([key for last_used, size, key in cache.entries()]), ['k3', 'k4', 'k5'])
+
+	def test_eviction_removes_least_recently_used(self):
+		cache = pims_cache.output_cache(self.cache_path, max_size='2500', reflink=False)
+		now = time.time()
+		run_dir = self.store_entry(cache, 'old', 1000)
+		self.set_last_used(cache, 'old', now-100)
+		self.store_entry(cache, 'newer', 1000)
+		self.set_last_used(cache, 'newer', now-50)
+		#Using the oldest entry makes it the most recently used, so the next one stored pushes out the other
+		self.assertNotEqual(cache.restore('old', run_dir), None)
+		self.store_entry(cache, 'newest', 1000)
+		self.assertEqual(sorted([key for last_used, size, key in cache.entries()]), ['newest', 'old'])
+		self.assertEqual(cache.restore('newer', run_dir), None)
+
+	def test_lower_limit_applies_on_opening(self):
+		cache = pims_cache.output_cache(self.cache_path, max_size='10K', reflink=False)
+		for i in range(4):
+			self.store_entry(cache, 'k%d' % i, 1000)
+		self.assertEqual(len(cache.entries()), 4)
+		smaller = pims_cache.output_cache(self.cache_path, max_size='1500', reflink=False)
+		self.assertTrue(self.stored_size(smaller) <= smaller.max_bytes)
+		self.assertEqual(len(smaller.entries()), 1)
+
+if __name__ == '__main__':
+	unittest.main()
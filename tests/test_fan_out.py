@@ -0,0 +1,56 @@
+#This is part of the source code for the Pipeline Interface and Management System (PIMS). PIMS was created by Joseph Gardner, Dept. of Genetics, University of Cambridge, UK, and is licensed under the Creative Commons Attribution-ShareAlike 4.0 International (CC BY-SA 4.0) license. See pims_v0.1.py or https://github.com/jg600/PIMS for full licensing information.
+
+#Tests of fan-out (pims_core.fan_out_variants and branch_lines): a purpose with several active tools gives a branch for each, and the branches run, and fail, independently of each other.
+
+import os
+import unittest
+
+from pipeline_home import pipeline_home_case
+import pims_core
+import pims_run
+
+class fan_out_test(pipeline_home_case):
+	def setUp(self):
+		pipeline_home_case.setUp(self)
+		self.add_tool('bad', 'trim', 'cut', options='-c <>', arguments='in,out')
+		self.add_tool('trim', 'trim', 'cut', options='-c <>', arguments='in,out')
+		self.add_tool('srt', 'sort', 'sort', flags='-r', arguments='in,out')
+		self.input_path = self.add_data('input.txt', 'alpha\nbravo\ncharlie\n')
+		#The bad tool reads a file that is not there until a test writes it
+		self.missing_path = os.path.join(self.data_path, 'missing.txt')
+		self.config_path = self.add_config('c', [('bad', {'OPTIONS':{'-c <>':'1'}, 'ARGUMENTS':{'in':self.missing_path, 'out':'> t.txt'}}), ('trim', {'OPTIONS':{'-c <>':'1-2'}, 'ARGUMENTS':{'in':self.input_path, 'out':'> t.txt'}}), ('srt', {'FLAGS':{'-r':'1'}, 'ARGUMENTS':{'in':'t.txt', 'out':'> s.txt'}})])
+
+	def test_fan_out_variants(self):
+		steps = pims_core.config_steps(pims_core.read_config(self.config_path), ['trim', 'sort'], pims_core.tool_registry())
+		variants = pims_core.fan_out_variants(steps)
+		self.assertEqual([choices for choices, variant_steps in variants], [[(0, 'trim', None, 'bad')], [(0, 'trim', None, 'trim')]])
+		for choices, variant_steps in variants:
+			self.assertEqual([len(purpose_steps) for purpose_steps in variant_steps], [1, 1])
+
+	def test_branches_fail_independently(self):
+		script_path = self.compile(self.config_path, ['trim', 'sort'], 'fan', fan_out=True)
+		step_lines = pims_core.parse_script(script_path)[3]
+		result = pims_run.pipeline_run(script_path, resources=pims_run.resource_pool(2)).run()
+		self.assertNotEqual(result['exit_code'], 0)
+		#The run fails at the bad branch's cut, which stops the sort after it, but the trim branch runs to the end
+		self.assertEqual(pims_core.split_branch_line(step_lines[result['failed_step']-1]), ('bad', 'cut -c 1 %s > t.txt ' % self.missing_path))
+		self.assertFalse(os.path.exists(os.path.join(result['run_dir'], 'bad', 's.txt')))
+		self.assertEqual(self.read(os.path.join(result['run_dir'], 'trim', 's.txt')), 'ch\nbr\nal\n')
+		self.assertEqual(self.read(os.path.join(result['run_dir'], 'trim', 'PARAMS')), 'trim trim\n')
+		#A failed run keeps its script, so that it can be run again
+		self.assertTrue(os.path.exists(script_path))
+
+	def test_rerun_only_failed_branch(self):
+		script_path = self.compile(self.config_path, ['trim', 'sort'], 'fan', fan_out=True)
+		first = pims_run.pipeline_run(script_path).run()
+		self.assertNotEqual(first['exit_code'], 0)
+		self.add_data('missing.txt', 'xray\nyankee\n')
+		second = pims_run.pipeline_run(script_path, incremental=True).run()
+		self.assertEqual(second['exit_code'], 0)
+		self.assertEqual(second['run_dir'], first['run_dir'])
+		#The line making the branch directories and the trim branch are up to date; only the bad branch is run again
+		self.assertEqual(second['skipped_steps'], 3)
+		self.assertEqual(self.read(os.path.join(second['run_dir'], 'bad', 's.txt')), 'y\nx\n')
+
+if __name__ == '__main__':
+	unittest.main()
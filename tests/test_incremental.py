@@ -0,0 +1,65 @@
+#This is part of the source code for the Pipeline Interface and Management System (PIMS). PIMS was created by Joseph Gardner, Dept. of Genetics, University of Cambridge, UK, and is licensed under the Creative Commons Attribution-ShareAlike 4.0 International (CC BY-SA 4.0) license. See pims_v0.1.py or https://github.com/jg600/PIMS for full licensing information.
+
+#Tests of incremental runs (pims_run.pipeline_run with incremental set): steps that are up to date are skipped, and every step from the first one that is not is run again.
+
+import os
+import unittest
+
+from pipeline_home import pipeline_home_case
+import pims_run
+
+class incremental_test(pipeline_home_case):
+	def setUp(self):
+		pipeline_home_case.setUp(self)
+		self.add_tool('trim', 'trim', 'cut', options='-c <>', arguments='in,out')
+		self.add_tool('top', 'top', 'head', options='-n <>', arguments='in,out')
+		self.add_tool('srt', 'sort', 'sort', flags='-r', arguments='in,out')
+		self.purposes = ['trim', 'top', 'sort']
+		self.input_path = self.add_data('input.txt', 'alpha\nbravo\ncharlie\ndelta\necho\n')
+
+	def make_script(self, lines=3):
+		config_path = self.add_config('c', [('trim', {'OPTIONS':{'-c <>':'1-3'}, 'ARGUMENTS':{'in':self.input_path, 'out':'> t.txt'}}), ('top', {'OPTIONS':{'-n <>':str(lines)}, 'ARGUMENTS':{'in':'t.txt', 'out':'> h.txt'}}), ('srt', {'FLAGS':{'-r':'1'}, 'ARGUMENTS':{'in':'h.txt', 'out':'> s.txt'}})])
+		return self.compile(config_path, self.purposes, 'inc')
+
+	def test_unchanged_steps_are_skipped(self):
+		first = pims_run.pipeline_run(self.make_script()).run()
+		self.assertEqual(first['exit_code'], 0)
+		self.assertEqual(len(self.commands_run(first['run_dir'])), 3)
+		second = pims_run.pipeline_run(self.make_script(), incremental=True).run()
+		self.assertEqual(second['exit_code'], 0)
+		self.assertEqual(second['run_dir'], first['run_dir'])
+		self.assertEqual(second['skipped_steps'], 3)
+		self.assertEqual(len(self.commands_run(second['run_dir'])), 3)
+
+	def test_reruns_from_first_changed_option(self):
+		first = pims_run.pipeline_run(self.make_script(3)).run()
+		trim_stamp = pims_run.file_stamp(os.path.join(first['run_dir'], 't.txt'))
+		second = pims_run.pipeline_run(self.make_script(2), incremental=True).run()
+		self.assertEqual(second['exit_code'], 0)
+		self.assertEqual(second['run_dir'], first['run_dir'])
+		#The trim step is up to date, so is skipped and its output left alone; head has a new option, so it and the sort after it (which has not changed itself) are run again
+		self.assertEqual(second['skipped_steps'], 1)
+		self.assertEqual(pims_run.file_stamp(os.path.join(second['run_dir'], 't.txt')), trim_stamp)
+		rerun = self.commands_run(second['run_dir'])[3:]
+		self.assertEqual(len(rerun), 2)
+		self.assertTrue(rerun[0].startswith('head -n 2'))
+		self.assertTrue(rerun[1].startswith('sort -r'))
+		self.assertEqual(self.read(os.path.join(second['run_dir'], 's.txt')), 'bra\nalp\n')
+
+	def test_changed_input_reruns_everything(self):
+		first = pims_run.pipeline_run(self.make_script()).run()
+		self.add_data('input.txt', 'zulu\nyankee\nxray\nwhiskey\n')
+		second = pims_run.pipeline_run(self.make_script(), incremental=True).run()
+		self.assertEqual(second['run_dir'], first['run_dir'])
+		self.assertEqual(second['skipped_steps'], 0)
+		self.assertEqual(self.read(os.path.join(second['run_dir'], 's.txt')), 'zul\nyan\nxra\n')
+
+	def test_removed_output_reruns_its_step(self):
+		first = pims_run.pipeline_run(self.make_script()).run()
+		os.remove(os.path.join(first['run_dir'], 'h.txt'))
+		second = pims_run.pipeline_run(self.make_script(), incremental=True).run()
+		self.assertEqual(second['skipped_steps'], 1)
+		self.assertTrue(os.path.exists(os.path.join(second['run_dir'], 'h.txt')))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,81 @@
+#This is part of the source code for the Pipeline Interface and Management System (PIMS). PIMS was created by Joseph Gardner, Dept. of Genetics, University of Cambridge, UK, and is licensed under the Creative Commons Attribution-ShareAlike 4.0 International (CC BY-SA 4.0) license. See pims_v0.1.py or https://github.com/jg600/PIMS for full licensing information.
+
+#Tests of scatter-gather (pims_core.scatter_command): a tool that declares SPLIT and MERGE is run on chunks of its input at once, and the chunk outputs are merged back into the output the tool would have written on its own.
+
+import gzip
+import os
+import unittest
+
+from pipeline_home import pipeline_home_case
+import pims_core
+import pims_run
+
+class scatter_test(pipeline_home_case):
+	def setUp(self):
+		pipeline_home_case.setUp(self)
+		self.old_chunks = os.environ.get(pims_core.chunk_variable)
+		os.environ[pims_core.chunk_variable] = '3'
+		self.lines = ['line%02d_%s' % (i, 'xyz'[i%3]*(i%5+1)) for i in range(10)]
+		self.input_path = self.add_data('input.txt', ''.join([line+'\n' for line in self.lines]))
+
+	def tearDown(self):
+		if self.old_chunks == None:
+			del os.environ[pims_core.chunk_variable]
+		else:
+			os.environ[pims_core.chunk_variable] = self.old_chunks
+		pipeline_home_case.tearDown(self)
+
+	#Compiles and runs a pipeline of one tool, which reads in and writes out. Returns the text of the output and the run directory.
+	def run_tool(self, tool_name, values, script_name):
+		config_path = self.add_config(script_name, [(tool_name, values)])
+		purposes = [pims_core.tool_registry().get(tool_name)['PURPOSE']]
+		result = pims_run.pipeline_run(self.compile(config_path, purposes, script_name)).run()
+		self.assertEqual(result['exit_code'], 0)
+		return self.read(os.path.join(result['run_dir'], 'out.txt')), result['run_dir']
+
+	def test_split_lines_rebuilds_output(self):
+		self.add_tool('trim', 'trim', 'cut', options='-c <>', arguments='in,out')
+		self.add_tool('ptrim', 'ptrim', 'cut', options='-c <>', arguments='in,out', SPLIT='in', MERGE='out')
+		values = {'OPTIONS':{'-c <>':'5-8'}, 'ARGUMENTS':{'in':self.input_path, 'out':'> out.txt'}}
+		whole, whole_dir = self.run_tool('trim', values, 'whole')
+		scattered, scattered_dir = self.run_tool('ptrim', values, 'scattered')
+		self.assertEqual(scattered, whole)
+		self.assertEqual(scattered, ''.join([line[4:8]+'\n' for line in self.lines]))
+		self.assertEqual(len(self.commands_run(scattered_dir)), 1)
+		self.assertTrue(self.commands_run(scattered_dir)[0].startswith('set -o pipefail; '))
+		#The chunks are removed once merged
+		self.assertFalse(os.path.exists(os.path.join(scattered_dir, 'ptrim.chunks')))
+
+	def test_split_records_keeps_them_whole(self):
+		#Four line records, as in a FASTQ file: only the first line of each is kept, which only works if no record is split between chunks
+		self.add_tool('heads', 'heads', 'awk NR%4==1', arguments='in,out', SPLIT='in', MERGE='out', SPLIT_BY='lines:4')
+		records = ['@read%d\nACGT\n+\nIIII\n' % i for i in range(5)]
+		input_path = self.add_data('reads.fq', ''.join(records))
+		output, run_dir = self.run_tool('heads', {'ARGUMENTS':{'in':input_path, 'out':'> out.txt'}}, 'records')
+		self.assertEqual(output, ''.join(['@read%d\n' % i for i in range(5)]))
+
+	def test_gzipped_input_is_split_after_decompressing(self):
+		self.add_tool('ptrim', 'ptrim', 'cut', options='-c <>', arguments='in,out', SPLIT='in', MERGE='out')
+		input_path = os.path.join(self.data_path, 'input.txt.gz')
+		gzip_file = gzip.open(input_path, 'wb')
+		gzip_file.write(''.join([line+'\n' for line in self.lines]).encode('utf-8'))
+		gzip_file.close()
+		output, run_dir = self.run_tool('ptrim', {'OPTIONS':{'-c <>':'1-6'}, 'ARGUMENTS':{'in':input_path, 'out':'> out.txt'}}, 'gzipped')
+		self.assertEqual(output, ''.join([line[:6]+'\n' for line in self.lines]))
+
+	def test_merge_command(self):
+		#Each chunk is sorted on its own and the sorted chunks merged, which gives the same as sorting the whole input
+		self.add_tool('psrt', 'sort', 'sort', arguments='in,out', SPLIT='in', MERGE='out', MERGE_BY='sort -m -o')
+		output, run_dir = self.run_tool('psrt', {'ARGUMENTS':{'in':self.input_path, 'out':'-o out.txt'}}, 'merged')
+		self.assertEqual(output, ''.join([line+'\n' for line in sorted(self.lines)]))
+
+	def test_failed_chunk_fails_step(self):
+		self.add_tool('pgrep', 'grep', 'grep -q', options='-e <>', arguments='in', SPLIT='in')
+		config_path = self.add_config('failing', [('pgrep', {'OPTIONS':{'-e <>':'line00'}, 'ARGUMENTS':{'in':self.input_path}})])
+		result = pims_run.pipeline_run(self.compile(config_path, ['grep'], 'failing')).run()
+		#grep finds nothing in the later chunks, so the step fails and its chunks are kept for inspection
+		self.assertNotEqual(result['exit_code'], 0)
+		self.assertEqual(len(os.listdir(os.path.join(result['run_dir'], 'pgrep.chunks'))), 3)
+
+if __name__ == '__main__':
+	unittest.main()
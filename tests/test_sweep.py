@@ -0,0 +1,64 @@
+#This is part of the source code for the Pipeline Interface and Management System (PIMS). PIMS was created by Joseph Gardner, Dept. of Genetics, University of Cambridge, UK, and is licensed under the Creative Commons Attribution-ShareAlike 4.0 International (CC BY-SA 4.0) license. See pims_v0.1.py or https://github.com/jg600/PIMS for full licensing information.
+
+#Tests of parameter sweeps (pims_core.sweep_values and branch_lines): every combination of the swept values is run, and steps shared by several combinations are run once for all of them.
+
+import glob
+import os
+import unittest
+
+from pipeline_home import pipeline_home_case
+import pims_core
+import pims_run
+
+class sweep_test(pipeline_home_case):
+	def setUp(self):
+		pipeline_home_case.setUp(self)
+		self.add_tool('srt', 'sort', 'sort', arguments='in,out')
+		self.add_tool('trim', 'trim', 'cut', options='-c <>', arguments='in,out')
+		self.add_tool('top', 'top', 'head', options='-n <>', arguments='in,out')
+		self.input_path = self.add_data('input.txt', 'charlie\nalpha\nbravo\n')
+
+	def test_sweep_values(self):
+		self.assertEqual(pims_core.sweep_values('5'), ['5'])
+		self.assertEqual(pims_core.sweep_values('{5,10,20}'), ['5', '10', '20'])
+		self.assertEqual(pims_core.sweep_values('{10..30..10}'), ['10', '20', '30'])
+		self.assertEqual(pims_core.sweep_values('{0.5..1.5}'), ['0.5', '1.5'])
+		self.assertEqual(pims_core.sweep_values('reads_{1..2}_{a,b}.fq'), ['reads_1_a.fq', 'reads_1_b.fq', 'reads_2_a.fq', 'reads_2_b.fq'])
+		#Shell variables are left alone
+		self.assertEqual(pims_core.sweep_values('${PIMS_THREADS:-4}'), ['${PIMS_THREADS:-4}'])
+
+	def test_shared_prefix_runs_once(self):
+		config_path = self.add_config('c', [('srt', {'ARGUMENTS':{'in':self.input_path, 'out':'> sorted.txt'}}), ('trim', {'OPTIONS':{'-c <>':'1-{1..3}'}, 'ARGUMENTS':{'in':'sorted.txt', 'out':'> t.txt'}}), ('top', {'OPTIONS':{'-n <>':'{1,2}'}, 'ARGUMENTS':{'in':'t.txt', 'out':'> h.txt'}})])
+		result = pims_run.pipeline_run(self.compile(config_path, ['sort', 'trim', 'top'], 'swp', sweep=True)).run()
+		self.assertEqual(result['exit_code'], 0)
+		commands = [pims_core.split_branch_line(command)[1] for command in self.commands_run(result['run_dir'])]
+		#The sort is shared by all six combinations, and each cut by the two that differ only in head's value
+		self.assertEqual(len([command for command in commands if command.startswith('sort ')]), 1)
+		self.assertEqual(len([command for command in commands if command.startswith('cut ')]), 3)
+		self.assertEqual(len([command for command in commands if command.startswith('head ')]), 6)
+		outputs = dict()
+		for output_path in glob.glob(os.path.join(result['run_dir'], '*', '*', 'h.txt')):
+			outputs[os.path.relpath(output_path, result['run_dir'])] = self.read(output_path)
+		self.assertEqual(len(outputs), 6)
+		self.assertEqual(outputs[os.path.join('trim.c=1-2', 'top.n=2', 'h.txt')], 'al\nbr\n')
+		self.assertEqual(outputs[os.path.join('trim.c=1-3', 'top.n=1', 'h.txt')], 'alp\n')
+		#Each branch works on links to the files made before it, and lists its values in PARAMS
+		self.assertTrue(os.path.islink(os.path.join(result['run_dir'], 'trim.c=1-1', 'sorted.txt')))
+		self.assertEqual(self.read(os.path.join(result['run_dir'], 'trim.c=1-1', 'top.n=2', 'PARAMS')), 'trim -c 1-1\ntop -n 2\n')
+
+	def test_incremental_sweep_reruns_changed_branches(self):
+		config_path = self.add_config('c', [('srt', {'ARGUMENTS':{'in':self.input_path, 'out':'> sorted.txt'}}), ('trim', {'OPTIONS':{'-c <>':'1-{1,2}'}, 'ARGUMENTS':{'in':'sorted.txt', 'out':'> t.txt'}})])
+		first = pims_run.pipeline_run(self.compile(config_path, ['sort', 'trim'], 'swp', sweep=True)).run()
+		config_path = self.add_config('c', [('srt', {'ARGUMENTS':{'in':self.input_path, 'out':'> sorted.txt'}}), ('trim', {'OPTIONS':{'-c <>':'1-{1,3}'}, 'ARGUMENTS':{'in':'sorted.txt', 'out':'> t.txt'}})])
+		second = pims_run.pipeline_run(self.compile(config_path, ['sort', 'trim'], 'swp', sweep=True), incremental=True).run()
+		self.assertEqual(second['run_dir'], first['run_dir'])
+		self.assertEqual(second['exit_code'], 0)
+		#The sort is skipped; the line making the branch directories has changed, so it and both branches after it are run again
+		rerun = [pims_core.split_branch_line(command)[1] for command in self.commands_run(second['run_dir'])[4:]]
+		self.assertEqual(second['skipped_steps'], 1)
+		self.assertEqual(len(rerun), 3)
+		self.assertFalse(any([command.startswith('sort ') for command in rerun]))
+		self.assertEqual(self.read(os.path.join(second['run_dir'], 'trim.c=1-3', 't.txt')), 'alp\nbra\ncha\n')
+
+if __name__ == '__main__':
+	unittest.main()